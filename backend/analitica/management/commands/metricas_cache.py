@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.metricas_cache import leer_metricas_cache, reiniciar_metricas_cache
+
+
+class Command(BaseCommand):
+    help = (
+        'Muestra las métricas del cache por familia de claves (hits, misses, sets, '
+        'deletes, bytes y tiempo de reconstrucción tras un miss)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Imprimir las métricas en JSON'
+        )
+        parser.add_argument(
+            '--reiniciar',
+            action='store_true',
+            help='Poner los contadores en cero después de mostrarlos'
+        )
+
+    def handle(self, *args, **options):
+        metricas = leer_metricas_cache()
+
+        if options['json']:
+            self.stdout.write(json.dumps(metricas, indent=2, sort_keys=True))
+        elif not metricas:
+            self.stdout.write('Sin métricas registradas (¿el cache default es core.metricas_cache.MedicionCache?)')
+        else:
+            self.stdout.write(
+                f"{'familia':<32} {'hits':>10} {'misses':>10} {'ratio':>7} {'sets':>8} "
+                f"{'deletes':>8} {'bytes/set':>10} {'rebuild ms':>11}"
+            )
+            for familia, fila in sorted(metricas.items(), key=lambda item: -(item[1]['hits'] + item[1]['misses'])):
+                ratio = f"{fila['hit_ratio']:.1%}" if fila['hit_ratio'] is not None else '-'
+                bytes_set = fila['bytes_promedio'] if fila['bytes_promedio'] is not None else '-'
+                rebuild = fila['reconstruccion_ms_promedio'] if fila['reconstruccion_ms_promedio'] is not None else '-'
+                self.stdout.write(
+                    f"{familia:<32} {fila['hits']:>10} {fila['misses']:>10} {ratio:>7} {fila['sets']:>8} "
+                    f"{fila['deletes']:>8} {bytes_set:>10} {rebuild:>11}"
+                )
+
+        if options['reiniciar']:
+            reiniciar_metricas_cache()
+            self.stdout.write(self.style.SUCCESS('Métricas reiniciadas'))
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Epresa, Unidadnegocio, Proyecto, Centroop
+from .utils import invalidar_catalogo_organizacion
 
 # --- Empresa ---
 class EpresaSerializer(serializers.ModelSerializer):
@@ -196,6 +197,7 @@ class CargarEstructuraSerializer(serializers.Serializer):
                         defaults={"estadocentrop": 1}
                     )
 
+        invalidar_catalogo_organizacion()
         return {"status": "ok", "empresa": empresa_nombre}
 
 
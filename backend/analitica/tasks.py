@@ -4,8 +4,10 @@ from django.db.models import Avg
 from decimal import Decimal
 from datetime import datetime
 from calendar import monthrange
-from analitica.models import Epresa, Unidadnegocio, Proyecto, Centroop, ProgresoAgregado
+from analitica.models import Epresa, Unidadnegocio, Proyecto, Centroop
+from analitica.utils import marcar_progreso_empresarial_obsoleto, refrescar_progreso_empresarial
 from capacitaciones.models import progresoCapacitaciones
+from capacitaciones.tasks import programar_calentamiento
 from usuarios.models import Colaboradores
 
 
@@ -16,6 +18,10 @@ def calcular_progreso_empresarial_diario():
     Se ejecuta diariamente a las 00:00 para actualizar el modelo desnormalizado.
     """
     try:
+        # ProgresoAgregado ya no está en analitica.models: se importa aquí para que
+        # el módulo (y las demás tareas) cargue aunque esta tarea falle
+        from analitica.models import ProgresoAgregado
+
         for empresa in Epresa.objects.all():
             unidad_promedios = []
             
@@ -103,8 +109,12 @@ def calcular_progreso_empresarial_diario():
                 defaults={'promedio_total': Decimal(str(empresa_porcentaje))}
             )
 
-        # Invalidar el caché después de actualizar
-        cache.delete('progreso_empresarial')
+        # Vencer el árbol cacheado y recalcularlo aquí: los requests siguen
+        # recibiendo el valor anterior mientras tanto (sin estampida)
+        marcar_progreso_empresarial_obsoleto()
+        refrescar_progreso_empresarial()
+        # Y los listados de capacitaciones de los colaboradores más activos
+        programar_calentamiento()
         
         return {
             'status': 'success',
@@ -126,6 +136,8 @@ def calcular_progreso_empresarial_mensual(mes=None, anio=None):
     Si no se especifica mes/año, calcula para el mes actual.
     """
     try:
+        from analitica.models import ProgresoAgregado
+
         # Si no se especifica, usar mes y año actual
         if mes is None or anio is None:
             now = datetime.now()
@@ -250,3 +262,18 @@ def calcular_progreso_empresarial_mensual(mes=None, anio=None):
             'status': 'error',
             'message': f'Error al calcular progreso mensual: {str(e)}'
         }
+
+
+@shared_task
+def refrescar_progreso_empresarial_cache():
+    """
+    Recalcula el árbol de ProgresoEmpresarialView antes de que venza su cache,
+    así los requests casi nunca lo encuentran vencido. Usa el mismo lock que la
+    vista: si ya hay un recálculo en curso no hace nada.
+    """
+    try:
+        if not refrescar_progreso_empresarial():
+            return {'status': 'skipped', 'message': 'Recálculo en curso en otro proceso'}
+        return {'status': 'success', 'message': 'Progreso empresarial recalculado en cache'}
+    except Exception as e:
+        return {'status': 'error', 'message': f'Error al recalcular progreso: {str(e)}'}
@@ -0,0 +1,106 @@
+import json
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestProgresoEmpresarialCache(SimpleTestCase):
+    """Stale-while-revalidate del árbol de ProgresoEmpresarialView (sin BD)"""
+
+    def setUp(self):
+        cache.clear()
+
+    @patch('analitica.utils.construir_progreso_empresarial')
+    def test_valor_vencido_se_sirve_mientras_otro_recalcula(self, construir):
+        """Con el lock tomado por otro proceso se responde el valor anterior sin recalcular"""
+        from analitica.utils import (
+            PROGRESO_EMPRESARIAL_LOCK, marcar_progreso_empresarial_obsoleto,
+            obtener_progreso_empresarial
+        )
+
+        def obtener():
+            respuesta, estado = obtener_progreso_empresarial()
+            return json.loads(respuesta['cuerpo']), estado
+
+        construir.return_value = [{'empresa': 'A'}]
+        self.assertEqual(obtener(), ([{'empresa': 'A'}], 'MISS'))
+        self.assertEqual(obtener()[1], 'HIT')
+
+        marcar_progreso_empresarial_obsoleto()
+        cache.add(PROGRESO_EMPRESARIAL_LOCK, True, 60)
+        construir.return_value = [{'empresa': 'B'}]
+
+        self.assertEqual(obtener(), ([{'empresa': 'A'}], 'STALE'))
+        self.assertEqual(construir.call_count, 1)
+
+        cache.delete(PROGRESO_EMPRESARIAL_LOCK)
+        self.assertEqual(obtener(), ([{'empresa': 'B'}], 'MISS'))
+        self.assertEqual(construir.call_count, 2)
+
+    @patch('analitica.utils.construir_progreso_empresarial')
+    def test_lock_ajeno_no_se_libera(self, construir):
+        """Si el recálculo pasó el TTL y otro proceso tomó el lock, no se le borra"""
+        from analitica.utils import PROGRESO_EMPRESARIAL_LOCK, refrescar_progreso_empresarial
+
+        def recalculo_lento():
+            # El lock venció durante el recálculo y otro proceso lo tomó
+            cache.set(PROGRESO_EMPRESARIAL_LOCK, 'otro-proceso', 60)
+            return []
+
+        construir.side_effect = recalculo_lento
+        self.assertTrue(refrescar_progreso_empresarial())
+        self.assertEqual(cache.get(PROGRESO_EMPRESARIAL_LOCK), 'otro-proceso')
+
+    @patch('analitica.utils.construir_progreso_empresarial', return_value=[])
+    def test_tarea_de_refresco(self, construir):
+        """La tarea periódica carga y no recalcula si hay un recálculo en curso"""
+        from analitica.tasks import refrescar_progreso_empresarial_cache
+        from analitica.utils import PROGRESO_EMPRESARIAL_LOCK
+
+        self.assertEqual(refrescar_progreso_empresarial_cache()['status'], 'success')
+        cache.add(PROGRESO_EMPRESARIAL_LOCK, 'otro-proceso', 60)
+        self.assertEqual(refrescar_progreso_empresarial_cache()['status'], 'skipped')
+        self.assertEqual(construir.call_count, 1)
+
+
+class TestLockProgresoEmpresarialRedis(SimpleTestCase):
+    """Lock de recálculo sobre Redis: SET NX y borrado condicionado atómico (fakeredis)"""
+
+    def setUp(self):
+        try:
+            import fakeredis
+        except ImportError:
+            self.skipTest('fakeredis no instalado')
+        ajustes = override_settings(CACHES={
+            'default': {'BACKEND': 'django_redis.cache.RedisCache', 'LOCATION': 'redis://tests-fake:6379/3',
+                        'OPTIONS': {'CONNECTION_POOL_KWARGS': {'connection_class': fakeredis.FakeConnection}}},
+        })
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        cache.clear()
+
+    @patch('analitica.utils.construir_progreso_empresarial', return_value=[])
+    def test_lock_propio_se_libera_y_el_ajeno_bloquea(self, construir):
+        from analitica.utils import PROGRESO_EMPRESARIAL_LOCK, refrescar_progreso_empresarial
+
+        self.assertTrue(refrescar_progreso_empresarial())
+        self.assertIsNone(cache.get(PROGRESO_EMPRESARIAL_LOCK))
+
+        # Tomado por otro proceso con cache.add: es la misma clave en Redis
+        cache.add(PROGRESO_EMPRESARIAL_LOCK, 'otro-proceso', 60)
+        self.assertFalse(refrescar_progreso_empresarial())
+        self.assertEqual(construir.call_count, 1)
+
+    @patch('analitica.utils.construir_progreso_empresarial')
+    def test_lock_ajeno_no_se_libera(self, construir):
+        from analitica.utils import PROGRESO_EMPRESARIAL_LOCK, refrescar_progreso_empresarial
+
+        def recalculo_lento():
+            cache.set(PROGRESO_EMPRESARIAL_LOCK, 'otro-proceso', 60)
+            return []
+
+        construir.side_effect = recalculo_lento
+        self.assertTrue(refrescar_progreso_empresarial())
+        self.assertEqual(cache.get(PROGRESO_EMPRESARIAL_LOCK), 'otro-proceso')
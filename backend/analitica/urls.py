@@ -5,6 +5,7 @@ urlpatterns = [
     # Analítica
     path('progreso/', views.ProgresoEmpresarialView.as_view(), name='progreso_empresa'),
     path('progreso-filtrado/', views.ProgresoEmpresarialFiltradoView.as_view(), name='progreso_empresa_filtro'),
+    path('cache/metricas/', views.MetricasCacheView.as_view(), name='metricas_cache'),
     
     # Empresa (legacy aliases) 
     path('empresa/', views.EmpresaCreateView.as_view(), name='crear_empresa'),
@@ -0,0 +1,401 @@
+import time
+import unicodedata
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.db.models import Avg, Q
+
+from core.cache import cliente_redis, liberar_lock_redis
+from core.respuestas import renderizar_respuesta
+from examenes.models import Examen
+from usuarios.models import Cargo
+from usuarios.utils import invalidar_usuarios_organizacion
+
+from .models import Centroop, Epresa, Proyecto, Unidadnegocio
+
+
+# ==================== CATÁLOGO DE ORGANIZACIÓN ====================
+# Empresas, unidades, proyectos, centros, cargos y exámenes activos casi no
+# cambian, pero la carga masiva de correos, la estructura geográfica, el
+# progreso empresarial y el script de carga de colaboradores los recorren
+# completos. Se guardan versionados en el cache compartido y se replican en
+# memoria del proceso (como el catálogo de estructura de capacitaciones), con
+# índices por nombre normalizado. Cada lectura sólo consulta el token de versión.
+#
+# La versión se renueva al escribir desde las vistas CRUD de analítica o
+# CargarEstructuraSerializer. Cargos y exámenes no tienen vistas de escritura:
+# el TTL acota cuánto tarda en verse un cambio hecho directo en la BD.
+CATALOGO_ORGANIZACION_PREFIX = 'catalogo_organizacion'
+CATALOGO_ORGANIZACION_VERSION = f'{CATALOGO_ORGANIZACION_PREFIX}:version'
+# Respuestas cacheadas que se arman con la jerarquía (CargoEmpresaConExamenesView)
+CACHES_DERIVADOS_CATALOGO = ('cargo_empresa_examenes_data',)
+_catalogo_local = {}  # {'version': ..., 'catalogo': ...}
+
+
+def _ttl_catalogo_organizacion():
+    return getattr(settings, 'CACHE_TTL_CATALOGO_ORGANIZACION', 60 * 10)
+
+
+def normalizar_nombre(nombre):
+    """Nombre comparable: sin tildes, sin mayúsculas y con los espacios colapsados"""
+    if nombre is None:
+        return ''
+    descompuesto = unicodedata.normalize('NFKD', str(nombre))
+    sin_tildes = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_tildes.casefold().split())
+
+
+def _indexar(instancias, nombre, padre=None):
+    """{(nombre normalizado, id del padre): pk}; ante nombres repetidos gana el pk menor"""
+    indice = {}
+    for instancia in sorted(instancias, key=lambda i: i.pk):
+        clave = (
+            normalizar_nombre(getattr(instancia, nombre)),
+            getattr(instancia, padre) if padre else None,
+        )
+        indice.setdefault(clave, instancia.pk)
+    return indice
+
+
+def _enlazar(instancias, campo, destinos):
+    """Deja cacheada la FK `campo` con la instancia del catálogo (None si no existe)"""
+    for instancia in instancias:
+        relacion = instancia._meta.get_field(campo)
+        relacion.set_cached_value(instancia, destinos.get(getattr(instancia, relacion.attname)))
+
+
+def _construir_catalogo(version):
+    """Carga la jerarquía y las tablas de consulta en 6 queries"""
+    empresas = {e.idempresa: e for e in Epresa.objects.order_by('idempresa')}
+    unidades = {u.idunidad: u for u in Unidadnegocio.objects.order_by('idunidad')}
+    proyectos = {p.idproyecto: p for p in Proyecto.objects.order_by('idproyecto')}
+    # Centros en el orden por nombre de la BD (misma collation que order_by)
+    centros = {c.idcentrop: c for c in Centroop.objects.order_by('nombrecentrop', 'idcentrop')}
+    cargos = {c.idcargo: c for c in Cargo.objects.order_by('idcargo')}
+    examenes = {e.id_examen: e for e in Examen.objects.filter(activo=True).order_by('id_examen')}
+
+    # Recorrer centro → proyecto → unidad → empresa no vuelve a la BD
+    _enlazar(unidades.values(), 'id_empresa', empresas)
+    _enlazar(proyectos.values(), 'id_unidad', unidades)
+    _enlazar(centros.values(), 'id_proyecto', proyectos)
+
+    return {
+        'version': version,
+        'empresas': empresas,
+        'unidades': unidades,
+        'proyectos': proyectos,
+        'centros': centros,
+        'cargos': cargos,
+        'examenes': examenes,
+        'indices': {
+            'empresas': _indexar(empresas.values(), 'nombre_empresa'),
+            'unidades': _indexar(unidades.values(), 'nombreunidad', 'id_empresa_id'),
+            'proyectos': _indexar(proyectos.values(), 'nombreproyecto', 'id_unidad_id'),
+            'centros': _indexar(centros.values(), 'nombrecentrop', 'id_proyecto_id'),
+            'cargos': _indexar(cargos.values(), 'nombrecargo'),
+            'examenes': _indexar(examenes.values(), 'nombre'),
+        },
+    }
+
+
+def version_catalogo_organizacion():
+    """Token de versión vigente del catálogo (se crea si no existe)"""
+    version = cache.get(CATALOGO_ORGANIZACION_VERSION)
+    if version is None:
+        cache.add(CATALOGO_ORGANIZACION_VERSION, uuid.uuid4().hex, _ttl_catalogo_organizacion())
+        version = cache.get(CATALOGO_ORGANIZACION_VERSION)
+    return version
+
+
+def obtener_catalogo_organizacion():
+    """
+    Catálogo de organización desde memoria del proceso, cache compartido o BD
+    (en ese orden). El resultado es compartido: no debe modificarse.
+
+    - empresas, unidades, proyectos, centros, cargos y examenes (sólo activos):
+      {pk: instancia}, con las FK de la jerarquía ya resueltas.
+    - indices: {tipo: {(nombre normalizado, id del padre o None): pk}};
+      usar buscar_en_catalogo.
+    """
+    version = version_catalogo_organizacion()
+    if version is None:
+        # Backend de cache sin persistencia (DummyCache): siempre desde BD
+        return _construir_catalogo(None)
+
+    if _catalogo_local.get('version') == version:
+        return _catalogo_local['catalogo']
+
+    clave = f'{CATALOGO_ORGANIZACION_PREFIX}:{version}'
+    catalogo = cache.get(clave)
+    if catalogo is None:
+        catalogo = _construir_catalogo(version)
+        cache.set(clave, catalogo, _ttl_catalogo_organizacion())
+
+    _catalogo_local.update(version=version, catalogo=catalogo)
+    return catalogo
+
+
+def buscar_en_catalogo(catalogo, tipo, nombre, padre_id=None):
+    """
+    Instancia de `tipo` ('empresas', 'unidades', 'proyectos', 'centros',
+    'cargos' o 'examenes') con ese nombre, sin distinguir tildes ni mayúsculas.
+    Unidades, proyectos y centros se buscan dentro de su padre (`padre_id`).
+    """
+    pk = catalogo['indices'][tipo].get((normalizar_nombre(nombre), padre_id))
+    return catalogo[tipo].get(pk) if pk is not None else None
+
+
+def invalidar_catalogo_organizacion():
+    """
+    Publica una versión nueva del catálogo al confirmar la transacción en curso
+    y descarta las respuestas cacheadas que dependen de la jerarquía, incluido
+    el usuario autenticado con su cadena organizacional.
+    """
+    def publicar():
+        cache.set(CATALOGO_ORGANIZACION_VERSION, uuid.uuid4().hex, _ttl_catalogo_organizacion())
+        cache.delete_many(CACHES_DERIVADOS_CATALOGO)
+        marcar_progreso_empresarial_obsoleto()
+
+    transaction.on_commit(publicar)
+    invalidar_usuarios_organizacion()
+
+
+# ==================== PROGRESO EMPRESARIAL (stale-while-revalidate) ====================
+# El árbol Empresa → Unidad → Proyecto → Centro OP se calcula con un Avg sobre el
+# progreso de todos los colaboradores. La entrada en cache guarda el momento en
+# que deja de estar fresca y vive bastante más (ventana de obsolescencia): al
+# vencer, un solo proceso (el que obtiene el lock) recalcula mientras el resto
+# sigue respondiendo el valor anterior marcado como STALE. Se guarda el JSON ya
+# renderizado (core.respuestas), así un hit no pasa por el renderer. La tarea periódica
+# `refrescar_progreso_empresarial` lo recalcula antes de que venza.
+PROGRESO_EMPRESARIAL_KEY = 'progreso_empresarial_completo'
+PROGRESO_EMPRESARIAL_LOCK = f'{PROGRESO_EMPRESARIAL_KEY}:lock'
+PROGRESO_EMPRESARIAL_LOCK_TTL = 120  # segundos máximos de un recálculo
+ESPERA_PRIMER_CALCULO = 10  # segundos que se espera al recálculo de otro proceso sin valor previo
+INTERVALO_ESPERA = 0.25
+
+
+def _ttl_progreso_empresarial():
+    return getattr(settings, 'CACHE_TTL_PROGRESO_EMPRESARIAL', 1800)
+
+
+def _ventana_obsoleto_progreso_empresarial():
+    return getattr(settings, 'CACHE_STALE_PROGRESO_EMPRESARIAL', 60 * 60 * 24)
+
+
+def construir_progreso_empresarial():
+    """Calcula el árbol de progreso promedio por empresa, unidad, proyecto y centro"""
+    catalogo = obtener_catalogo_organizacion()
+
+    # Precalcular promedios por centro en una sola query; la jerarquía sale del catálogo
+    centros_con_promedio = Centroop.objects.filter(
+        estadocentrop=1
+    ).annotate(
+        promedio_progreso=Avg(
+            'colaboradores__progresocapacitaciones__progreso',
+            filter=~Q(colaboradores__progresocapacitaciones__capacitacion__estado=3)
+        )
+    ).order_by('idcentrop').values_list('idcentrop', 'promedio_progreso')
+
+    # Crear mapa de centros con sus promedios
+    centros_map = {}
+    for centro_id, promedio_progreso in centros_con_promedio:
+        centro = catalogo['centros'].get(centro_id)
+        if centro is None:
+            # Centro creado después de armar el catálogo: se verá en la próxima versión
+            continue
+        proyecto = centro.id_proyecto
+        if proyecto:
+            unidad = proyecto.id_unidad
+            if unidad:
+                empresa = unidad.id_empresa
+                if empresa and empresa.estadoempresa == 1:
+                    key = (empresa.idempresa, unidad.idunidad, proyecto.idproyecto)
+                    if key not in centros_map:
+                        centros_map[key] = {
+                            'empresa': empresa,
+                            'unidad': unidad,
+                            'proyecto': proyecto,
+                            'centros': []
+                        }
+                    centros_map[key]['centros'].append({
+                        'nombre': centro.nombrecentrop.strip(),
+                        'promedio': float(promedio_progreso or 0)
+                    })
+
+
+    # Construir respuesta jerárquica SOLO con empresas en estado 1
+    empresas_dict = {}
+
+    for key, data in centros_map.items():
+        empresa = data['empresa']
+        if getattr(empresa, 'estadoempresa', None) != 1:
+            continue
+        unidad = data['unidad']
+        proyecto = data['proyecto']
+
+        # Inicializar empresa si no existe
+        if empresa.idempresa not in empresas_dict:
+            empresas_dict[empresa.idempresa] = {
+                "empresa": empresa.nombre_empresa.strip(),
+                "tipo": "empresa",
+                "porcentaje": 0,
+                "unidades": {},
+                "_promedios": []
+            }
+
+        empresa_dict = empresas_dict[empresa.idempresa]
+
+        # Inicializar unidad si no existe
+        if unidad.idunidad not in empresa_dict["unidades"]:
+            empresa_dict["unidades"][unidad.idunidad] = {
+                "unidad": unidad.nombreunidad.strip(),
+                "tipo": "unidad",
+                "porcentaje": 0,
+                "proyectos": {},
+                "_promedios": []
+            }
+
+        unidad_dict = empresa_dict["unidades"][unidad.idunidad]
+
+        # Inicializar proyecto si no existe
+        if proyecto.idproyecto not in unidad_dict["proyectos"]:
+            unidad_dict["proyectos"][proyecto.idproyecto] = {
+                "proyecto": proyecto.nombreproyecto.strip(),
+                "tipo": "proyecto",
+                "porcentaje": 0,
+                "centrosop": []
+            }
+
+        proyecto_dict = unidad_dict["proyectos"][proyecto.idproyecto]
+
+        # Agregar centros
+        centro_promedios = []
+        for centro_data in data['centros']:
+            proyecto_dict["centrosop"].append({
+                "centro_op": centro_data['nombre'],
+                "porcentaje": round(centro_data['promedio'], 2),
+                "tipo": "centro_op"
+            })
+            centro_promedios.append(centro_data['promedio'])
+
+        # Calcular promedio del proyecto
+        if centro_promedios:
+            proyecto_promedio = sum(centro_promedios) / len(centro_promedios)
+            proyecto_dict["porcentaje"] = round(proyecto_promedio, 2)
+            unidad_dict["_promedios"].append(proyecto_promedio)
+
+    # Calcular promedios de unidades y empresas
+    for empresa_id, empresa_dict in empresas_dict.items():
+        for unidad_id, unidad_dict in empresa_dict["unidades"].items():
+            if unidad_dict["_promedios"]:
+                unidad_promedio = sum(unidad_dict["_promedios"]) / len(unidad_dict["_promedios"])
+                unidad_dict["porcentaje"] = round(unidad_promedio, 2)
+                empresa_dict["_promedios"].append(unidad_promedio)
+
+        if empresa_dict["_promedios"]:
+            empresa_dict["porcentaje"] = round(
+                sum(empresa_dict["_promedios"]) / len(empresa_dict["_promedios"]), 2
+            )
+
+    # Convertir dicts a listas y limpiar campos temporales
+    response = []
+    for empresa_dict in empresas_dict.values():
+        empresa_dict["unidades"] = list(empresa_dict["unidades"].values())
+        for unidad_dict in empresa_dict["unidades"]:
+            unidad_dict["proyectos"] = list(unidad_dict["proyectos"].values())
+            del unidad_dict["_promedios"]
+        del empresa_dict["_promedios"]
+        response.append(empresa_dict)
+
+    return response
+
+
+def _leer_entrada():
+    entrada = cache.get(PROGRESO_EMPRESARIAL_KEY)
+    # Entradas de un formato anterior (sin JSON renderizado) cuentan como ausentes
+    return entrada if isinstance(entrada, dict) and 'respuesta' in entrada else None
+
+
+def _guardar_progreso_empresarial(respuesta):
+    ttl = _ttl_progreso_empresarial()
+    cache.set(PROGRESO_EMPRESARIAL_KEY, {
+        'respuesta': respuesta,
+        'fresco_hasta': time.time() + ttl,
+    }, ttl + _ventana_obsoleto_progreso_empresarial())
+
+
+def _recalcular_con_lock():
+    """Recalcula y guarda el árbol si se obtiene el lock; None si otro proceso lo está haciendo"""
+    token = uuid.uuid4().hex
+    # Con Redis el lock se toma y se libera directo en el servidor (SET NX y
+    # borrado condicionado atómico); la misma clave que usaría cache.add
+    cliente, alias = cliente_redis()
+    if cliente is not None:
+        clave = caches[alias].make_key(PROGRESO_EMPRESARIAL_LOCK)
+        tomado = cliente.set(clave, token, nx=True, ex=PROGRESO_EMPRESARIAL_LOCK_TTL)
+    else:
+        tomado = cache.add(PROGRESO_EMPRESARIAL_LOCK, token, PROGRESO_EMPRESARIAL_LOCK_TTL)
+    if not tomado:
+        return None
+    try:
+        respuesta = renderizar_respuesta(construir_progreso_empresarial())
+        _guardar_progreso_empresarial(respuesta)
+        return respuesta
+    finally:
+        # Si el recálculo pasó el TTL, el lock puede ser ya de otro proceso
+        if cliente is not None:
+            liberar_lock_redis(cliente, clave, token.encode())
+        elif cache.get(PROGRESO_EMPRESARIAL_LOCK) == token:
+            # Cache por proceso: ningún otro worker comparte este lock
+            cache.delete(PROGRESO_EMPRESARIAL_LOCK)
+
+
+def obtener_progreso_empresarial():
+    """
+    Retorna (respuesta, estado): el JSON renderizado (ver core.respuestas) y
+    HIT, STALE o MISS.
+
+    - Fresco: se responde desde cache.
+    - Vencido: el proceso que obtiene el lock recalcula; los demás responden
+      el valor anterior (STALE) sin tocar la BD.
+    - Sin valor previo: un solo proceso calcula y los demás esperan su
+      resultado hasta ESPERA_PRIMER_CALCULO segundos antes de calcular por su cuenta.
+    """
+    entrada = _leer_entrada()
+    if entrada is not None:
+        if entrada['fresco_hasta'] > time.time():
+            return entrada['respuesta'], 'HIT'
+        respuesta = _recalcular_con_lock()
+        if respuesta is None:
+            return entrada['respuesta'], 'STALE'
+        return respuesta, 'MISS'
+
+    respuesta = _recalcular_con_lock()
+    if respuesta is not None:
+        return respuesta, 'MISS'
+
+    limite = time.monotonic() + ESPERA_PRIMER_CALCULO
+    while time.monotonic() < limite:
+        time.sleep(INTERVALO_ESPERA)
+        entrada = _leer_entrada()
+        if entrada is not None:
+            return entrada['respuesta'], 'HIT'
+
+    # El recálculo del otro proceso no terminó a tiempo: calcular sin guardar
+    return renderizar_respuesta(construir_progreso_empresarial()), 'MISS'
+
+
+def refrescar_progreso_empresarial():
+    """Recalcula el árbol en segundo plano (tarea Celery); False si ya hay un recálculo en curso"""
+    return _recalcular_con_lock() is not None
+
+
+def marcar_progreso_empresarial_obsoleto():
+    """Deja el valor en cache como vencido: se sigue sirviendo hasta que alguien lo recalcule"""
+    entrada = _leer_entrada()
+    if entrada is not None:
+        entrada = dict(entrada, fresco_hasta=0)
+        cache.set(PROGRESO_EMPRESARIAL_KEY, entrada, _ventana_obsoleto_progreso_empresarial())
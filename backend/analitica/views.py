@@ -3,17 +3,18 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from decimal import Decimal
 
-from django.db.models import Count, Avg, Q, Prefetch
+from django.db.models import Count, Prefetch
 from django.db import transaction
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.core.cache import cache
-from django.conf import settings
 
+from core.metricas_cache import leer_metricas_cache
+from core.respuestas import respuesta_renderizada
 from usuarios.permissions import IsSuperAdmin
 
 from .models import Epresa, Unidadnegocio, Proyecto, Centroop
+from .utils import PROGRESO_EMPRESARIAL_KEY, invalidar_catalogo_organizacion, obtener_progreso_empresarial
 from usuarios.models import Colaboradores
 from .serializers import (
 	EpresaSerializer,
@@ -35,141 +36,37 @@ class ProgresoEmpresarialView(APIView):
     Empresa → Unidad → Proyecto → Centro OP
 
     Optimización:
-    - Cache de 30 minutos (datos pesados que no cambian frecuentemente)
+    - Cache de 30 minutos con stale-while-revalidate y recálculo único (lock)
     - Prefetch de toda la jerarquía en pocas queries
     - Annotate para calcular promedios en BD
     """
-    CACHE_KEY = 'progreso_empresarial_completo'
+    CACHE_KEY = PROGRESO_EMPRESARIAL_KEY
 
     def get(self, request):
-        # Intentar obtener de cache primero
-        cache_ttl = getattr(settings, 'CACHE_TTL_PROGRESO_EMPRESARIAL', 1800)  # 30 min default
-        cached_data = cache.get(self.CACHE_KEY)
-
-        if cached_data is not None:
-            return Response(cached_data)
-
-        # Precalcular promedios por centro en una sola query
-        centros_con_promedio = Centroop.objects.filter(
-            estadocentrop=1
-        ).annotate(
-            promedio_progreso=Avg(
-                'colaboradores__progresocapacitaciones__progreso',
-                filter=~Q(colaboradores__progresocapacitaciones__capacitacion__estado=3)
-            )
-        ).select_related('id_proyecto__id_unidad__id_empresa')
-
-        # Crear mapa de centros con sus promedios
-        centros_map = {}
-        for centro in centros_con_promedio:
-            proyecto = centro.id_proyecto
-            if proyecto:
-                unidad = proyecto.id_unidad
-                if unidad:
-                    empresa = unidad.id_empresa
-                    if empresa and empresa.estadoempresa == 1:
-                        key = (empresa.idempresa, unidad.idunidad, proyecto.idproyecto)
-                        if key not in centros_map:
-                            centros_map[key] = {
-                                'empresa': empresa,
-                                'unidad': unidad,
-                                'proyecto': proyecto,
-                                'centros': []
-                            }
-                        centros_map[key]['centros'].append({
-                            'nombre': centro.nombrecentrop.strip(),
-                            'promedio': float(centro.promedio_progreso or 0)
-                        })
-
-
-        # Construir respuesta jerárquica SOLO con empresas en estado 1
-        empresas_dict = {}
-
-        for key, data in centros_map.items():
-            empresa = data['empresa']
-            if getattr(empresa, 'estadoempresa', None) != 1:
-                continue
-            unidad = data['unidad']
-            proyecto = data['proyecto']
-
-            # Inicializar empresa si no existe
-            if empresa.idempresa not in empresas_dict:
-                empresas_dict[empresa.idempresa] = {
-                    "empresa": empresa.nombre_empresa.strip(),
-                    "tipo": "empresa",
-                    "porcentaje": 0,
-                    "unidades": {},
-                    "_promedios": []
-                }
-
-            empresa_dict = empresas_dict[empresa.idempresa]
-
-            # Inicializar unidad si no existe
-            if unidad.idunidad not in empresa_dict["unidades"]:
-                empresa_dict["unidades"][unidad.idunidad] = {
-                    "unidad": unidad.nombreunidad.strip(),
-                    "tipo": "unidad",
-                    "porcentaje": 0,
-                    "proyectos": {},
-                    "_promedios": []
-                }
-
-            unidad_dict = empresa_dict["unidades"][unidad.idunidad]
-
-            # Inicializar proyecto si no existe
-            if proyecto.idproyecto not in unidad_dict["proyectos"]:
-                unidad_dict["proyectos"][proyecto.idproyecto] = {
-                    "proyecto": proyecto.nombreproyecto.strip(),
-                    "tipo": "proyecto",
-                    "porcentaje": 0,
-                    "centrosop": []
-                }
-
-            proyecto_dict = unidad_dict["proyectos"][proyecto.idproyecto]
-
-            # Agregar centros
-            centro_promedios = []
-            for centro_data in data['centros']:
-                proyecto_dict["centrosop"].append({
-                    "centro_op": centro_data['nombre'],
-                    "porcentaje": round(centro_data['promedio'], 2),
-                    "tipo": "centro_op"
-                })
-                centro_promedios.append(centro_data['promedio'])
-
-            # Calcular promedio del proyecto
-            if centro_promedios:
-                proyecto_promedio = sum(centro_promedios) / len(centro_promedios)
-                proyecto_dict["porcentaje"] = round(proyecto_promedio, 2)
-                unidad_dict["_promedios"].append(proyecto_promedio)
-
-        # Calcular promedios de unidades y empresas
-        for empresa_id, empresa_dict in empresas_dict.items():
-            for unidad_id, unidad_dict in empresa_dict["unidades"].items():
-                if unidad_dict["_promedios"]:
-                    unidad_promedio = sum(unidad_dict["_promedios"]) / len(unidad_dict["_promedios"])
-                    unidad_dict["porcentaje"] = round(unidad_promedio, 2)
-                    empresa_dict["_promedios"].append(unidad_promedio)
-
-            if empresa_dict["_promedios"]:
-                empresa_dict["porcentaje"] = round(
-                    sum(empresa_dict["_promedios"]) / len(empresa_dict["_promedios"]), 2
-                )
+        # Cache con stale-while-revalidate: un solo recálculo a la vez y, mientras
+        # tanto, el valor anterior con X-Cache: STALE (ver analitica/utils.py)
+        respuesta, estado = obtener_progreso_empresarial()
+        return respuesta_renderizada(request, respuesta, headers={'X-Cache': estado})
 
-        # Convertir dicts a listas y limpiar campos temporales
-        response = []
-        for empresa_dict in empresas_dict.values():
-            empresa_dict["unidades"] = list(empresa_dict["unidades"].values())
-            for unidad_dict in empresa_dict["unidades"]:
-                unidad_dict["proyectos"] = list(unidad_dict["proyectos"].values())
-                del unidad_dict["_promedios"]
-            del empresa_dict["_promedios"]
-            response.append(empresa_dict)
 
-        # Guardar en cache
-        cache.set(self.CACHE_KEY, response, cache_ttl)
+class MetricasCacheView(APIView):
+    permission_classes = [IsAuthenticated, IsSuperAdmin]
+    """
+    Métricas del cache por familia de claves (cap_detail, mis_caps,
+    reporte_correos, progreso_empresarial_completo...): hits, misses, sets,
+    deletes, bytes escritos y tiempo de reconstrucción tras un miss, sumados
+    en todos los workers. Sirven para dimensionar el cache y ajustar los CACHE_TTL_*.
+    """
 
-        return Response(response)
+    def get(self, request):
+        metricas = leer_metricas_cache()
+        return Response({
+            'familias': metricas,
+            'totales': {
+                nombre: sum(fila[nombre] for fila in metricas.values())
+                for nombre in ('hits', 'misses', 'sets', 'deletes', 'bytes')
+            },
+        }, status=status.HTTP_200_OK)
 
 
 class ProgresoEmpresarialFiltradoView(APIView):
@@ -226,6 +123,7 @@ class EmpresaCreateView(APIView):
         serializer = EpresaSerializer(data=request.data)
         if serializer.is_valid():
             empresa = serializer.save()
+            invalidar_catalogo_organizacion()
             return Response(
                 {"message": "Empresa creada exitosamente", "empresa": EpresaSerializer(empresa).data},
                 status=status.HTTP_201_CREATED
@@ -249,6 +147,7 @@ class VerEmpresaView(APIView):
         serializer = EpresaSerializer(empresa, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
+            invalidar_catalogo_organizacion()
             return Response({"message": "Empresa actualizada", "empresa": serializer.data})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -259,6 +158,7 @@ class VerEmpresaView(APIView):
 
         empresa.estado_empresa = 0 if empresa.estado_empresa == 1 else 1
         empresa.save(update_fields=["estado_empresa"])
+        invalidar_catalogo_organizacion()
 
         return Response({"message": f"Estado actualizado correctamente"})
 
@@ -283,6 +183,7 @@ class UnidadNegocioCreateView(APIView):
         serializer = UnidadNegocioSerializer(data=request.data)
         if serializer.is_valid():
             unidad = serializer.save()
+            invalidar_catalogo_organizacion()
             return Response(
                 {"message": "Unidad creada", "unidad_negocio": UnidadNegocioSerializer(unidad).data},
                 status=status.HTTP_201_CREATED
@@ -307,6 +208,7 @@ class VerUnidadNegocioView(APIView):
         serializer = UnidadNegocioSerializer(unidad, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
+            invalidar_catalogo_organizacion()
             return Response({"message": "Unidad actualizada", "unidad_negocio": serializer.data})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -317,6 +219,7 @@ class VerUnidadNegocioView(APIView):
 
         unidad.estado_unidad = 0 if unidad.estado_unidad == 1 else 1
         unidad.save(update_fields=["estado_unidad"])
+        invalidar_catalogo_organizacion()
 
         return Response({"message": f"Estado actualizado correctamente"})
 
@@ -358,6 +261,7 @@ class ProyectoCreateView(APIView):
         )
         if relacion_serializer.is_valid():
             relacion_serializer.save()
+        invalidar_catalogo_organizacion()
 
         return Response(
             {"message": "Proyecto creado", "proyecto": ProyectoSerializer(proyecto).data},
@@ -383,6 +287,7 @@ class VerProyectoView(APIView):
         serializer = ProyectoSerializer(proyecto, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
+            invalidar_catalogo_organizacion()
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -403,6 +308,7 @@ class VerProyectoView(APIView):
 
         proyecto.estado_proyecto = 0 if proyecto.estado_proyecto == 1 else 1
         proyecto.save(update_fields=["estado_proyecto"])
+        invalidar_catalogo_organizacion()
 
         return Response({"message": "Estado actualizado"})
 
@@ -431,6 +337,7 @@ class CentroOperativoCreateView(APIView):
             serializer = CentroOpSerializer(data=request.data)
             if serializer.is_valid():
                 centro = serializer.save()
+                invalidar_catalogo_organizacion()
                 return Response(
                     {"message": "Centro operativo creado", "centro_operativo": serializer.data},
                     status=status.HTTP_201_CREATED
@@ -455,6 +362,7 @@ class VerCentroOperativoView(APIView):
         serializer = CentroOpSerializer(centro, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
+            invalidar_catalogo_organizacion()
             return Response({"message": "Centro actualizado", "centro_operativo": serializer.data})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -465,6 +373,7 @@ class VerCentroOperativoView(APIView):
 
         centro.estado_centrop = 0 if centro.estado_centrop == 1 else 1
         centro.save(update_fields=["estado_centrop"])
+        invalidar_catalogo_organizacion()
 
         return Response({"message": "Estado actualizado"})
 
@@ -0,0 +1,184 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from capacitaciones.models import (
+    Capacitaciones, progresoCapacitaciones, progresolecciones, progresoModulo
+)
+from capacitaciones.utils import (
+    invalidate_capacitacion_cache, recalcular_completados_capacitacion,
+    reconstruir_estructura_capacitacion
+)
+
+# Import opcional de pandas/numpy (requirements-dev.txt)
+try:
+    import numpy as np
+    import pandas as pd
+    PANDAS_AVAILABLE = True
+except ImportError:
+    PANDAS_AVAILABLE = False
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula progreso_modulo y capacitaciones_colaboradores de todos los inscritos '
+        'de una capacitación a partir del progreso de lecciones (cálculo vectorizado)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--capacitacion',
+            type=int,
+            help='ID de la capacitación a recalcular'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recalcular todas las capacitaciones con inscritos'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=1000,
+            help='Filas por sentencia en las escrituras en bloque (default 1000)'
+        )
+
+    def handle(self, *args, **options):
+        if not PANDAS_AVAILABLE:
+            raise CommandError('Este comando requiere numpy y pandas (ver requirements-dev.txt)')
+
+        if options['all']:
+            capacitaciones_ids = list(
+                progresoCapacitaciones.objects.values_list('capacitacion_id', flat=True)
+                .distinct().order_by('capacitacion_id')
+            )
+        elif options['capacitacion']:
+            if not Capacitaciones.objects.filter(pk=options['capacitacion']).exists():
+                raise CommandError(f"Capacitación {options['capacitacion']} no existe")
+            capacitaciones_ids = [options['capacitacion']]
+        else:
+            raise CommandError('Indica --capacitacion <id> o --all')
+
+        for capacitacion_id in capacitaciones_ids:
+            inicio = time.monotonic()
+            resumen = self.recalcular_capacitacion(capacitacion_id, options['lote'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Capacitación {capacitacion_id}: {resumen['colaboradores']} colaboradores, "
+                f"{resumen['modulos']} filas de módulo, {resumen['completadas']} completadas "
+                f"({time.monotonic() - inicio:.2f}s)"
+            ))
+
+    def recalcular_capacitacion(self, capacitacion_id, lote):
+        # Estructura leída de la BD (y republicada): el comando corrige desfases,
+        # no debe confiar en una copia cacheada que puede estar vieja
+        estructura = reconstruir_estructura_capacitacion(capacitacion_id)
+        modulos_ids = estructura['modulos']
+        lecciones_por_modulo = estructura['lecciones_por_modulo']
+
+        inscripciones = list(
+            progresoCapacitaciones.objects.filter(capacitacion_id=capacitacion_id)
+            .values_list('id', 'colaborador_id')
+        )
+        colaboradores_ids = sorted({colaborador_id for _, colaborador_id in inscripciones})
+        if not colaboradores_ids or not modulos_ids:
+            return {'colaboradores': len(colaboradores_ids), 'modulos': 0, 'completadas': 0}
+
+        # Matriz colaborador x lección en una sola query
+        filas = progresolecciones.objects.filter(
+            idleccion_id__in=list(estructura['modulo_por_leccion'])
+        ).values_list('idcolaborador_id', 'idleccion_id', 'progreso', 'completada')
+        lecciones = pd.DataFrame.from_records(
+            list(filas), columns=['colaborador', 'leccion', 'progreso', 'completada']
+        )
+        lecciones = lecciones[lecciones['colaborador'].isin(colaboradores_ids)].copy()
+        lecciones['modulo'] = lecciones['leccion'].map(estructura['modulo_por_leccion'])
+        lecciones['progreso'] = lecciones['progreso'].astype(float)
+        # Igual que `if progreso.completada:` (no nulo y distinto de 0)
+        lecciones['completada'] = lecciones['completada'].fillna(0).astype(int) != 0
+
+        # Módulos sin lecciones no se escriben, como en el rollup incremental
+        total_lecciones = pd.Series(
+            {modulo_id: len(lecciones_por_modulo.get(modulo_id, [])) for modulo_id in modulos_ids},
+            dtype=float
+        )
+        modulos_con_lecciones = total_lecciones[total_lecciones > 0].index
+
+        indice = pd.MultiIndex.from_product(
+            [colaboradores_ids, modulos_con_lecciones], names=['colaborador', 'modulo']
+        )
+        por_modulo = (
+            lecciones.groupby(['colaborador', 'modulo'])
+            .agg(suma=('progreso', 'sum'), completadas=('completada', 'sum'))
+            .reindex(indice, fill_value=0)
+            .reset_index()
+        )
+        totales = por_modulo['modulo'].map(total_lecciones).to_numpy()
+        por_modulo['progreso'] = np.round(por_modulo['suma'].to_numpy() / totales, 2)
+        por_modulo['completada'] = por_modulo['completadas'].to_numpy() == totales
+
+        # Promedio de la capacitación sobre todos sus módulos
+        por_capacitacion = por_modulo.groupby('colaborador').agg(
+            suma=('progreso', 'sum'), completados=('completada', 'sum')
+        ).reindex(colaboradores_ids, fill_value=0)
+        por_capacitacion['progreso'] = np.round(por_capacitacion['suma'] / len(modulos_ids), 2)
+        por_capacitacion['completada'] = por_capacitacion['completados'] == len(modulos_ids)
+
+        with transaction.atomic():
+            filas_modulo = self.escribir_modulos(por_modulo, colaboradores_ids, lote)
+            self.escribir_capacitaciones(inscripciones, por_capacitacion, lote)
+            # También crea las filas de completadas que falten (inscripciones antiguas)
+            recalcular_completados_capacitacion(capacitacion_id)
+
+        # La generación nueva invalida también el listado de todos los inscritos
+        invalidate_capacitacion_cache(capacitacion_id=capacitacion_id)
+
+        return {
+            'colaboradores': len(colaboradores_ids),
+            'modulos': filas_modulo,
+            'completadas': int(por_capacitacion['completada'].sum()),
+        }
+
+    def escribir_modulos(self, por_modulo, colaboradores_ids, lote):
+        """UPDATE en bloque de las filas existentes (por pk) e INSERT en bloque de las faltantes"""
+        existentes = {}
+        for pk, colaborador_id, modulo_id in progresoModulo.objects.filter(
+            modulo_id__in=por_modulo['modulo'].unique().tolist(),
+            colaborador_id__in=colaboradores_ids
+        ).values_list('id', 'colaborador_id', 'modulo_id'):
+            existentes.setdefault((colaborador_id, modulo_id), []).append(pk)
+
+        actualizar = []
+        crear = []
+        for colaborador_id, modulo_id, progreso, completada in por_modulo[
+            ['colaborador', 'modulo', 'progreso', 'completada']
+        ].itertuples(index=False):
+            valores = {'progreso': float(progreso), 'completada': bool(completada)}
+            pks = existentes.get((int(colaborador_id), int(modulo_id)))
+            if pks:
+                actualizar.extend(progresoModulo(pk=pk, **valores) for pk in pks)
+            else:
+                crear.append(progresoModulo(
+                    colaborador_id=int(colaborador_id), modulo_id=int(modulo_id), **valores
+                ))
+
+        progresoModulo.objects.bulk_update(actualizar, ['progreso', 'completada'], batch_size=lote)
+        progresoModulo.objects.bulk_create(crear, batch_size=lote)
+        return len(actualizar) + len(crear)
+
+    def escribir_capacitaciones(self, inscripciones, por_capacitacion, lote):
+        """Las inscripciones ya existen: UPDATE en bloque por pk"""
+        progreso = por_capacitacion['progreso'].to_dict()
+        completada = por_capacitacion['completada'].to_dict()
+        progresoCapacitaciones.objects.bulk_update(
+            [
+                progresoCapacitaciones(
+                    pk=pk,
+                    progreso=progreso[colaborador_id],
+                    completada=bool(completada[colaborador_id])
+                )
+                for pk, colaborador_id in inscripciones
+            ],
+            ['progreso', 'completada'],
+            batch_size=lote
+        )
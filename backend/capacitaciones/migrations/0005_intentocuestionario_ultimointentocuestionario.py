@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('capacitaciones', '0004_create_certificados_generados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntentoCuestionario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('colaborador_id', models.IntegerField(db_column='colaborador_id')),
+                ('leccion_id', models.IntegerField(db_column='leccion_id')),
+                ('total_preguntas', models.PositiveSmallIntegerField(db_column='total_preguntas')),
+                ('respuestas_correctas', models.PositiveSmallIntegerField(db_column='respuestas_correctas')),
+                ('porcentaje', models.DecimalField(db_column='porcentaje', decimal_places=2, max_digits=5)),
+                ('aprobada', models.BooleanField(db_column='aprobada')),
+                ('respuestas', models.TextField(db_column='respuestas')),
+                ('fecha', models.DateTimeField(auto_now_add=True, db_column='fecha')),
+            ],
+            options={
+                'db_table': 'intentos_cuestionario',
+                'indexes': [models.Index(fields=['colaborador_id', 'leccion_id'], name='intentos_cu_colabor_453a55_idx'), models.Index(fields=['leccion_id', 'fecha'], name='intentos_cu_leccion_d96498_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UltimoIntentoCuestionario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('colaborador_id', models.IntegerField(db_column='colaborador_id')),
+                ('leccion_id', models.IntegerField(db_column='leccion_id')),
+                ('intento', models.ForeignKey(db_column='intento_id', on_delete=django.db.models.deletion.DO_NOTHING, to='capacitaciones.intentocuestionario')),
+            ],
+            options={
+                'db_table': 'ultimo_intento_cuestionario',
+                'unique_together': {('colaborador_id', 'leccion_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('capacitaciones', '0005_intentocuestionario_ultimointentocuestionario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompletadoCapacitacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('colaborador_id', models.IntegerField(db_column='colaborador_id')),
+                ('capacitacion_id', models.IntegerField(db_column='capacitacion_id')),
+                ('bitmap', models.BinaryField(db_column='bitmap')),
+                ('lecciones_completadas', models.PositiveIntegerField(db_column='lecciones_completadas', default=0)),
+                ('total_lecciones', models.PositiveIntegerField(db_column='total_lecciones', default=0)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, db_column='fecha_actualizacion')),
+            ],
+            options={
+                'db_table': 'completado_capacitacion',
+                'unique_together': {('colaborador_id', 'capacitacion_id')},
+            },
+        ),
+    ]
@@ -123,3 +123,51 @@ class CertificadoGenerado(models.Model):
             models.Index(fields=['colaborador_id', 'capacitacion_id']),
             models.Index(fields=['fecha_generacion']),
         ]
+
+
+class IntentoCuestionario(models.Model):
+    """Intento de cuestionario (append-only: nunca se actualiza ni se borra)"""
+    colaborador_id = models.IntegerField(db_column='colaborador_id')
+    leccion_id = models.IntegerField(db_column='leccion_id')
+    total_preguntas = models.PositiveSmallIntegerField(db_column='total_preguntas')
+    respuestas_correctas = models.PositiveSmallIntegerField(db_column='respuestas_correctas')
+    porcentaje = models.DecimalField(max_digits=5, decimal_places=2, db_column='porcentaje')
+    aprobada = models.BooleanField(db_column='aprobada')
+    # Respuestas empaquetadas "pregunta:respuesta,respuesta;pregunta:respuesta"
+    respuestas = models.TextField(db_column='respuestas')
+    fecha = models.DateTimeField(auto_now_add=True, db_column='fecha')
+
+    class Meta:
+        db_table = 'intentos_cuestionario'
+        indexes = [
+            models.Index(fields=['colaborador_id', 'leccion_id']),
+            models.Index(fields=['leccion_id', 'fecha']),
+        ]
+
+
+class UltimoIntentoCuestionario(models.Model):
+    """Puntero al intento más reciente por (colaborador, lección)"""
+    colaborador_id = models.IntegerField(db_column='colaborador_id')
+    leccion_id = models.IntegerField(db_column='leccion_id')
+    intento = models.ForeignKey(IntentoCuestionario, models.DO_NOTHING, db_column='intento_id')
+
+    class Meta:
+        db_table = 'ultimo_intento_cuestionario'
+        unique_together = (('colaborador_id', 'leccion_id'),)
+
+
+class CompletadoCapacitacion(models.Model):
+    """
+    Lecciones completadas por (colaborador, capacitación) en forma compacta:
+    bit i = i-ésima lección de la capacitación (ordenadas por id) completada.
+    """
+    colaborador_id = models.IntegerField(db_column='colaborador_id')
+    capacitacion_id = models.IntegerField(db_column='capacitacion_id')
+    bitmap = models.BinaryField(db_column='bitmap')
+    lecciones_completadas = models.PositiveIntegerField(default=0, db_column='lecciones_completadas')
+    total_lecciones = models.PositiveIntegerField(default=0, db_column='total_lecciones')
+    fecha_actualizacion = models.DateTimeField(auto_now=True, db_column='fecha_actualizacion')
+
+    class Meta:
+        db_table = 'completado_capacitacion'
+        unique_together = (('colaborador_id', 'capacitacion_id'),)
@@ -1,9 +1,17 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.utils import timezone
 from rest_framework import serializers
 from django.db import transaction
-from .utils import enviar_correo_capacitacion_creada
-from .models import Capacitaciones, Modulos, progresoCapacitaciones, Lecciones, PreguntasLecciones, Respuestas, progresolecciones, progresoModulo
+from .utils import (
+    PREFETCH_ARBOL_PROGRESO, contexto_progreso_colaborador, enviar_correo_capacitacion_creada,
+    prefetch_progreso_capacitacion, recalcular_completados_capacitacion,
+    reconstruir_estructura_capacitacion
+)
+from .models import Capacitaciones, Modulos, progresoCapacitaciones, Lecciones, PreguntasLecciones, Respuestas, progresolecciones, progresoModulo, CompletadoCapacitacion
 from usuarios.models import Colaboradores
+from core.campos import RepresentacionParcialMixin
 
 class capacitacionSerializer(serializers.ModelSerializer):
     total_colaboradores = serializers.SerializerMethodField()
@@ -26,11 +34,18 @@ class capacitacionSerializer(serializers.ModelSerializer):
                   'porcentaje_completado']
         
     def get_total_colaboradores(self, obj):
+        # Conteo anotado por CapacitacionesView (utils.anotar_inscritos) si está disponible
+        total = getattr(obj, 'total_inscritos', None)
+        if total is not None:
+            return total
         return progresoCapacitaciones.objects.filter(
             capacitacion=obj
         ).values('colaborador').distinct().count()
 
     def get_completados(self, obj):
+        completados = getattr(obj, 'total_completados', None)
+        if completados is not None:
+            return completados
         return progresoCapacitaciones.objects.filter(
             capacitacion=obj,
             completada=True
@@ -133,6 +148,40 @@ class CapacitacionDetalleSerializer(serializers.ModelSerializer):
         progres = progresoCapacitaciones.objects.filter(capacitacion=obj).select_related('colaborador')
         colaboradores = [p.colaborador for p in progres]
         return ColaboradorSerializer(colaboradores, many=True).data
+
+
+class CapacitacionEstructuraSerializer(RepresentacionParcialMixin, CapacitacionDetalleSerializer):
+    """
+    Detalle sin la lista de inscritos (solo su cantidad): su tamaño no crece con
+    las inscripciones. Los inscritos se consultan paginados en
+    capacitacion/<id>/colaboradores/. Admite `campos` (ver core.campos).
+    """
+    total_colaboradores = serializers.SerializerMethodField()
+    colaboradores = None
+
+    class Meta(CapacitacionDetalleSerializer.Meta):
+        fields = [
+            'id',
+            'titulo',
+            'descripcion',
+            'imagen',
+            'estado',
+            'fecha_creacion',
+            'fecha_inicio',
+            'fecha_fin',
+            'modulos',
+            'total_colaboradores'
+        ]
+        campos_resumen = ['id', 'titulo', 'imagen', 'estado', 'fecha_inicio', 'fecha_fin', 'total_colaboradores']
+
+    def get_total_colaboradores(self, obj):
+        # Conteo anotado (utils.anotar_inscritos) si está disponible
+        total = getattr(obj, 'total_inscritos', None)
+        if total is not None:
+            return total
+        return progresoCapacitaciones.objects.filter(
+            capacitacion=obj
+        ).values('colaborador').distinct().count()
     
 
 class CapacitacionColaboradorSerializer(serializers.ModelSerializer):
@@ -210,6 +259,9 @@ class CrearCapacitacionSerializer(serializers.ModelSerializer):
                                     urlimagen=respuesta_data.get('url_imagen', None)
                                 )
 
+            # Publicar el catálogo de estructura cuando la transacción se confirme
+            transaction.on_commit(lambda: reconstruir_estructura_capacitacion(capacitacion.id))
+
             for colaborador_id in colaboradores_data:
                 progresoCapacitaciones.objects.create(
                     capacitacion=capacitacion,
@@ -218,6 +270,8 @@ class CrearCapacitacionSerializer(serializers.ModelSerializer):
                     completada=False,
                     progreso=0
                 )
+            # Filas de completadas de los inscritos, con el catálogo ya publicado
+            transaction.on_commit(lambda: recalcular_completados_capacitacion(capacitacion.id))
 
         hoy = timezone.now().date()
 
@@ -272,6 +326,12 @@ class CrearCapacitacionSerializer(serializers.ModelSerializer):
                                         urlimagen=respuesta_data.get('url_imagen', None)
                                     )
 
+                # La estructura cambió: nueva versión del catálogo al confirmar y
+                # los bitmaps de completadas (posiciones por lección) se recalculan
+                # para todos los inscritos (después de publicar el catálogo)
+                transaction.on_commit(lambda: reconstruir_estructura_capacitacion(instance.id))
+                transaction.on_commit(lambda: recalcular_completados_capacitacion(instance.id))
+
             # Sincronizar colaboradores si se envía la lista
             added = []
             removed = []
@@ -300,6 +360,8 @@ class CrearCapacitacionSerializer(serializers.ModelSerializer):
                     added.append(cid)
                 if bulk_objs:
                     progresoCapacitaciones.objects.bulk_create(bulk_objs)
+                    if modulos_data is None:
+                        recalcular_completados_capacitacion(instance.id, added)
 
                 # Eliminar removidos y limpiar progreso relacionado
                 if to_remove:
@@ -307,6 +369,7 @@ class CrearCapacitacionSerializer(serializers.ModelSerializer):
                         # eliminar registros de progreso a nivel lecciones y modulos
                         progresolecciones.objects.filter(idcolaborador_id=cid, idleccion__idmodulo__idcapacitacion=instance).delete()
                         progresoModulo.objects.filter(colaborador_id=cid, modulo__idcapacitacion=instance).delete()
+                        CompletadoCapacitacion.objects.filter(capacitacion_id=instance.id, colaborador_id=cid).delete()
                         progresoCapacitaciones.objects.filter(capacitacion=instance, colaborador_id=cid).delete()
                         removed.append(cid)
 
@@ -324,7 +387,40 @@ class CrearCapacitacionSerializer(serializers.ModelSerializer):
             return instance
     
 
+class EventoProgresoSerializer(serializers.Serializer):
+    """Evento de progreso de lección enviado por el cliente (ingesta por lotes)"""
+    leccion_id = serializers.IntegerField()
+    progreso = serializers.FloatField(min_value=0, max_value=100, default=0)
+    completada = serializers.BooleanField(default=False)
+    timestamp = serializers.DateTimeField(required=False, allow_null=True)
+
+    def validate_timestamp(self, value):
+        """
+        Fecha de completado del cliente, acotada a ahora. Las demasiado viejas o
+        futuras (más allá del desfase de reloj tolerado) se ignoran: None hace
+        que se use la hora del servidor.
+        """
+        if value is None:
+            return None
+        ahora = timezone.now()
+        antiguedad = getattr(settings, 'PROGRESO_TIMESTAMP_MAX_ANTIGUEDAD', 60 * 60 * 24 * 30)
+        desfase = getattr(settings, 'PROGRESO_TIMESTAMP_DESFASE_FUTURO', 60 * 5)
+        if value < ahora - timedelta(seconds=antiguedad) or value > ahora + timedelta(seconds=desfase):
+            return None
+        return min(value, ahora)
+
+    def validate(self, attrs):
+        # Una lección completada está al 100%, diga lo que diga el cliente
+        if attrs.get('completada'):
+            attrs['progreso'] = 100
+        return attrs
+
+
 class LeccionProgresoSerializer(serializers.ModelSerializer):
+    """
+    Con `progreso_lecciones` en el contexto ({leccion_id: progreso}, ver
+    utils.contexto_progreso_colaborador) no consulta la BD por lección.
+    """
     progreso = serializers.SerializerMethodField()
     completada = serializers.SerializerMethodField()
     preguntas = serializers.SerializerMethodField()
@@ -335,22 +431,29 @@ class LeccionProgresoSerializer(serializers.ModelSerializer):
         model = Lecciones
         fields = ['id', 'titulo_leccion', 'tipo_leccion', 'url', 'progreso', 'completada', 'preguntas']
 
-    def get_progreso(self, obj):
+    def _progreso_leccion(self, obj):
+        progreso_lecciones = self.context.get('progreso_lecciones')
+        if progreso_lecciones is not None:
+            return progreso_lecciones.get(obj.id)
         colaborador = self.context['colaborador']
-        progreso = progresolecciones.objects.filter(idcolaborador=colaborador, idleccion=obj).first()
+        return progresolecciones.objects.filter(idcolaborador=colaborador, idleccion=obj).first()
+
+    def get_progreso(self, obj):
+        progreso = self._progreso_leccion(obj)
         return progreso.progreso if progreso else 0
 
     def get_completada(self, obj):
-        colaborador = self.context['colaborador']
-        progreso = progresolecciones.objects.filter(idcolaborador=colaborador, idleccion=obj).first()
+        progreso = self._progreso_leccion(obj)
         return progreso.completada if progreso else False
     
     def get_preguntas(self, obj):
-        preguntas = PreguntasLecciones.objects.filter(id_leccion=obj)
+        # Usa las preguntas prefetched si están disponibles
+        preguntas = obj.preguntaslecciones_set.all()
         return PreguntaLeccionSerializer(preguntas, many=True).data
 
 
 class ModuloProgresoSerializer(serializers.ModelSerializer):
+    """Con `progreso_modulos` en el contexto ({modulo_id: progreso}) no consulta la BD por módulo"""
     lecciones = serializers.SerializerMethodField()
     progreso = serializers.SerializerMethodField()
     completada = serializers.SerializerMethodField()
@@ -361,26 +464,36 @@ class ModuloProgresoSerializer(serializers.ModelSerializer):
         fields = ['id', 'nombre_modulo', 'progreso', 'completada', 'lecciones']
 
     def get_lecciones(self, obj):
-        colaborador = self.context['colaborador']
-        lecciones = Lecciones.objects.filter(idmodulo=obj)
+        # Usa las lecciones prefetched si están disponibles
+        lecciones = obj.lecciones_set.all()
         return LeccionProgresoSerializer(
             lecciones,
             many=True,
-            context={'colaborador': colaborador}
+            context=self.context
         ).data
 
-    def get_progreso(self, obj):
+    def _progreso_modulo(self, obj):
+        progreso_modulos = self.context.get('progreso_modulos')
+        if progreso_modulos is not None:
+            return progreso_modulos.get(obj.id)
         colaborador = self.context['colaborador']
-        prog = progresoModulo.objects.filter(colaborador=colaborador, modulo=obj).first()
+        return progresoModulo.objects.filter(colaborador=colaborador, modulo=obj).first()
+
+    def get_progreso(self, obj):
+        prog = self._progreso_modulo(obj)
         return prog.progreso if prog else 0
 
     def get_completada(self, obj):
-        colaborador = self.context['colaborador']
-        prog = progresoModulo.objects.filter(colaborador=colaborador, modulo=obj).first()
+        prog = self._progreso_modulo(obj)
         return prog.completada if prog else False
 
 
-class CapacitacionProgresoSerializer(serializers.ModelSerializer):
+class CapacitacionProgresoSerializer(RepresentacionParcialMixin, serializers.ModelSerializer):
+    """
+    Árbol de la capacitación con el progreso de `colaborador` (contexto). Para
+    serializarlo desde memoria usar utils.capacitacion_con_progreso y pasar como
+    contexto utils.contexto_progreso_colaborador. Admite `campos` (ver core.campos).
+    """
     progreso = serializers.SerializerMethodField()
     completada = serializers.SerializerMethodField()
     modulos = serializers.SerializerMethodField()
@@ -396,40 +509,32 @@ class CapacitacionProgresoSerializer(serializers.ModelSerializer):
             'completada',
             'modulos'
         ]
+        campos_resumen = ['id', 'titulo', 'imagen', 'progreso', 'completada']
 
-    def get_progreso(self, obj):
+    def _progreso_capacitacion(self, obj):
         # Usar datos prefetched si están disponibles
-        if hasattr(obj, 'progreso_colaborador') and obj.progreso_colaborador:
-            return obj.progreso_colaborador[0].progreso
+        if hasattr(obj, 'progreso_colaborador'):
+            return obj.progreso_colaborador[0] if obj.progreso_colaborador else None
         
         # Fallback para compatibilidad
         colaborador = self.context['colaborador']
-        prog = progresoCapacitaciones.objects.filter(colaborador=colaborador, capacitacion=obj).first()
+        return progresoCapacitaciones.objects.filter(colaborador=colaborador, capacitacion=obj).first()
+
+    def get_progreso(self, obj):
+        prog = self._progreso_capacitacion(obj)
         return prog.progreso if prog else 0
 
     def get_completada(self, obj):
-        # Usar datos prefetched si están disponibles
-        if hasattr(obj, 'progreso_colaborador') and obj.progreso_colaborador:
-            return obj.progreso_colaborador[0].completada
-        
-        # Fallback para compatibilidad
-        colaborador = self.context['colaborador']
-        prog = progresoCapacitaciones.objects.filter(colaborador=colaborador, capacitacion=obj).first()
+        prog = self._progreso_capacitacion(obj)
         return prog.completada if prog else False
 
     def get_modulos(self, obj):
-        colaborador = self.context['colaborador']
-        
-        # Usar datos prefetched si están disponibles
-        if hasattr(obj, 'modulos_set'):
-            modulos = obj.modulos_set.all()
-        else:
-            modulos = Modulos.objects.filter(capacitacion=obj)
-        
+        # Usa los módulos prefetched si están disponibles
+        modulos = obj.modulos_set.all()
         return ModuloProgresoSerializer(
             modulos,
             many=True,
-            context={'colaborador': colaborador}
+            context=self.context
         ).data
 
 
@@ -474,21 +579,29 @@ class ColaboradorCapacitacionesSerializer(serializers.ModelSerializer):
         ]
 
     def get_capacitaciones(self, obj):
-        capacitaciones = Capacitaciones.objects.filter(
+        capacitaciones = list(Capacitaciones.objects.filter(
             id__in=progresoCapacitaciones.objects.filter(colaborador=obj).values('capacitacion')
-        ).exclude(estado=2).order_by('-fecha_creacion')
+        ).exclude(estado=2).order_by('-fecha_creacion').prefetch_related(
+            prefetch_progreso_capacitacion(obj),
+            PREFETCH_ARBOL_PROGRESO
+        ))
 
         return CapacitacionProgresoSerializer(
             capacitaciones,
             many=True,
-            context={'colaborador': obj}
+            context=contexto_progreso_colaborador(obj, [c.id for c in capacitaciones])
         ).data
 
-class MisCapacitacionesSerializer(serializers.ModelSerializer):
+class MisCapacitacionesSerializer(RepresentacionParcialMixin, serializers.ModelSerializer):
+    """
+    Si el contexto trae `completados` ({capacitacion_id: (completadas, total)},
+    ver utils.obtener_completados) los conteos salen de ahí; si no, de los
+    datos prefetched/annotados. Admite `campos` (ver core.campos).
+    """
     progreso = serializers.SerializerMethodField()
     completada = serializers.SerializerMethodField()
     lecciones_completadas = serializers.SerializerMethodField()
-    total_lecciones = serializers.IntegerField(source='total_lecciones_count', read_only=True)
+    total_lecciones = serializers.SerializerMethodField()
 
     class Meta:
         model = Capacitaciones
@@ -501,6 +614,7 @@ class MisCapacitacionesSerializer(serializers.ModelSerializer):
             'lecciones_completadas',
             'total_lecciones'
         ]
+        campos_resumen = ['id', 'titulo', 'imagen', 'progreso', 'completada']
 
     def get_progreso(self, obj):
         # Usar datos prefetched en lugar de nueva query
@@ -515,6 +629,10 @@ class MisCapacitacionesSerializer(serializers.ModelSerializer):
         return False
 
     def get_lecciones_completadas(self, obj):
+        completados = self.context.get('completados')
+        if completados is not None and obj.id in completados:
+            return completados[obj.id][0]
+        
         # Usar datos prefetched en lugar de nueva query
         if not hasattr(obj, 'modulos_set'):
             return 0
@@ -528,6 +646,12 @@ class MisCapacitacionesSerializer(serializers.ModelSerializer):
                             count += 1
         return count
 
+    def get_total_lecciones(self, obj):
+        completados = self.context.get('completados')
+        if completados is not None and obj.id in completados:
+            return completados[obj.id][1]
+        return getattr(obj, 'total_lecciones_count', 0)
+
 
 class capacitacionUpdateSerializer(serializers.ModelSerializer):
     modulos = serializers.ListField(required=False)
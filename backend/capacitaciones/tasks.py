@@ -0,0 +1,86 @@
+import logging
+
+from celery import shared_task
+from django.core.cache import cache
+from django.db import transaction
+
+from capacitaciones.utils import (
+    calentamiento_activo,
+    calentar_cache_capacitaciones,
+    tomar_slot_calentamiento,
+    volcar_progreso_pendiente,
+    write_behind_activo,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def volcar_progreso_buffer():
+    """
+    Vuelca a la BD los heartbeats de progreso acumulados en cache
+    (modo write-behind, ver PROGRESO_WRITE_BEHIND en settings).
+    """
+    if not write_behind_activo():
+        return {'status': 'skipped', 'procesados': 0}
+
+    try:
+        procesados = volcar_progreso_pendiente()
+        return {'status': 'success', 'procesados': procesados}
+    except Exception as e:
+        return {
+            'status': 'error',
+            'message': f'Error al volcar progreso pendiente: {str(e)}'
+        }
+
+
+@shared_task(bind=True, max_retries=5)
+def calentar_cache(self, capacitacion_id=None, colaboradores_ids=None, progreso_empresarial=False):
+    """
+    Reconstruye las entradas de cache que una escritura dejó obsoletas
+    (ver calentar_cache_capacitaciones). Como máximo CACHE_CALENTAMIENTO_CONCURRENCIA
+    tareas calientan a la vez; si no hay slot libre se reintenta más tarde.
+    """
+    slot = tomar_slot_calentamiento()
+    if slot is None:
+        raise self.retry(countdown=30)
+
+    try:
+        calentadas = calentar_cache_capacitaciones(capacitacion_id, colaboradores_ids)
+        if progreso_empresarial:
+            from analitica.utils import refrescar_progreso_empresarial
+            if refrescar_progreso_empresarial():
+                calentadas += 1
+        return {'status': 'success', 'calentadas': calentadas}
+    except Exception as e:
+        return {
+            'status': 'error',
+            'message': f'Error al calentar cache: {str(e)}'
+        }
+    finally:
+        cache.delete(slot)
+
+
+def programar_calentamiento(capacitacion_id=None, colaboradores_ids=None, progreso_empresarial=False):
+    """
+    Encola `calentar_cache` cuando la transacción en curso se confirme
+    (inmediatamente si no hay transacción). Sin CACHE_CALENTAMIENTO_ACTIVO no hace
+    nada: las entradas se reconstruyen en la siguiente lectura.
+    """
+    if not calentamiento_activo():
+        return
+
+    colaboradores_ids = list(colaboradores_ids or ())
+
+    def encolar():
+        try:
+            calentar_cache.delay(
+                capacitacion_id=capacitacion_id,
+                colaboradores_ids=colaboradores_ids,
+                progreso_empresarial=progreso_empresarial,
+            )
+        except Exception as e:
+            # Sin broker el cache se reconstruye en la siguiente lectura
+            logger.warning('No se pudo encolar el calentamiento de cache: %s', e)
+
+    transaction.on_commit(encolar)
@@ -18,7 +18,8 @@ Para ejecutar un test específico:
     python manage.py test capacitaciones.tests.TestCapacitacionDetail
 """
 
-from django.test import TestCase, TransactionTestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.core.cache import cache
 from django.db.models import Count, Prefetch
 from analitica.models import Epresa
 from capacitaciones.models import (
@@ -35,9 +36,52 @@ from usuarios.models import Colaboradores, Cargo, Niveles, Regional
 from analitica.models import Centroop, Proyecto, Unidadnegocio
 from rest_framework.test import APIClient
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 
+def _crear_capacitacion(titulo, modulos=1, lecciones=2):
+    """Capacitación nueva con `modulos` × `lecciones`; cada lección con una pregunta (una respuesta correcta)"""
+    capacitacion = Capacitaciones.objects.create(
+        titulo=titulo, descripcion='test', imagen='', estado=1, tipo='test',
+        fecha_inicio=timezone.now(), fecha_fin=timezone.now()
+    )
+    for m in range(modulos):
+        modulo = Modulos.objects.create(nombremodulo=f'{titulo} M{m}', idcapacitacion=capacitacion)
+        for l in range(lecciones):
+            leccion = Lecciones.objects.create(
+                tituloleccion=f'{titulo} L{m}{l}', tipoleccion='formulario', url='', idmodulo=modulo
+            )
+            pregunta = PreguntasLecciones.objects.create(
+                pregunta='¿?', tipopregunta='unica', urlmultimedia='', id_leccion=leccion
+            )
+            Respuestas.objects.create(idpregunta=pregunta, valor='si', escorrecto=1, urlimagen='')
+            Respuestas.objects.create(idpregunta=pregunta, valor='no', escorrecto=0, urlimagen='')
+    return capacitacion
+
+
+def _crear_colaborador(cc='900001'):
+    """Colaborador nuevo con su cadena Empresa → Unidad → Proyecto → Centro OP y cargo"""
+    empresa = Epresa.objects.create(nitempresa=cc, nombre_empresa=f'Empresa {cc}', estadoempresa=1)
+    unidad = Unidadnegocio.objects.create(
+        nombreunidad=f'Unidad {cc}', descripcionunidad='test', estadounidad=1, id_empresa=empresa
+    )
+    proyecto = Proyecto.objects.create(nombreproyecto=f'Proyecto {cc}', estadoproyecto=1, id_unidad=unidad)
+    centro = Centroop.objects.create(nombrecentrop=f'Centro {cc}', estadocentrop=1, id_proyecto=proyecto)
+    return Colaboradores.objects.create(
+        cccolaborador=cc, nombrecolaborador='Test', apellidocolaborador=cc,
+        centroop=centro, cargocolaborador=Cargo.objects.create(nombrecargo='Test')
+    )
+
+
+def _usuario_con_colaborador(cc='900001'):
+    """Usuario nuevo con colaborador y cadena organizacional (ver _crear_colaborador)"""
+    from usuarios.models import Usuarios
+    return Usuarios.objects.create(
+        usuario=f'test{cc}', password='x', idcolaboradoru=_crear_colaborador(cc), tipousuario=0
+    )
+
+
 class TestCapacitacionDetail(TransactionTestCase):
     """Tests para el endpoint CapacitacionDetailView optimizado"""
     
@@ -348,3 +392,1119 @@ class TestManageColaboradores(TransactionTestCase):
         exists_col1 = progresoCapacitaciones.objects.filter(capacitacion=self.capacitacion, colaborador_id=self.col1.idcolaborador).exists()
         self.assertTrue(exists_col2)
         self.assertFalse(exists_col1)
+
+
+class TestRollupProgreso(TestCase):
+    """Tests para el rollup agregado de progreso (módulo y capacitación)"""
+
+    def setUp(self):
+        colaborador = _crear_colaborador()
+        capacitacion = _crear_capacitacion('Rollup', lecciones=3)
+        self.inscripcion = progresoCapacitaciones.objects.create(
+            capacitacion=capacitacion, colaborador=colaborador, completada=False, progreso=0
+        )
+        self.modulo = Modulos.objects.get(idcapacitacion=capacitacion)
+        l0, l1, _ = Lecciones.objects.filter(idmodulo=self.modulo).order_by('id')
+        progresolecciones.objects.create(idcolaborador=colaborador, idleccion=l0, progreso=100, completada=1)
+        progresolecciones.objects.create(idcolaborador=colaborador, idleccion=l1, progreso=40, completada=0)
+
+    def test_rollup_coincide_con_recorrido(self):
+        """El agregado SUM/COUNT produce el mismo promedio que el recorrido lección por lección"""
+        from capacitaciones.utils import actualizar_progreso_modulo
+
+        colaborador_id = self.inscripcion.colaborador_id
+        lecciones = list(Lecciones.objects.filter(idmodulo=self.modulo))
+
+        progresos = {
+            p.idleccion_id: p
+            for p in progresolecciones.objects.filter(idcolaborador_id=colaborador_id, idleccion__in=lecciones)
+        }
+        total = sum(float(progresos[l.id].progreso) for l in lecciones if l.id in progresos)
+        esperado = round(total / len(lecciones), 2)
+        self.assertEqual(esperado, 46.67)
+
+        # Primera llamada asegura que las filas de módulo/capacitación existen
+        actualizar_progreso_modulo(colaborador_id, self.modulo)
+        # Con las filas creadas: 2 agregados + 2 UPDATE, sin importar cuántas lecciones haya
+        with self.assertNumQueries(4):
+            data = actualizar_progreso_modulo(colaborador_id, self.modulo)
+
+        self.assertEqual(data['progreso_modulo'], esperado)
+        prog = progresoModulo.objects.get(colaborador_id=colaborador_id, modulo=self.modulo)
+        self.assertEqual(float(prog.progreso), esperado)
+
+
+class TestArbolProgreso(TestCase):
+    """Tests del árbol de progreso serializado desde mapas precargados"""
+
+    def setUp(self):
+        from capacitaciones.utils import actualizar_progreso_modulo
+
+        colaborador = _crear_colaborador()
+        capacitacion = _crear_capacitacion('Árbol', modulos=2)
+        self.inscripcion = progresoCapacitaciones.objects.create(
+            capacitacion=capacitacion, colaborador=colaborador, completada=False, progreso=0
+        )
+        l0, l1, l2, _ = Lecciones.objects.filter(idmodulo__idcapacitacion=capacitacion).order_by('id')
+        progresolecciones.objects.create(idcolaborador=colaborador, idleccion=l0, progreso=100, completada=1)
+        progresolecciones.objects.create(idcolaborador=colaborador, idleccion=l2, progreso=30, completada=0)
+        actualizar_progreso_modulo(colaborador.idcolaborador, l0.idmodulo)
+        actualizar_progreso_modulo(colaborador.idcolaborador, l2.idmodulo)
+
+    def test_mapas_producen_la_misma_salida(self):
+        """Con estructura prefetched y mapas de progreso la salida es idéntica y las queries no crecen"""
+        from capacitaciones.serializers import CapacitacionProgresoSerializer
+        from capacitaciones.utils import capacitacion_con_progreso, contexto_progreso_colaborador
+
+        colaborador = self.inscripcion.colaborador
+        capacitacion_id = self.inscripcion.capacitacion_id
+        esperado = CapacitacionProgresoSerializer(
+            Capacitaciones.objects.get(pk=capacitacion_id),
+            context={'colaborador': colaborador}
+        ).data
+
+        # capacitación + progreso + módulos + lecciones + preguntas + respuestas + 2 mapas
+        with self.assertNumQueries(8):
+            capacitacion = capacitacion_con_progreso(capacitacion_id, colaborador)
+            data = CapacitacionProgresoSerializer(
+                capacitacion,
+                context=contexto_progreso_colaborador(colaborador, [capacitacion_id])
+            ).data
+
+        self.assertEqual(data, esperado)
+        self.assertEqual(len(data['modulos']), 2)
+
+
+class TestConteosInscritos(TestCase):
+    """Tests de los conteos de inscritos anotados en el listado de administración"""
+
+    def setUp(self):
+        colaboradores = [_crear_colaborador(f'90000{i}') for i in range(3)]
+        self.capacitaciones = [_crear_capacitacion(f'Conteos {i}', lecciones=1) for i in range(3)]
+        con_todos, con_uno, _ = self.capacitaciones
+        for i, colaborador in enumerate(colaboradores):
+            progresoCapacitaciones.objects.create(
+                capacitacion=con_todos, colaborador=colaborador, completada=i == 0, progreso=100 if i == 0 else 0
+            )
+        progresoCapacitaciones.objects.create(
+            capacitacion=con_uno, colaborador=colaboradores[0], completada=False, progreso=0
+        )
+
+    def test_conteos_anotados_iguales_a_los_calculados(self):
+        """El listado se arma en una query y los conteos coinciden con los del fallback"""
+        from capacitaciones.serializers import capacitacionSerializer
+        from capacitaciones.utils import anotar_inscritos
+
+        capacitaciones = Capacitaciones.objects.filter(
+            id__in=[c.id for c in self.capacitaciones]
+        ).order_by('id')
+
+        esperado = capacitacionSerializer(capacitaciones, many=True).data
+        with self.assertNumQueries(1):
+            data = capacitacionSerializer(anotar_inscritos(capacitaciones), many=True).data
+
+        self.assertEqual(data, esperado)
+        self.assertEqual(
+            [(c['total_colaboradores'], c['completados']) for c in data], [(3, 1), (1, 0), (0, 0)]
+        )
+
+
+class TestInscritosPaginados(TestCase):
+    """Tests de la paginación por cursor de los inscritos de una capacitación"""
+
+    def test_recorrer_paginas_devuelve_todos_sin_repetir(self):
+        """Las páginas encadenadas por cursor cubren exactamente a los inscritos"""
+        from core.paginacion import paginar_por_cursor
+
+        capacitacion = _crear_capacitacion('Inscritos', lecciones=1)
+        for i in range(5):
+            progresoCapacitaciones.objects.create(
+                capacitacion=capacitacion, colaborador=_crear_colaborador(f'90000{i}'),
+                completada=False, progreso=0
+            )
+        # Un colaborador no inscrito no debe aparecer
+        _crear_colaborador('900009')
+
+        colaboradores = Colaboradores.objects.filter(
+            idcolaborador__in=progresoCapacitaciones.objects.filter(
+                capacitacion_id=capacitacion.id
+            ).values('colaborador_id')
+        )
+        esperado = list(colaboradores.order_by('idcolaborador').values_list('idcolaborador', flat=True))
+        self.assertEqual(len(esperado), 5)
+
+        vistos, cursor = [], None
+        while True:
+            filas, cursor = paginar_por_cursor(colaboradores, ('idcolaborador',), cursor=cursor, page_size=2)
+            vistos += [c.idcolaborador for c in filas]
+            if cursor is None:
+                break
+
+        self.assertEqual(vistos, esperado)
+
+    def test_cursor_invalido(self):
+        from core.paginacion import CursorInvalido, codificar_cursor, decodificar_cursor
+
+        self.assertEqual(decodificar_cursor(codificar_cursor([5, 'x']), 2), [5, 'x'])
+        with self.assertRaises(CursorInvalido):
+            decodificar_cursor('no-es-un-cursor', 1)
+        with self.assertRaises(CursorInvalido):
+            decodificar_cursor(codificar_cursor([1, 2]), 1)
+
+
+class TestRepresentacionParcial(TestCase):
+    """Tests de ?fields= / ?view=summary en el detalle de capacitación"""
+
+    def test_resumen_sin_arbol_y_campos_pedidos(self):
+        """El resumen no prefetchea módulos y conserva solo los campos pedidos"""
+        import gzip
+        import json
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from core.campos import CamposInvalidos, campos_solicitados
+        from capacitaciones.serializers import CapacitacionEstructuraSerializer
+        from capacitaciones.utils import cachear_detalle_capacitacion
+
+        capacitacion = _crear_capacitacion('Parcial', modulos=2)
+
+        def pedir(**params):
+            return campos_solicitados(Request(APIRequestFactory().get('/', params)), CapacitacionEstructuraSerializer)
+
+        self.assertIsNone(pedir())
+        self.assertEqual(pedir(fields='titulo, id'), ('id', 'titulo'))
+        with self.assertRaises(CamposInvalidos):
+            pedir(fields='id,colaboradores')
+
+        resumen = pedir(view='summary')
+        self.assertNotIn('modulos', resumen)
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            cache.clear()
+            # Una query para la capacitación con su conteo, ninguna para el árbol
+            with self.assertNumQueries(1):
+                renderizada = cachear_detalle_capacitacion(capacitacion.id, campos=resumen)
+            completa = cachear_detalle_capacitacion(capacitacion.id)
+
+        def cuerpo(renderizada):
+            datos = renderizada['cuerpo']
+            return json.loads(gzip.decompress(datos) if renderizada['gzip'] else datos)
+
+        parcial = cuerpo(renderizada)
+        self.assertEqual(tuple(parcial), resumen)
+        # Los campos pedidos valen lo mismo que en la representación completa
+        self.assertEqual(parcial, {campo: cuerpo(completa)[campo] for campo in resumen})
+        self.assertEqual(len(cuerpo(completa)['modulos']), 2)
+
+
+class TestUpsertProgreso(TestCase):
+    """Tests del upsert nativo y monótono de progreso de lecciones"""
+
+    def setUp(self):
+        self.colaborador = _crear_colaborador()
+        capacitacion = _crear_capacitacion('Upsert')
+        progresoCapacitaciones.objects.create(
+            capacitacion=capacitacion, colaborador=self.colaborador, completada=False, progreso=0
+        )
+        self.leccion = Lecciones.objects.filter(idmodulo__idcapacitacion=capacitacion).first()
+
+    def test_upsert_no_baja_progreso_ni_desmarca(self):
+        """Una sola sentencia por escritura; el progreso nunca baja y completada no se pierde"""
+        from capacitaciones.utils import upsert_progreso_lecciones
+
+        colaborador_id = self.colaborador.idcolaborador
+        with self.assertNumQueries(1):
+            upsert_progreso_lecciones([(colaborador_id, self.leccion.id, 100, True, None)])
+        upsert_progreso_lecciones([(colaborador_id, self.leccion.id, 10, False, None)])
+
+        prog = progresolecciones.objects.get(idcolaborador_id=colaborador_id, idleccion=self.leccion)
+        self.assertEqual(float(prog.progreso), 100)
+        self.assertTrue(prog.completada)
+        self.assertIsNotNone(prog.fecha_completado)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestProgresoGuardado(TestCase):
+    """El progreso reportado es el que quedó guardado tras el merge monótono"""
+
+    def test_valor_menor_reporta_el_guardado(self):
+        from capacitaciones.utils import actualizar_progreso_leccion
+
+        colaborador = _crear_colaborador()
+        cache.clear()
+        leccion = Lecciones.objects.select_related('idmodulo').filter(
+            idmodulo__idcapacitacion=_crear_capacitacion('Guardado')
+        ).first()
+
+        actualizar_progreso_leccion(colaborador.idcolaborador, leccion, 100, True)
+        data = actualizar_progreso_leccion(colaborador.idcolaborador, leccion, 0, False)
+
+        self.assertEqual(data['progreso_leccion'], 100)
+        self.assertTrue(data['leccion_completada'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestResponderYCompletar(TestCase):
+    """Modo combinado responder + completar_leccion de ResponderCuestionarioView"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = _usuario_con_colaborador()
+        self.colaborador = self.usuario.idcolaboradoru
+        self.capacitacion = _crear_capacitacion('Responder y completar')
+        progresoCapacitaciones.objects.create(
+            capacitacion=self.capacitacion, colaborador=self.colaborador, completada=False, progreso=0
+        )
+        self.leccion = Lecciones.objects.filter(idmodulo__idcapacitacion=self.capacitacion).order_by('id').first()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.usuario)
+
+    def _responder(self, correcta):
+        from unittest import mock
+        from capacitaciones import utils, views
+
+        respuesta_id = Respuestas.objects.get(
+            idpregunta__id_leccion=self.leccion, escorrecto=1 if correcta else 0
+        ).id
+        with mock.patch.object(utils, 'actualizar_progreso_modulo',
+                               wraps=utils.actualizar_progreso_modulo) as rollup, \
+                mock.patch.object(views, 'invalidate_capacitacion_cache',
+                                  wraps=views.invalidate_capacitacion_cache) as invalidacion:
+            respuesta = self.client.post(
+                reverse('responder-cuestionario', kwargs={'leccion_id': self.leccion.id}),
+                {'respuestas': [respuesta_id], 'completar_leccion': True},
+                format='json'
+            )
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        self.assertEqual(rollup.call_count, 1)
+        self.assertEqual(invalidacion.call_count, 1)
+        return respuesta.data
+
+    def _leccion_en_snapshot(self, data):
+        return next(
+            leccion for modulo in data['capacitacion']['modulos']
+            for leccion in modulo['lecciones'] if leccion['leccion_id'] == self.leccion.id
+        )
+
+    def test_aprobado_completa_la_leccion(self):
+        data = self._responder(correcta=True)
+        self.assertTrue(data['aprobada'])
+        self.assertTrue(data['leccion_completada'])
+        self.assertEqual(data['progreso_leccion'], 100)
+        self.assertTrue(self._leccion_en_snapshot(data)['completada'])
+
+    def test_reprobado_no_completa(self):
+        data = self._responder(correcta=False)
+        self.assertFalse(data['aprobada'])
+        self.assertFalse(data['leccion_completada'])
+        self.assertEqual(data['progreso_leccion'], 0)
+        self.assertFalse(self._leccion_en_snapshot(data)['completada'])
+
+    def test_reintento_reprobado_conserva_la_completada(self):
+        self._responder(correcta=True)
+        data = self._responder(correcta=False)
+        self.assertFalse(data['aprobada'])
+        self.assertTrue(data['leccion_completada'])
+        self.assertEqual(data['progreso_leccion'], 100)
+        self.assertTrue(self._leccion_en_snapshot(data)['completada'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestProgresoLote(TestCase):
+    """Tests de la ingesta por lotes de eventos de progreso"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = _usuario_con_colaborador()
+        self.colaborador = self.usuario.idcolaboradoru
+        self.cap_a = _crear_capacitacion('Lote A', modulos=2)
+        self.cap_b = _crear_capacitacion('Lote B')
+        self.cap_ajena = _crear_capacitacion('Lote sin inscripción')
+        for capacitacion in (self.cap_a, self.cap_b):
+            progresoCapacitaciones.objects.create(
+                capacitacion=capacitacion, colaborador=self.colaborador, completada=False, progreso=0
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.usuario)
+
+    def _lecciones(self, capacitacion):
+        return list(Lecciones.objects.filter(idmodulo__idcapacitacion=capacitacion).order_by('id'))
+
+    def _enviar(self, eventos):
+        return self.client.post(reverse('registrar-progreso-lote'), {'eventos': eventos}, format='json')
+
+    def _progreso(self, leccion):
+        return progresolecciones.objects.get(idcolaborador=self.colaborador, idleccion=leccion)
+
+    def test_lote_de_varias_capacitaciones_con_un_rollup_por_modulo(self):
+        """Una sola validación de inscripción y un rollup por módulo y capacitación afectados"""
+        from unittest import mock
+        from capacitaciones import utils
+
+        a0, a1, a2, _ = self._lecciones(self.cap_a)
+        b0 = self._lecciones(self.cap_b)[0]
+        eventos = [
+            {'leccion_id': a0.id, 'progreso': 20}, {'leccion_id': a0.id, 'progreso': 50},
+            {'leccion_id': a1.id, 'progreso': 30}, {'leccion_id': a2.id, 'progreso': 10},
+            {'leccion_id': b0.id, 'progreso': 40, 'completada': True},
+        ]
+
+        with mock.patch.object(utils, '_recalcular_modulo', wraps=utils._recalcular_modulo) as modulos, \
+                mock.patch.object(utils, 'actualizar_progreso_capacitacion',
+                                  wraps=utils.actualizar_progreso_capacitacion) as capacitaciones, \
+                mock.patch.object(progresoCapacitaciones.objects, 'filter',
+                                  wraps=progresoCapacitaciones.objects.filter) as inscripciones:
+            respuesta = self._enviar(eventos)
+
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        self.assertEqual(respuesta.data['procesados'], 4)
+        # La inscripción de todas las capacitaciones se valida en una sola consulta
+        validaciones = [c for c in inscripciones.call_args_list if 'capacitacion_id__in' in c.kwargs]
+        self.assertEqual(len(validaciones), 1)
+        self.assertEqual(set(validaciones[0].kwargs['capacitacion_id__in']), {self.cap_a.id, self.cap_b.id})
+        # 3 módulos (2 de A, 1 de B), 2 capacitaciones
+        self.assertEqual(modulos.call_count, 3)
+        self.assertEqual(capacitaciones.call_count, 2)
+        self.assertEqual(float(self._progreso(a0).progreso), 50)
+        # completada fuerza el 100 aunque el cliente envíe otro valor
+        self.assertEqual(float(self._progreso(b0).progreso), 100)
+        self.assertTrue(self._progreso(b0).completada)
+
+    def test_eventos_atrasados_no_bajan_el_progreso(self):
+        a0 = self._lecciones(self.cap_a)[0]
+        self._enviar([{'leccion_id': a0.id, 'progreso': 100, 'completada': True}])
+
+        respuesta = self._enviar([{'leccion_id': a0.id, 'progreso': 15}])
+
+        self.assertEqual(respuesta.status_code, 200)
+        progreso = self._progreso(a0)
+        self.assertEqual(float(progreso.progreso), 100)
+        self.assertTrue(progreso.completada)
+
+    def test_timestamp_del_cliente_acotado(self):
+        """La fecha del cliente vale si es plausible; futura o demasiado vieja se reemplaza por la del servidor"""
+        from datetime import timedelta
+
+        a0, a1, a2, a3 = self._lecciones(self.cap_a)
+        ahora = timezone.now()
+        ayer = ahora - timedelta(days=1)
+        respuesta = self._enviar([
+            {'leccion_id': a0.id, 'completada': True, 'timestamp': ayer.isoformat()},
+            {'leccion_id': a1.id, 'completada': True, 'timestamp': (ahora + timedelta(days=365)).isoformat()},
+            {'leccion_id': a2.id, 'completada': True, 'timestamp': (ahora - timedelta(days=3650)).isoformat()},
+            {'leccion_id': a3.id, 'completada': True, 'timestamp': (ahora + timedelta(seconds=30)).isoformat()},
+        ])
+
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        self.assertLess(abs(self._progreso(a0).fecha_completado - ayer), timedelta(seconds=1))
+        for leccion in (a1, a2, a3):
+            fecha = self._progreso(leccion).fecha_completado
+            self.assertLessEqual(fecha, timezone.now())
+            self.assertGreaterEqual(fecha, ahora - timedelta(seconds=5))
+
+    def test_capacitacion_sin_inscripcion_se_rechaza(self):
+        ajena = self._lecciones(self.cap_ajena)[0]
+        a0 = self._lecciones(self.cap_a)[0]
+
+        respuesta = self._enviar([{'leccion_id': ajena.id, 'progreso': 60}, {'leccion_id': a0.id, 'progreso': 60}])
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['procesados'], 1)
+        self.assertEqual(
+            respuesta.data['rechazados'], [{'leccion_id': ajena.id, 'motivo': 'No inscrito en la capacitación'}]
+        )
+        self.assertFalse(progresolecciones.objects.filter(idcolaborador=self.colaborador, idleccion=ajena).exists())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestEtagMisCapacitaciones(TestCase):
+    """304 de MisCapacitacionesListView sin reconstruir el listado aunque los datos hayan vencido"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = _usuario_con_colaborador()
+        self.capacitacion = _crear_capacitacion('ETag', lecciones=1)
+        progresoCapacitaciones.objects.create(
+            capacitacion=self.capacitacion, colaborador=self.usuario.idcolaboradoru, completada=False, progreso=0
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.usuario)
+
+    def _pedir(self, etag):
+        from unittest import mock
+        from capacitaciones import views
+
+        with mock.patch.object(views, 'cachear_mis_capacitaciones',
+                               wraps=views.cachear_mis_capacitaciones) as reconstruir:
+            respuesta = self.client.get(reverse('mis-capacitaciones'), HTTP_IF_NONE_MATCH=etag)
+        return respuesta, reconstruir.call_count
+
+    def test_datos_vencidos_responden_304_sin_reconstruir(self):
+        from capacitaciones.utils import clave_mis_capacitaciones
+
+        etag = self.client.get(reverse('mis-capacitaciones'))['ETag']
+        # Vence la entrada de datos (TTL corto); el ETag sigue guardado aparte
+        cache.delete(clave_mis_capacitaciones(self.usuario.idcolaboradoru.idcolaborador))
+
+        with self.assertNumQueries(0):
+            respuesta, reconstrucciones = self._pedir(etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta['ETag'], etag)
+        self.assertEqual(reconstrucciones, 0)
+
+    def test_capacitacion_invalidada_reconstruye(self):
+        from capacitaciones.utils import invalidate_capacitacion_cache
+
+        etag = self.client.get(reverse('mis-capacitaciones'))['ETag']
+        invalidate_capacitacion_cache(capacitacion_id=self.capacitacion.id)
+
+        respuesta, reconstrucciones = self._pedir(etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertEqual(reconstrucciones, 1)
+
+
+class TestEstructuraCapacitacion(TestCase):
+    """Tests del catálogo versionado de estructura de capacitaciones"""
+
+    def setUp(self):
+        cache.clear()
+        self.capacitacion = _crear_capacitacion('Estructura', modulos=2)
+
+    def test_catalogo_cacheado_y_versionado(self):
+        """La segunda lectura no toca la BD y reconstruir publica una versión nueva"""
+        from capacitaciones.utils import (
+            obtener_estructura_capacitacion, reconstruir_estructura_capacitacion
+        )
+
+        estructura = obtener_estructura_capacitacion(self.capacitacion.id)
+        modulos = list(Modulos.objects.filter(idcapacitacion=self.capacitacion).values_list('id', flat=True))
+        self.assertEqual(len(modulos), 2)
+        self.assertEqual(sorted(estructura['modulos']), sorted(modulos))
+
+        with self.assertNumQueries(0):
+            self.assertIs(obtener_estructura_capacitacion(self.capacitacion.id), estructura)
+
+        nueva = reconstruir_estructura_capacitacion(self.capacitacion.id)
+        self.assertNotEqual(nueva['version'], estructura['version'])
+        self.assertIs(obtener_estructura_capacitacion(self.capacitacion.id), nueva)
+
+    @override_settings(CACHE_ESTRUCTURAS_LOCALES_MAX=2)
+    def test_memoria_local_acotada(self):
+        """La copia en memoria del proceso descarta la capacitación menos usada"""
+        from capacitaciones.utils import _MemoriaLocal
+
+        memoria = _MemoriaLocal('CACHE_ESTRUCTURAS_LOCALES_MAX', 256)
+        memoria[1] = 'a'
+        memoria[2] = 'b'
+        memoria.get(1)
+        memoria[3] = 'c'
+        self.assertEqual(len(memoria), 2)
+        self.assertIsNone(memoria.get(2))
+        self.assertEqual(memoria.get(1), 'a')
+
+    def test_token_corto_sin_cache_compartido(self):
+        """Con cache por proceso el token de versión vence pronto; con Redis dura el TTL completo"""
+        from capacitaciones.utils import _ttl_version_estructura
+
+        locmem = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        with override_settings(CACHES={
+            'default': {'BACKEND': 'core.metricas_cache.MedicionCache', 'OPTIONS': {'DESTINO': 'local'}},
+            'local': locmem,
+        }, CACHE_TTL_ESTRUCTURA_SIN_COMPARTIR=60):
+            self.assertEqual(_ttl_version_estructura(), 60)
+        with override_settings(CACHES={
+            'default': {'BACKEND': 'core.metricas_cache.MedicionCache', 'OPTIONS': {'DESTINO': 'niveles'}},
+            'niveles': {'BACKEND': 'core.cache.DosNivelesCache', 'OPTIONS': {'L2': 'compartido'}},
+            'compartido': _redis_fake(),
+        }, CACHE_TTL_ESTRUCTURA_CAPACITACION=3600):
+            self.assertEqual(_ttl_version_estructura(), 3600)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestRecomputeProgreso(TestCase):
+    """Tests del comando recompute_progreso (recálculo vectorizado)"""
+
+    def setUp(self):
+        try:
+            import pandas  # noqa: F401
+        except ImportError:
+            self.skipTest('pandas no disponible')
+        cache.clear()
+        self.colaborador = _crear_colaborador()
+        self.capacitacion = _crear_capacitacion('Recompute', modulos=2)
+        progresoCapacitaciones.objects.create(
+            capacitacion=self.capacitacion, colaborador=self.colaborador, completada=False, progreso=0
+        )
+        self.lecciones = list(
+            Lecciones.objects.filter(idmodulo__idcapacitacion=self.capacitacion).order_by('id')
+        )
+
+    def _recalcular(self):
+        from io import StringIO
+        from django.core.management import call_command
+        call_command('recompute_progreso', capacitacion=self.capacitacion.id, stdout=StringIO())
+
+    def _guardar(self, leccion, progreso, completada):
+        progresolecciones.objects.create(
+            idcolaborador=self.colaborador, idleccion=leccion, progreso=progreso, completada=completada
+        )
+
+    def test_coincide_con_rollup_incremental(self):
+        from capacitaciones.utils import actualizar_progreso_modulo
+
+        l0, l1, l2, _ = self.lecciones
+        self._guardar(l0, 100, 1)
+        self._guardar(l1, 100, 1)
+        self._guardar(l2, 30, 0)
+        for leccion in (l0, l2):
+            actualizar_progreso_modulo(self.colaborador.idcolaborador, leccion.idmodulo)
+        esperado_modulos = dict(progresoModulo.objects.filter(
+            colaborador=self.colaborador, modulo__idcapacitacion=self.capacitacion
+        ).values_list('modulo_id', 'progreso'))
+        esperado = progresoCapacitaciones.objects.get(
+            capacitacion=self.capacitacion, colaborador=self.colaborador
+        )
+
+        progresoModulo.objects.filter(colaborador=self.colaborador, modulo_id__in=esperado_modulos).delete()
+        progresoCapacitaciones.objects.filter(pk=esperado.pk).update(progreso=0, completada=True)
+        self._recalcular()
+
+        modulos = dict(progresoModulo.objects.filter(
+            colaborador=self.colaborador, modulo__idcapacitacion=self.capacitacion
+        ).values_list('modulo_id', 'progreso'))
+        self.assertEqual(
+            {k: float(v) for k, v in modulos.items()}, {k: float(v) for k, v in esperado_modulos.items()}
+        )
+        inscripcion = progresoCapacitaciones.objects.get(pk=esperado.pk)
+        self.assertEqual(float(inscripcion.progreso), float(esperado.progreso))
+        self.assertFalse(inscripcion.completada)
+
+    def test_ignora_estructura_cacheada_vieja(self):
+        """Una lección agregada sin republicar el catálogo igual cuenta en el recálculo"""
+        from capacitaciones.utils import obtener_estructura_capacitacion
+
+        obtener_estructura_capacitacion(self.capacitacion.id)
+        modulo = self.lecciones[0].idmodulo
+        Lecciones.objects.create(tituloleccion='Nueva', tipoleccion='video', url='', idmodulo=modulo)
+        for leccion in self.lecciones[:2]:
+            self._guardar(leccion, 100, 1)
+
+        self._recalcular()
+
+        fila = progresoModulo.objects.get(colaborador=self.colaborador, modulo=modulo)
+        self.assertAlmostEqual(float(fila.progreso), round(200 / 3, 2))
+        self.assertFalse(fila.completada)
+        self.assertEqual(len(obtener_estructura_capacitacion(self.capacitacion.id)['lecciones_por_modulo'][modulo.id]), 3)
+
+
+class TestCalificarCuestionario(SimpleTestCase):
+    """Tests de la calificación en memoria con clave compilada"""
+
+    def test_califica_sin_bd_e_ignora_respuestas_ajenas(self):
+        """Cuenta aciertos por respuesta correcta y descarta ids de otras lecciones"""
+        from capacitaciones.utils import calificar_cuestionario
+
+        clave = {
+            'correctas': {1: frozenset({10}), 2: frozenset({20})},
+            'pregunta_por_respuesta': {10: 1, 11: 1, 20: 2, 21: 2},
+        }
+
+        resultado = calificar_cuestionario(clave, [10, '21', 99, 'x'])
+
+        self.assertEqual(resultado['total_preguntas'], 2)
+        self.assertEqual(resultado['respuestas_correctas'], 1)
+        self.assertEqual(resultado['porcentaje_acierto'], 50)
+        self.assertFalse(resultado['aprobada'])
+        self.assertEqual(sorted(resultado['respuestas']), [(1, 10), (2, 21)])
+
+    def test_empaquetado_de_respuestas_ida_y_vuelta(self):
+        """Las respuestas del intento se guardan compactas y se recuperan igual"""
+        from capacitaciones.utils import desempaquetar_respuestas, empaquetar_respuestas
+
+        empaquetadas = empaquetar_respuestas([(2, 21), (1, 11), (1, 10)])
+
+        self.assertEqual(empaquetadas, '1:10,11;2:21')
+        self.assertEqual(desempaquetar_respuestas(empaquetadas), {1: [10, 11], 2: [21]})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestCompletadosEnEscritura(TestCase):
+    """Las filas de completado_capacitacion se escriben al inscribir/completar, no al leer"""
+
+    def setUp(self):
+        cache.clear()
+        self.colaborador = _crear_colaborador()
+        self.capacitacion = _crear_capacitacion('Completados')
+        progresoCapacitaciones.objects.create(
+            capacitacion=self.capacitacion, colaborador=self.colaborador, completada=False, progreso=0
+        )
+        self.lecciones = list(
+            Lecciones.objects.filter(idmodulo__idcapacitacion=self.capacitacion).order_by('id')
+        )
+
+    def _fila(self):
+        from capacitaciones.models import CompletadoCapacitacion
+        return CompletadoCapacitacion.objects.filter(
+            colaborador_id=self.colaborador.idcolaborador, capacitacion_id=self.capacitacion.id
+        ).first()
+
+    def test_lectura_no_crea_filas(self):
+        from capacitaciones.utils import obtener_completados
+
+        progresolecciones.objects.create(
+            idcolaborador=self.colaborador, idleccion=self.lecciones[0], progreso=100, completada=1
+        )
+        completados = obtener_completados(self.colaborador.idcolaborador, [self.capacitacion.id])
+
+        self.assertEqual(completados, {self.capacitacion.id: (1, 2)})
+        self.assertIsNone(self._fila())
+
+    def test_inscripcion_y_leccion_completada_escriben_la_fila(self):
+        from capacitaciones.utils import (
+            actualizar_progreso_leccion, obtener_completados, recalcular_completados_capacitacion
+        )
+
+        self.assertEqual(recalcular_completados_capacitacion(self.capacitacion.id), 1)
+        self.assertEqual((self._fila().lecciones_completadas, self._fila().total_lecciones), (0, 2))
+
+        actualizar_progreso_leccion(self.colaborador.idcolaborador, self.lecciones[1], 100, True)
+        self.assertEqual(self._fila().lecciones_completadas, 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                obtener_completados(self.colaborador.idcolaborador, [self.capacitacion.id]),
+                {self.capacitacion.id: (1, 2)}
+            )
+
+
+class TestBitmapCompletadas(SimpleTestCase):
+    """Tests del bitset compacto de lecciones completadas"""
+
+    def test_bitmap_marca_posiciones_por_orden_de_leccion(self):
+        """Cada lección ocupa un bit según su posición en la lista ordenada"""
+        from capacitaciones.utils import empaquetar_bitmap, leccion_en_bitmap
+
+        lecciones = [3, 5, 8, 13, 21, 34, 55, 89, 144]
+        bitmap = empaquetar_bitmap(lecciones, {5, 144})
+
+        self.assertEqual(len(bitmap), 2)
+        self.assertEqual(
+            [posicion for posicion in range(len(lecciones)) if leccion_en_bitmap(bitmap, posicion)],
+            [1, 8]
+        )
+        self.assertFalse(leccion_en_bitmap(bitmap, 20))
+
+
+def _redis_fake():
+    """Alias django_redis sobre fakeredis (None si fakeredis no está instalado)"""
+    try:
+        import fakeredis
+    except ImportError:
+        return None
+    return {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://tests-fake:6379/1',
+        'OPTIONS': {'CONNECTION_POOL_KWARGS': {'connection_class': fakeredis.FakeConnection}},
+    }
+
+
+class TestBufferProgreso(TransactionTestCase):
+    """Tests del buffer write-behind de heartbeats sobre Redis (fakeredis)"""
+
+    databases = {'default'}
+
+    def setUp(self):
+        from unittest import mock
+
+        redis_fake = _redis_fake()
+        if redis_fake is None:
+            self.skipTest('fakeredis no instalado')
+        ajustes = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}, 'compartido': redis_fake},
+            PROGRESO_WRITE_BEHIND=True, PROGRESO_BUFFER_CACHE='compartido'
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        from capacitaciones import utils
+        self.utils = utils
+        self.cliente, _ = utils._redis_buffer()
+        self.cliente.flushdb()
+        # La BD no interesa aquí: se registra lo que se aplicaría
+        self.aplicados = []
+        aplicar = mock.patch.object(utils, 'aplicar_progreso_lecciones', side_effect=self._aplicar)
+        aplicar.start()
+        self.addCleanup(aplicar.stop)
+        self.al_aplicar = None
+
+    def _aplicar(self, pendientes):
+        if self.al_aplicar:
+            self.al_aplicar()
+        self.aplicados.append(dict(pendientes))
+        return {}
+
+    def _pendientes(self):
+        return {
+            miembro.decode(): progreso for miembro, progreso in self.cliente.zrange(
+                self.utils._clave_redis('compartido', self.utils.PROGRESO_BUFFER_PENDIENTES), 0, -1, withscores=True
+            )
+        }
+
+    def test_heartbeats_se_coalescen_al_maximo(self):
+        """Varios heartbeats del mismo par quedan en una entrada con el mayor progreso"""
+        self.assertTrue(self.utils.write_behind_activo())
+        for progreso in (10, 40, 25):
+            self.utils.encolar_progreso_leccion(7, 3, progreso)
+        self.utils.encolar_progreso_leccion(7, 4, 5)
+
+        self.assertEqual(self._pendientes(), {'7:3': 40.0, '7:4': 5.0})
+
+    def test_heartbeat_durante_el_volcado_no_se_pierde(self):
+        """Lo que llega mientras se escribe un lote queda para el siguiente volcado"""
+        self.utils.encolar_progreso_leccion(7, 3, 30)
+        self.al_aplicar = lambda: self.utils.encolar_progreso_leccion(7, 3, 60)
+
+        self.assertEqual(self.utils.volcar_progreso_pendiente(), 1)
+        self.assertEqual(self.aplicados, [{(7, 3): (30.0, False, None)}])
+        self.assertEqual(self._pendientes(), {'7:3': 60.0})
+
+        # El par sigue volcándose en los siguientes ciclos
+        self.al_aplicar = None
+        self.assertEqual(self.utils.volcar_progreso_pendiente(), 1)
+        self.utils.encolar_progreso_leccion(7, 3, 80)
+        self.assertEqual(self.utils.volcar_progreso_pendiente(), 1)
+        self.assertEqual([a[(7, 3)][0] for a in self.aplicados], [30.0, 60.0, 80.0])
+
+    def test_error_de_bd_conserva_el_lote(self):
+        """Si la escritura falla el lote no se borra y el siguiente volcado lo reintenta"""
+        self.utils.encolar_progreso_leccion(7, 3, 30)
+
+        def fallar():
+            raise RuntimeError('BD caída')
+        self.al_aplicar = fallar
+        with self.assertRaises(RuntimeError):
+            self.utils.volcar_progreso_pendiente()
+
+        self.utils.encolar_progreso_leccion(8, 1, 10)
+        self.al_aplicar = None
+        self.assertEqual(self.utils.volcar_progreso_pendiente(), 2)
+        self.assertEqual(self.aplicados, [{(7, 3): (30.0, False, None)}, {(8, 1): (10.0, False, None)}])
+        self.assertEqual(self.utils.volcar_progreso_pendiente(), 0)
+
+    def test_lock_ajeno_no_se_libera(self):
+        """Un volcado cuyo lock expiró no borra el lock que tomó otro worker"""
+        lock = self.utils._clave_redis('compartido', self.utils.PROGRESO_BUFFER_LOCK)
+        self.utils.encolar_progreso_leccion(7, 3, 30)
+
+        def expira_y_lo_toma_otro():
+            self.cliente.set(lock, b'otro-worker')
+        self.al_aplicar = expira_y_lo_toma_otro
+        self.utils.volcar_progreso_pendiente()
+
+        self.assertEqual(self.cliente.get(lock), b'otro-worker')
+        self.assertEqual(self.utils.volcar_progreso_pendiente(), 0)
+
+    def test_sin_redis_no_hay_write_behind(self):
+        with self.settings(PROGRESO_BUFFER_CACHE='default'):
+            self.assertFalse(self.utils.write_behind_activo())
+            self.assertEqual(self.utils.volcar_progreso_pendiente(), 0)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'compartido': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'l2-tests'},
+})
+class TestCacheDosNiveles(SimpleTestCase):
+    """Tests del cache L1 + L2: dos LOCATION distintas simulan dos workers"""
+
+    def setUp(self):
+        from django.core.cache import caches
+        from core.cache import DosNivelesCache
+
+        caches['compartido'].clear()
+        opciones = {'OPTIONS': {'L2': 'compartido', 'SYNC_INTERVAL': 0}}
+        self.worker_a = DosNivelesCache('tests-worker-a', opciones)
+        self.worker_b = DosNivelesCache('tests-worker-b', opciones)
+        self.worker_a._vaciar_l1()
+        self.worker_b._vaciar_l1()
+
+    def test_delete_en_un_worker_invalida_el_l1_del_otro(self):
+        """Un valor leído por B (queda en su L1) desaparece cuando A lo borra"""
+        self.worker_a.set('cap_detail', {'id': 1}, 60)
+        self.assertEqual(self.worker_b.get('cap_detail'), {'id': 1})
+
+        self.worker_a.delete('cap_detail')
+
+        self.assertIsNone(self.worker_b.get('cap_detail'))
+
+    def test_set_en_un_worker_reemplaza_el_valor_del_otro(self):
+        """B no sigue sirviendo desde su L1 un valor que A reescribió"""
+        self.worker_a.set('mis_caps', [1], 60)
+        self.assertEqual(self.worker_b.get('mis_caps'), [1])
+
+        self.worker_a.set('mis_caps', [1, 2], 60)
+
+        self.assertEqual(self.worker_b.get('mis_caps'), [1, 2])
+
+    def test_clear_vacia_el_l1_de_todos_los_workers(self):
+        """Tras clear() el journal se reinicia y los demás workers descartan su L1"""
+        self.worker_a.set('a', 1, 60)
+        self.assertEqual(self.worker_b.get('a'), 1)
+
+        self.worker_a.clear()
+
+        self.assertIsNone(self.worker_b.get('a'))
+
+    def test_invalidacion_con_redis_compartido(self):
+        """Mismo escenario con django_redis sobre fakeredis como L2"""
+        try:
+            import fakeredis
+        except ImportError:
+            self.skipTest('fakeredis no instalado')
+        from django.core.cache import caches
+        from core.cache import DosNivelesCache
+
+        redis_fake = {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': 'redis://tests-fake:6379/0',
+            'OPTIONS': {'CONNECTION_POOL_KWARGS': {'connection_class': fakeredis.FakeConnection}},
+        }
+        with self.settings(CACHES={'default': redis_fake, 'compartido': redis_fake}):
+            caches['compartido'].clear()
+            opciones = {'OPTIONS': {'L2': 'compartido', 'SYNC_INTERVAL': 0}}
+            worker_a = DosNivelesCache('tests-redis-a', opciones)
+            worker_b = DosNivelesCache('tests-redis-b', opciones)
+
+            worker_a.set('cap_detail', {'id': 1}, 60)
+            self.assertEqual(worker_b.get('cap_detail'), {'id': 1})
+            worker_a.delete('cap_detail')
+            self.assertIsNone(worker_b.get('cap_detail'))
+
+    def test_lectura_vieja_no_vuelve_a_l1_tras_la_invalidacion(self):
+        """Un get que leyó L2 antes de que otro worker escribiera no deja el valor viejo en L1"""
+        from unittest import mock
+        from django.core.cache import caches
+
+        self.worker_a.set('cap_detail', 'viejo', 60)
+        l2 = caches['compartido']
+        get_original = l2.get
+
+        def get_lento(key, *args, **kwargs):
+            valor = get_original(key, *args, **kwargs)
+            if key == 'cap_detail':
+                # Mientras B lee, A reescribe y B procesa la invalidación
+                with mock.patch.object(l2, 'get', side_effect=get_original):
+                    self.worker_a.set('cap_detail', 'nuevo', 60)
+                    self.worker_b._sincronizar()
+            return valor
+
+        with mock.patch.object(l2, 'get', side_effect=get_lento):
+            self.assertEqual(self.worker_b.get('cap_detail'), 'viejo')
+
+        self.assertEqual(self.worker_b.get('cap_detail'), 'nuevo')
+
+    def test_escritura_con_redis_en_un_round_trip(self):
+        """set y delete envían valor, contador y journal en un solo MULTI"""
+        redis_fake = _redis_fake()
+        if redis_fake is None:
+            self.skipTest('fakeredis no instalado')
+        from unittest import mock
+        import redis
+        from django.core.cache import caches
+        from core.cache import DosNivelesCache
+
+        with self.settings(CACHES={'default': redis_fake, 'compartido': redis_fake}):
+            caches['compartido'].clear()
+            opciones = {'OPTIONS': {'L2': 'compartido', 'SYNC_INTERVAL': 0}}
+            worker_a = DosNivelesCache('tests-redis-rt-a', opciones)
+            worker_b = DosNivelesCache('tests-redis-rt-b', opciones)
+            worker_a.set('mis_caps', [1], 60)
+            self.assertEqual(worker_b.get('mis_caps'), [1])
+
+            with mock.patch.object(redis.client.Pipeline, 'execute', autospec=True,
+                                   side_effect=redis.client.Pipeline.execute) as multi, \
+                    mock.patch.object(redis.Redis, 'execute_command', autospec=True,
+                                      side_effect=redis.Redis.execute_command) as directos:
+                worker_a.set('mis_caps', [1, 2], 60)
+                worker_a.delete('cap_detail')
+            self.assertEqual(multi.call_count, 2)
+            self.assertEqual(directos.call_count, 0)
+
+            self.assertEqual(worker_b.get('mis_caps'), [1, 2])
+            self.assertEqual(worker_a.get('mis_caps'), [1, 2])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestGeneracionCache(SimpleTestCase):
+    """Tests de la invalidación por generación de capacitación (solo cache, sin BD)"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidar_capacitacion_invalida_listados_dependientes(self):
+        """Un solo cambio de generación invalida el listado de cualquier inscrito"""
+        from capacitaciones.utils import (
+            get_cache_key, guardar_cache_etiquetado, invalidate_capacitacion_cache,
+            leer_cache_etiquetado
+        )
+
+        for colaborador_id in (1, 2):
+            guardar_cache_etiquetado(get_cache_key('mis_caps', colaborador_id), [colaborador_id], [10, 20], 60)
+        guardar_cache_etiquetado(get_cache_key('mis_caps', 3), [3], [20], 60)
+
+        invalidate_capacitacion_cache(capacitacion_id=10)
+
+        self.assertIsNone(leer_cache_etiquetado(get_cache_key('mis_caps', 1)))
+        self.assertIsNone(leer_cache_etiquetado(get_cache_key('mis_caps', 2)))
+        self.assertEqual(leer_cache_etiquetado(get_cache_key('mis_caps', 3)), [3])
+
+    def test_clave_de_detalle_cambia_con_la_generacion(self):
+        """La clave con capacitacion_id es estable hasta que se invalida la capacitación"""
+        from capacitaciones.utils import get_cache_key, invalidate_capacitacion_cache
+
+        clave = get_cache_key('cap_detail', 10, capacitacion_id=10)
+        self.assertEqual(get_cache_key('cap_detail', 10, capacitacion_id=10), clave)
+
+        invalidate_capacitacion_cache(capacitacion_id=10)
+
+        self.assertNotEqual(get_cache_key('cap_detail', 10, capacitacion_id=10), clave)
+
+    def test_etag_de_mis_capacitaciones_cambia_con_el_progreso(self):
+        """El ETag guardado con la entrada cambia al invalidar el progreso del colaborador"""
+        from django.test import RequestFactory
+        from capacitaciones.utils import (
+            etag_coincide, get_cache_key, guardar_cache_etiquetado, invalidate_capacitacion_cache,
+            leer_cache_etiquetado, version_progreso
+        )
+
+        clave = get_cache_key('mis_caps', 1, version_progreso(1))
+        etag = guardar_cache_etiquetado(clave, [1], [10], 60)
+        self.assertEqual(leer_cache_etiquetado(clave, con_etag=True), ([1], etag))
+        request = RequestFactory().get('/', HTTP_IF_NONE_MATCH=f'"otro", {etag}')
+        self.assertTrue(etag_coincide(request, etag))
+        # El ETag de la representación gzip (core.respuestas) también vale para el 304
+        request = RequestFactory().get('/', HTTP_IF_NONE_MATCH=etag[:-1] + '-gzip"')
+        self.assertTrue(etag_coincide(request, etag))
+
+        invalidate_capacitacion_cache(colaborador_id=1)
+
+        clave_nueva = get_cache_key('mis_caps', 1, version_progreso(1))
+        self.assertNotEqual(clave_nueva, clave)
+        self.assertNotEqual(guardar_cache_etiquetado(clave_nueva, [1], [10], 60), etag)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestCalentamientoCache(SimpleTestCase):
+    """Tests del calentamiento de cache tras escrituras (constructores simulados, sin BD)"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_calienta_solo_lo_obsoleto_y_cuenta_claves(self):
+        """Afectados primero, luego los más activos hasta el límite; lo vigente no se reconstruye"""
+        from unittest import mock
+        from capacitaciones import utils
+        from core.respuestas import renderizar_respuesta
+
+        cache.set('capacitaciones_list_admin', renderizar_respuesta([]), 60)
+        with mock.patch.object(utils, 'cachear_lista_capacitaciones') as lista, \
+                mock.patch.object(utils, 'cachear_detalle_capacitacion') as detalle, \
+                mock.patch.object(utils, 'cachear_mis_capacitaciones') as mis_caps, \
+                mock.patch.object(utils, 'colaboradores_mas_activos', return_value=[2, 1, 3]):
+            calentadas = utils.calentar_cache_capacitaciones(10, [1], max_colaboradores=2)
+
+        self.assertEqual(calentadas, 3)
+        lista.assert_not_called()
+        self.assertEqual(detalle.call_args[0][0], 10)
+        self.assertEqual([c[0][0] for c in mis_caps.call_args_list], [1, 2])
+
+    @override_settings(CACHE_CALENTAMIENTO_CONCURRENCIA=2)
+    def test_slots_limitan_tareas_simultaneas(self):
+        """Con todos los slots ocupados no se puede calentar hasta que uno se libere"""
+        from capacitaciones.utils import tomar_slot_calentamiento
+
+        slots = [tomar_slot_calentamiento(), tomar_slot_calentamiento()]
+        self.assertNotIn(None, slots)
+        self.assertIsNone(tomar_slot_calentamiento())
+
+        cache.delete(slots[0])
+        self.assertEqual(tomar_slot_calentamiento(), slots[0])
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'core.metricas_cache.MedicionCache', 'OPTIONS': {'DESTINO': 'valores'}},
+    'valores': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'metricas-tests'},
+})
+class TestMetricasCache(SimpleTestCase):
+    """Tests de las métricas de cache por familia de claves (core.metricas_cache)"""
+
+    def setUp(self):
+        from core.metricas_cache import reiniciar_metricas_cache
+
+        cache.clear()
+        reiniciar_metricas_cache()
+
+    def test_familia_de_la_clave(self):
+        from core.metricas_cache import SIN_PREFIJO, familia_clave
+
+        self.assertEqual(familia_clave('mis_caps:0cc175b9c0f1b6a831c399e269772661'), 'mis_caps')
+        self.assertEqual(familia_clave('progreso_empresarial_mes_2026_10'), 'progreso_empresarial_mes')
+        self.assertEqual(familia_clave('0cc175b9c0f1b6a831c399e269772661'), SIN_PREFIJO)
+
+    def test_cuenta_hits_misses_bytes_y_reconstrucciones(self):
+        """Un miss seguido del set de la misma clave cuenta como reconstrucción"""
+        from core.metricas_cache import leer_metricas_cache
+
+        self.assertIsNone(cache.get('cap_detail:1'))
+        cache.set('cap_detail:1', {'cuerpo': b'x' * 100, 'gzip': False}, 60)
+        cache.get('cap_detail:1')
+        cache.get_many(['cap_detail:1', 'cap_detail:2'])
+        cache.delete('mis_caps:1')
+
+        metricas = leer_metricas_cache()
+        detalle = metricas['cap_detail']
+        self.assertEqual((detalle['hits'], detalle['misses'], detalle['sets']), (2, 2, 1))
+        self.assertEqual(detalle['reconstrucciones'], 1)
+        self.assertEqual(detalle['bytes_promedio'], 100)
+        self.assertEqual(detalle['hit_ratio'], 0.5)
+        self.assertEqual(metricas['mis_caps']['deletes'], 1)
+
+    def test_valores_sin_tamano_barato_se_muestrean(self):
+        """Sólo 1 de cada METRICAS_MUESTREO valores se serializa, y cuenta por todos"""
+        import pickle
+        from unittest import mock
+        from core.metricas_cache import MedicionCache
+
+        medicion = MedicionCache('tests-muestreo', {'OPTIONS': {'DESTINO': 'default', 'METRICAS_MUESTREO': 10}})
+        valor = {'ids': list(range(50))}
+        with mock.patch('core.metricas_cache.random.random', return_value=0.5):
+            self.assertEqual(medicion._tamano(valor), 0)
+        with mock.patch('core.metricas_cache.random.random', return_value=0.05):
+            self.assertEqual(medicion._tamano(valor), 10 * len(pickle.dumps(valor, pickle.HIGHEST_PROTOCOL)))
+        self.assertEqual(medicion._tamano(b'x' * 30), 30)
+
+    def test_volcado_con_redis_en_un_pipeline(self):
+        """Con django_redis todos los contadores y las familias se vuelcan en un solo round trip"""
+        redis_fake = _redis_fake()
+        if redis_fake is None:
+            self.skipTest('fakeredis no instalado')
+        from unittest import mock
+        import redis
+        from django.core.cache import caches
+        from core.metricas_cache import _sumar, leer_metricas_cache, volcar_metricas
+
+        with self.settings(CACHES={'default': redis_fake, 'compartido': redis_fake}):
+            caches['compartido'].clear()
+            for familia in ('cap_detail', 'mis_caps', 'reporte_correos'):
+                _sumar(familia, hits=2, misses=1, sets=1, bytes=10)
+
+            with mock.patch.object(redis.client.Pipeline, 'execute', autospec=True,
+                                   side_effect=redis.client.Pipeline.execute) as pipeline, \
+                    mock.patch.object(redis.Redis, 'execute_command', autospec=True,
+                                      side_effect=redis.Redis.execute_command) as directos:
+                volcar_metricas('compartido')
+            self.assertEqual(pipeline.call_count, 1)
+            self.assertEqual(directos.call_count, 0)
+
+            metricas = leer_metricas_cache('compartido')
+            self.assertEqual(sorted(metricas), ['cap_detail', 'mis_caps', 'reporte_correos'])
+            self.assertEqual(metricas['mis_caps']['hits'], 2)
+            self.assertEqual(metricas['mis_caps']['hit_ratio'], round(2 / 3, 4))
@@ -6,7 +6,9 @@ urlpatterns = [
     path('crear-capacitacion/<int:capacitacion_id>/', views.CrearCapacitacionView.as_view(), name='editar-capacitacion'),
     path('capacitaciones/', views.CapacitacionesView.as_view(), name='capacitaciones'),
     path('capacitacion/<int:capacitacion_id>/', views.CapacitacionDetailView.as_view(), name='capacitacion-detalle'),
+    path('capacitacion/<int:capacitacion_id>/colaboradores/', views.CapacitacionColaboradoresView.as_view(), name='capacitacion-colaboradores'),
     path('progreso/registrar/', views.RegistrarProgresoView.as_view(), name='registrar-progreso'),
+    path('progreso/lote/', views.RegistrarProgresoLoteView.as_view(), name='registrar-progreso-lote'),
     path('leccion/<int:leccion_id>/completar/', views.CompletarLeccionView.as_view(), name='completar-leccion'),
     path('leccion/<int:leccion_id>/responder/', views.ResponderCuestionarioView.as_view(), name='responder-cuestionario'),
     path('cargar/', views.PrevisualizarColaboradoresView.as_view(), name='cargar-colaborador'),
@@ -1,16 +1,29 @@
 from django.core.files.storage import default_storage
+from django.core.cache import cache
 from django.conf import settings
+from django.db import IntegrityError, connection, transaction
 from django.core.mail import EmailMultiAlternatives
+from django.db.models import Count, Max, Prefetch, Q, Sum
 import os
 import io
+import hashlib
 import tempfile
+import threading
+import uuid
+from collections import OrderedDict
 import cloudinary
 import cloudinary.uploader
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.utils import timezone
 from .models import (
-    Modulos, Lecciones, progresolecciones, progresoModulo, progresoCapacitaciones
+    Capacitaciones, Modulos, Lecciones, PreguntasLecciones, Respuestas,
+    progresolecciones, progresoModulo, progresoCapacitaciones,
+    IntentoCuestionario, UltimoIntentoCuestionario, CompletadoCapacitacion
 )
 from usuarios.models import Colaboradores
+from core.cache import es_cache_compartido, liberar_lock_redis
+from core.campos import pide_campo
+from core.respuestas import es_respuesta_renderizada, etag_sin_codificacion, renderizar_respuesta
 
 # Import opcional de pikepdf (solo si está disponible)
 try:
@@ -21,59 +34,647 @@ except ImportError:
     print("⚠️ pikepdf no disponible, compresión de PDF deshabilitada")
 
 
-def actualizar_progreso_leccion(colaborador_id, leccion, progreso, completada):
+# ==================== HELPERS DE CACHE ====================
+# Cada capacitación tiene un token de generación en el cache. Las entradas que
+# dependen de una capacitación lo incluyen en su clave (cap_detail) o lo guardan
+# junto al valor (mis_caps, ver guardar_cache_etiquetado). Invalidar la
+# capacitación es renovar un solo token, sin importar cuántos inscritos tenga.
+GENERACION_PREFIX = 'gen_cap'
+
+
+def _clave_generacion(capacitacion_id):
+    return f'{GENERACION_PREFIX}:{capacitacion_id}'
+
+
+# Igual para el progreso de cada colaborador: el listado "mis capacitaciones"
+# incluye en su clave la versión de progreso del colaborador, que se renueva
+# cada vez que su progreso o su inscripción cambian.
+VERSION_PROGRESO_PREFIX = 'ver_progreso'
+
+
+def _clave_version_progreso(colaborador_id):
+    return f'{VERSION_PROGRESO_PREFIX}:{colaborador_id}'
+
+
+def _tokens_vigentes(claves):
+    """{clave: token} para cada clave de token dada; los que no existen se crean"""
+    tokens = cache.get_many(list(claves))
+    for clave in claves:
+        if clave not in tokens:
+            # Si el token expiró o fue desalojado, uno nuevo deja obsoletas las entradas previas
+            cache.add(clave, uuid.uuid4().hex, None)
+            tokens[clave] = cache.get(clave)
+    return tokens
+
+
+def generaciones_capacitaciones(capacitaciones_ids):
+    """Token de generación vigente de cada capacitación (se crea si no existe)"""
+    claves = {_clave_generacion(cid): cid for cid in capacitaciones_ids}
+    return {claves[clave]: token for clave, token in _tokens_vigentes(claves).items()}
+
+
+def version_progreso(colaborador_id):
+    """Token de versión vigente del progreso del colaborador (se crea si no existe)"""
+    clave = _clave_version_progreso(colaborador_id)
+    return _tokens_vigentes([clave])[clave]
+
+
+def calcular_etag(*partes):
+    """ETag fuerte a partir de tokens de versión (no del contenido serializado)"""
+    return '"%s"' % hashlib.md5(":".join(str(p) for p in partes).encode()).hexdigest()
+
+
+def etag_coincide(request, etag):
+    """True si el If-None-Match del request incluye `etag` o su variante -gzip (o es *)"""
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    candidatos = [etag_sin_codificacion(valor.strip()) for valor in if_none_match.split(',')]
+    return '*' in candidatos or etag in candidatos
+
+
+def get_cache_key(prefix, *args, capacitacion_id=None):
     """
-    Guarda o actualiza el progreso de una lección y luego recalcula módulo y capacitación.
+    Genera una clave de cache única basada en prefijo y argumentos.
+    Con `capacitacion_id` la clave incluye la generación vigente de la
+    capacitación, así invalidate_capacitacion_cache la deja obsoleta.
+    El prefijo queda visible para agrupar las métricas por familia.
     """
-    progreso_leccion, _ = progresolecciones.objects.update_or_create(
-        idcolaborador_id=colaborador_id,
-        idleccion=leccion,
-        defaults={
-            'progreso': progreso,
-            'completada': completada
+    if capacitacion_id is not None:
+        args += (generaciones_capacitaciones([capacitacion_id])[capacitacion_id],)
+    key_data = f"{prefix}:" + ":".join(str(arg) for arg in args)
+    return f"{prefix}:" + hashlib.md5(key_data.encode()).hexdigest()
+
+
+def _clave_etag(cache_key):
+    return f'{cache_key}:etag'
+
+
+def _generaciones_vigentes(generaciones):
+    """True si ninguna de las capacitaciones de `generaciones` ({id: token}) se invalidó"""
+    if not generaciones:
+        return True
+    vigentes = cache.get_many([_clave_generacion(cid) for cid in generaciones])
+    return all(
+        vigentes.get(_clave_generacion(capacitacion_id)) == token
+        for capacitacion_id, token in generaciones.items()
+    )
+
+
+def guardar_cache_etiquetado(cache_key, datos, capacitaciones_ids, timeout, timeout_etag=None):
+    """
+    Guarda `datos` junto con la generación de cada capacitación de la que dependen.
+    Retorna el ETag de la entrada (clave + generaciones). Con `timeout_etag` el
+    ETag se guarda además aparte y vive más que los datos (ver leer_etag_etiquetado).
+    """
+    generaciones = generaciones_capacitaciones(capacitaciones_ids)
+    etag = calcular_etag(cache_key, *sorted(generaciones.items()))
+    cache.set(cache_key, {
+        'generaciones': generaciones,
+        'etag': etag,
+        'datos': datos,
+    }, timeout)
+    if timeout_etag:
+        cache.set(_clave_etag(cache_key), {'generaciones': generaciones, 'etag': etag}, timeout_etag)
+    return etag
+
+
+def leer_cache_etiquetado(cache_key, con_etag=False):
+    """
+    Datos guardados con guardar_cache_etiquetado, o None si alguna capacitación se
+    invalidó. Con `con_etag` retorna (datos, etag) o (None, None).
+    """
+    entrada = cache.get(cache_key)
+    vigente = (
+        isinstance(entrada, dict) and 'generaciones' in entrada
+        and _generaciones_vigentes(entrada['generaciones'])
+    )
+    if not vigente:
+        return (None, None) if con_etag else None
+    if con_etag:
+        return entrada['datos'], entrada.get('etag')
+    return entrada['datos']
+
+
+def leer_etag_etiquetado(cache_key):
+    """
+    ETag vigente de `cache_key` aunque sus datos ya hayan vencido, o None. Como la
+    clave incluye las versiones de las que dependen los datos, un cliente que
+    envía este ETag tiene la representación actual: 304 sin reconstruirla.
+    """
+    entrada = cache.get(_clave_etag(cache_key))
+    if isinstance(entrada, dict) and _generaciones_vigentes(entrada.get('generaciones')):
+        return entrada.get('etag')
+    return None
+
+
+def invalidate_capacitacion_cache(capacitacion_id=None, colaborador_id=None, colaboradores_ids=None):
+    """
+    Invalida caches relacionadas con capacitaciones.
+
+    - capacitacion_id: renueva la generación de la capacitación; invalida su
+      detalle y el listado "mis capacitaciones" de todos sus inscritos.
+    - colaborador_id / colaboradores_ids: renueva la versión de progreso de esos
+      colaboradores (necesario cuando cambia su progreso o su inscripción).
+    """
+    tokens = {}
+    if capacitacion_id:
+        tokens[_clave_generacion(capacitacion_id)] = uuid.uuid4().hex
+    for cid in list(colaboradores_ids or ()) + ([colaborador_id] if colaborador_id else []):
+        tokens[_clave_version_progreso(cid)] = uuid.uuid4().hex
+    if tokens:
+        cache.set_many(tokens, None)
+    # Invalidar lista general de capacitaciones
+    cache.delete('capacitaciones_list_admin')
+
+
+# ==================== CATÁLOGO DE ESTRUCTURA ====================
+# La estructura de una capacitación (módulos, lecciones, preguntas y respuestas
+# correctas) casi nunca cambia, pero el rollup y el cuestionario la necesitan en
+# cada request. Se guarda versionada en el cache compartido y se replica en
+# memoria del proceso; cada lectura sólo consulta el token de versión. La
+# versión se renueva al crear/editar la capacitación (CrearCapacitacionSerializer).
+#
+# Sin cache compartido (LocMem por worker, desarrollo) cada proceso tiene su
+# propio token: una edición sólo renueva el del worker que la atendió. Para que
+# los demás no sirvan la estructura vieja hasta CACHE_TTL_ESTRUCTURA_CAPACITACION,
+# en ese caso el token vive CACHE_TTL_ESTRUCTURA_SIN_COMPARTIR segundos y al
+# vencer se reconstruye desde la BD.
+ESTRUCTURA_PREFIX = 'estructura_cap'
+
+
+class _MemoriaLocal:
+    """LRU acotado en memoria del proceso, compartido entre hilos"""
+
+    def __init__(self, setting, maximo):
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self._setting = setting
+        self._maximo = maximo
+
+    def get(self, clave):
+        with self._lock:
+            valor = self._datos.get(clave)
+            if valor is not None:
+                self._datos.move_to_end(clave)
+            return valor
+
+    def __setitem__(self, clave, valor):
+        maximo = getattr(settings, self._setting, self._maximo)
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > maximo:
+                self._datos.popitem(last=False)
+
+    def __len__(self):
+        return len(self._datos)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+
+_estructuras_locales = _MemoriaLocal('CACHE_ESTRUCTURAS_LOCALES_MAX', 256)  # {capacitacion_id: (version, estructura)}
+
+
+def _clave_version_estructura(capacitacion_id):
+    return f'{ESTRUCTURA_PREFIX}:{capacitacion_id}:version'
+
+
+def _clave_estructura(capacitacion_id, version):
+    return f'{ESTRUCTURA_PREFIX}:{capacitacion_id}:{version}'
+
+
+def _ttl_estructura():
+    return getattr(settings, 'CACHE_TTL_ESTRUCTURA_CAPACITACION', 60 * 60)
+
+
+def _ttl_version_estructura():
+    if es_cache_compartido():
+        return _ttl_estructura()
+    return min(_ttl_estructura(), getattr(settings, 'CACHE_TTL_ESTRUCTURA_SIN_COMPARTIR', 60))
+
+
+def version_estructura(capacitacion_id):
+    """Token de versión vigente de la estructura (se crea si no existe)"""
+    clave = _clave_version_estructura(capacitacion_id)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, uuid.uuid4().hex, _ttl_version_estructura())
+        version = cache.get(clave)
+    return version
+
+
+def _construir_estructura(capacitacion_id, version):
+    """Carga la estructura completa de la capacitación en 4 queries de solo ids"""
+    modulos = list(
+        Modulos.objects.filter(idcapacitacion_id=capacitacion_id)
+        .order_by('id').values_list('id', flat=True)
+    )
+
+    lecciones_por_modulo = {modulo_id: [] for modulo_id in modulos}
+    modulo_por_leccion = {}
+    for leccion_id, modulo_id in Lecciones.objects.filter(
+        idmodulo__idcapacitacion_id=capacitacion_id
+    ).order_by('id').values_list('id', 'idmodulo_id'):
+        lecciones_por_modulo[modulo_id].append(leccion_id)
+        modulo_por_leccion[leccion_id] = modulo_id
+
+    preguntas_por_leccion = {}
+    for pregunta_id, leccion_id in PreguntasLecciones.objects.filter(
+        id_leccion__idmodulo__idcapacitacion_id=capacitacion_id
+    ).order_by('id').values_list('id', 'id_leccion_id'):
+        preguntas_por_leccion.setdefault(leccion_id, []).append(pregunta_id)
+
+    pregunta_por_respuesta = {}
+    correctas_por_pregunta = {}
+    for respuesta_id, pregunta_id, escorrecto in Respuestas.objects.filter(
+        idpregunta__id_leccion__idmodulo__idcapacitacion_id=capacitacion_id
+    ).order_by('id').values_list('id', 'idpregunta_id', 'escorrecto'):
+        pregunta_por_respuesta[respuesta_id] = pregunta_id
+        if escorrecto == 1:
+            correctas_por_pregunta.setdefault(pregunta_id, []).append(respuesta_id)
+
+    return {
+        'version': version,
+        'modulos': modulos,
+        'lecciones_por_modulo': lecciones_por_modulo,
+        'modulo_por_leccion': modulo_por_leccion,
+        'preguntas_por_leccion': preguntas_por_leccion,
+        'pregunta_por_respuesta': pregunta_por_respuesta,
+        'correctas_por_pregunta': correctas_por_pregunta,
+    }
+
+
+def obtener_estructura_capacitacion(capacitacion_id):
+    """
+    Estructura de la capacitación desde memoria del proceso, cache compartido o BD
+    (en ese orden). El resultado es compartido: no debe modificarse.
+    """
+    capacitacion_id = int(capacitacion_id)
+    version = version_estructura(capacitacion_id)
+    if version is None:
+        # Backend de cache sin persistencia (DummyCache): siempre desde BD
+        return _construir_estructura(capacitacion_id, None)
+
+    local = _estructuras_locales.get(capacitacion_id)
+    if local and local[0] == version:
+        return local[1]
+
+    clave = _clave_estructura(capacitacion_id, version)
+    estructura = cache.get(clave)
+    if estructura is None:
+        estructura = _construir_estructura(capacitacion_id, version)
+        cache.set(clave, estructura, _ttl_estructura())
+
+    _estructuras_locales[capacitacion_id] = (version, estructura)
+    return estructura
+
+
+def reconstruir_estructura_capacitacion(capacitacion_id):
+    """
+    Publica una versión nueva de la estructura. Los demás procesos descartan su
+    copia en memoria al ver el token nuevo, y el detalle cacheado (cuya clave
+    incluye la versión) deja de servirse.
+    """
+    capacitacion_id = int(capacitacion_id)
+    version = uuid.uuid4().hex
+    estructura = _construir_estructura(capacitacion_id, version)
+    cache.set(_clave_estructura(capacitacion_id, version), estructura, _ttl_estructura())
+    cache.set(_clave_version_estructura(capacitacion_id), version, _ttl_version_estructura())
+    _estructuras_locales[capacitacion_id] = (version, estructura)
+    return estructura
+
+
+# ==================== CALIFICACIÓN DE CUESTIONARIOS ====================
+# Clave de respuestas compilada por lección a partir del catálogo de estructura:
+# frozenset de respuestas correctas por pregunta. Se recompila sólo cuando
+# cambia la versión del catálogo, así calificar no lee la BD.
+APROBACION_CUESTIONARIO = 60  # porcentaje mínimo de acierto
+_claves_compiladas = _MemoriaLocal('CACHE_ESTRUCTURAS_LOCALES_MAX', 256)  # {capacitacion_id: (version, {leccion_id: clave})}
+
+
+def _compilar_claves(estructura):
+    claves = {}
+    leccion_por_pregunta = {}
+    for leccion_id, preguntas_ids in estructura['preguntas_por_leccion'].items():
+        claves[leccion_id] = {
+            'correctas': {
+                pregunta_id: frozenset(estructura['correctas_por_pregunta'].get(pregunta_id, ()))
+                for pregunta_id in preguntas_ids
+            },
+            'pregunta_por_respuesta': {},
         }
+        for pregunta_id in preguntas_ids:
+            leccion_por_pregunta[pregunta_id] = leccion_id
+    for respuesta_id, pregunta_id in estructura['pregunta_por_respuesta'].items():
+        claves[leccion_por_pregunta[pregunta_id]]['pregunta_por_respuesta'][respuesta_id] = pregunta_id
+    return claves
+
+
+def clave_cuestionario(capacitacion_id, leccion_id):
+    """Clave compilada de la lección, o None si la lección no tiene preguntas"""
+    estructura = obtener_estructura_capacitacion(capacitacion_id)
+    compiladas = _claves_compiladas.get(capacitacion_id)
+    if compiladas is None or compiladas[0] is None or compiladas[0] != estructura['version']:
+        compiladas = (estructura['version'], _compilar_claves(estructura))
+        _claves_compiladas[capacitacion_id] = compiladas
+    return compiladas[1].get(leccion_id)
+
+
+def calificar_cuestionario(clave, respuestas_ids):
+    """
+    Califica en memoria las respuestas enviadas contra la clave compilada.
+
+    Cada respuesta correcta seleccionada suma un acierto; se ignoran ids que no
+    pertenecen a preguntas de la lección. Retorna el puntaje y los pares
+    (pregunta_id, respuesta_id) a guardar.
+    """
+    seleccion = {}
+    for respuesta_id in respuestas_ids:
+        try:
+            respuesta_id = int(respuesta_id)
+        except (TypeError, ValueError):
+            continue
+        pregunta_id = clave['pregunta_por_respuesta'].get(respuesta_id)
+        if pregunta_id is not None:
+            seleccion.setdefault(pregunta_id, set()).add(respuesta_id)
+
+    total_preguntas = len(clave['correctas'])
+    total_correctas = sum(
+        len(elegidas & clave['correctas'][pregunta_id])
+        for pregunta_id, elegidas in seleccion.items()
+    )
+    porcentaje_acierto = (total_correctas / total_preguntas) * 100
+
+    return {
+        'total_preguntas': total_preguntas,
+        'respuestas_correctas': total_correctas,
+        'porcentaje_acierto': porcentaje_acierto,
+        'aprobada': porcentaje_acierto >= APROBACION_CUESTIONARIO,
+        'respuestas': [
+            (pregunta_id, respuesta_id)
+            for pregunta_id, elegidas in seleccion.items()
+            for respuesta_id in sorted(elegidas)
+        ],
+    }
+
+
+# ==================== INTENTOS DE CUESTIONARIO ====================
+# Cada envío se agrega a intentos_cuestionario (append-only) y el puntero
+# ultimo_intento_cuestionario se mueve con un upsert monótono, sin borrar ni
+# reinsertar filas de respuestas.
+def empaquetar_respuestas(respuestas):
+    """[(pregunta_id, respuesta_id), ...] -> "pregunta:respuesta,respuesta;pregunta:respuesta" """
+    por_pregunta = {}
+    for pregunta_id, respuesta_id in respuestas:
+        por_pregunta.setdefault(pregunta_id, []).append(respuesta_id)
+    return ';'.join(
+        f"{pregunta_id}:{','.join(str(r) for r in sorted(respuestas_ids))}"
+        for pregunta_id, respuestas_ids in sorted(por_pregunta.items())
+    )
+
+
+def desempaquetar_respuestas(empaquetadas):
+    """Inverso de empaquetar_respuestas: {pregunta_id: [respuesta_id, ...]}"""
+    resultado = {}
+    for bloque in filter(None, (empaquetadas or '').split(';')):
+        pregunta_id, respuestas_ids = bloque.split(':')
+        resultado[int(pregunta_id)] = [int(r) for r in respuestas_ids.split(',') if r]
+    return resultado
+
+
+def registrar_intento_cuestionario(colaborador_id, leccion_id, calificacion):
+    """
+    Guarda el intento (un INSERT) y apunta el último intento del par hacia él.
+    `calificacion` es el resultado de calificar_cuestionario.
+    """
+    intento = IntentoCuestionario.objects.create(
+        colaborador_id=colaborador_id,
+        leccion_id=leccion_id,
+        total_preguntas=calificacion['total_preguntas'],
+        respuestas_correctas=calificacion['respuestas_correctas'],
+        porcentaje=round(calificacion['porcentaje_acierto'], 2),
+        aprobada=calificacion['aprobada'],
+        respuestas=empaquetar_respuestas(calificacion['respuestas']),
     )
 
+    vendor = connection.vendor
+    if vendor not in ('mysql', 'sqlite'):
+        UltimoIntentoCuestionario.objects.update_or_create(
+            colaborador_id=colaborador_id,
+            leccion_id=leccion_id,
+            defaults={'intento': intento}
+        )
+        return intento
+
+    q = connection.ops.quote_name
+    tabla = q(UltimoIntentoCuestionario._meta.db_table)
+    if vendor == 'mysql':
+        conflicto = 'ON DUPLICATE KEY UPDATE intento_id = GREATEST(intento_id, VALUES(intento_id))'
+    else:
+        conflicto = (
+            'ON CONFLICT (colaborador_id, leccion_id) '
+            'DO UPDATE SET intento_id = MAX(intento_id, excluded.intento_id)'
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {tabla} (colaborador_id, leccion_id, intento_id) VALUES (%s, %s, %s) {conflicto}',
+            [colaborador_id, leccion_id, intento.pk]
+        )
+    return intento
+
+
+def ultimo_intento_cuestionario(colaborador_id, leccion_id):
+    """Último intento del par (una lectura por índice único), o None"""
+    puntero = UltimoIntentoCuestionario.objects.select_related('intento').filter(
+        colaborador_id=colaborador_id,
+        leccion_id=leccion_id
+    ).first()
+    return puntero.intento if puntero else None
+
+
+# ==================== UPSERT NATIVO DE PROGRESO ====================
+# progreso_colaboradores tiene UNIQUE (idColaborador, idLeccion): en lugar de
+# SELECT + UPDATE/INSERT (update_or_create) se escribe con una sola sentencia
+# INSERT ... ON DUPLICATE KEY UPDATE (MySQL) / ON CONFLICT DO UPDATE (SQLite,
+# usado en tests). El merge es monótono dentro de la propia sentencia: el
+# progreso nunca baja y una lección completada no se desmarca, así heartbeats
+# concurrentes no pierden actualizaciones ni chocan con la clave única.
+UPSERT_LOTE = 500
+
+
+def _sql_upsert_progreso_lecciones(vendor, filas):
+    opts = progresolecciones._meta
+    q = connection.ops.quote_name
+    tabla = q(opts.db_table)
+    colaborador, leccion, progreso, completada, fecha = (
+        q(opts.get_field(nombre).column)
+        for nombre in ('idcolaborador', 'idleccion', 'progreso', 'completada', 'fecha_completado')
+    )
+    valores = ', '.join(['(%s, %s, %s, %s, %s)'] * filas)
+    insert = (
+        f'INSERT INTO {tabla} ({colaborador}, {leccion}, {progreso}, {completada}, {fecha}) '
+        f'VALUES {valores} '
+    )
+
+    if vendor == 'mysql':
+        # MySQL asigna de izquierda a derecha: la fecha se evalúa antes de
+        # actualizar `completada`
+        return insert + (
+            f'ON DUPLICATE KEY UPDATE '
+            f'{fecha} = IF(COALESCE({completada}, 0) = 0 AND VALUES({completada}) <> 0, '
+            f'VALUES({fecha}), {fecha}), '
+            f'{completada} = GREATEST(COALESCE({completada}, 0), VALUES({completada})), '
+            f'{progreso} = GREATEST({progreso}, VALUES({progreso}))'
+        )
+
+    # SQLite: todas las expresiones ven la fila original
+    return insert + (
+        f'ON CONFLICT ({colaborador}, {leccion}) DO UPDATE SET '
+        f'{fecha} = CASE WHEN COALESCE({completada}, 0) = 0 AND excluded.{completada} <> 0 '
+        f'THEN excluded.{fecha} ELSE {fecha} END, '
+        f'{completada} = MAX(COALESCE({completada}, 0), excluded.{completada}), '
+        f'{progreso} = MAX({progreso}, excluded.{progreso})'
+    )
+
+
+def upsert_progreso_lecciones(filas):
+    """
+    Escribe progreso de lecciones con merge monótono en una sola sentencia por lote.
+
+    `filas` es una lista de (colaborador_id, leccion_id, progreso, completada, fecha)
+    donde `fecha` es la fecha_completado a usar si la lección queda completada
+    por primera vez (por defecto ahora).
+    """
+    if not filas:
+        return
+
+    ahora = timezone.now()
+    normalizadas = [
+        (
+            colaborador_id,
+            leccion_id,
+            float(progreso or 0),
+            1 if completada else 0,
+            (fecha or ahora) if completada else None,
+        )
+        for colaborador_id, leccion_id, progreso, completada, fecha in filas
+    ]
+
+    vendor = connection.vendor
+    if vendor not in ('mysql', 'sqlite'):
+        # Otros motores: merge equivalente vía ORM
+        for colaborador_id, leccion_id, progreso, completada, fecha in normalizadas:
+            _merge_progreso_leccion_orm(colaborador_id, leccion_id, progreso, completada, fecha)
+        return
+
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(normalizadas), UPSERT_LOTE):
+            lote = normalizadas[inicio:inicio + UPSERT_LOTE]
+            cursor.execute(
+                _sql_upsert_progreso_lecciones(vendor, len(lote)),
+                [valor for fila in lote for valor in fila]
+            )
+
+
+@transaction.atomic
+def _merge_progreso_leccion_orm(colaborador_id, leccion_id, progreso, completada, fecha):
+    fila, creada = progresolecciones.objects.select_for_update().get_or_create(
+        idcolaborador_id=colaborador_id,
+        idleccion_id=leccion_id,
+        defaults={'progreso': progreso, 'completada': completada, 'fecha_completado': fecha}
+    )
+    if creada:
+        return
+    if completada and not fila.completada:
+        fila.completada = completada
+        fila.fecha_completado = fecha
+    fila.progreso = max(float(fila.progreso or 0), progreso)
+    fila.save(update_fields=['progreso', 'completada', 'fecha_completado'])
+
+
+def actualizar_progreso_leccion(colaborador_id, leccion, progreso, completada):
+    """
+    Guarda o actualiza el progreso de una lección y luego recalcula módulo y capacitación.
+    Incluye progreso_leccion y leccion_completada tal como quedaron guardados: el
+    merge monótono puede conservar un valor mayor que el recibido.
+    """
+    upsert_progreso_lecciones([(colaborador_id, leccion.pk, progreso, completada, None)])
+    guardado = progresolecciones.objects.filter(
+        idcolaborador_id=colaborador_id, idleccion_id=leccion.pk
+    ).values('progreso', 'completada').first() or {'progreso': 0, 'completada': 0}
+
     progreso_modulo_data = actualizar_progreso_modulo(colaborador_id, leccion.idmodulo)
-    return progreso_modulo_data
+    if completada:
+        actualizar_completado_capacitacion(colaborador_id, leccion.idmodulo.idcapacitacion_id)
+    return {
+        **progreso_modulo_data,
+        'progreso_leccion': float(guardado['progreso'] or 0),
+        'leccion_completada': bool(guardado['completada']),
+    }
 
 
-def actualizar_progreso_modulo(colaborador_id, modulo):
+def _guardar_progreso(model, filtros, valores):
     """
-    Calcula el promedio de progreso de todas las lecciones del módulo.
+    Escribe la fila de progreso con un UPDATE directo y sólo inserta si no existía.
+    En el camino caliente (la fila ya existe) cuesta una única query.
     """
-    lecciones = Lecciones.objects.filter(idmodulo=modulo)
-    total_lecciones = lecciones.count()
-    if total_lecciones == 0:
-        return {"progreso_modulo": 0, "progreso_capacitacion": 0}
+    actualizadas = model.objects.filter(**filtros).update(**valores)
+    if not actualizadas:
+        model.objects.create(**filtros, **valores)
 
-    progreso_total = 0
-    completadas = 0
 
-    for leccion in lecciones:
-        progreso_leccion = progresolecciones.objects.filter(
-            idcolaborador_id=colaborador_id,
-            idleccion=leccion
-        ).first()
+def _es_completada():
+    """Condición equivalente a `if progreso.completada:` (no nulo y distinto de 0)."""
+    return Q(completada__isnull=False) & ~Q(completada=0)
+
+
+def _recalcular_modulo(colaborador_id, modulo_id, lecciones_ids):
+    """
+    Recalcula y guarda el progreso de un módulo sin propagar a la capacitación.
+    Retorna el promedio, o None si el módulo no tiene lecciones.
+
+    Las lecciones del módulo salen del catálogo de estructura; basta un único
+    agregado (SUM/COUNT) sobre progreso_colaboradores del colaborador.
+    """
+    total_lecciones = len(lecciones_ids)
+    if total_lecciones == 0:
+        return None
 
-        if progreso_leccion:
-            progreso_total += float(progreso_leccion.progreso)
-            if progreso_leccion.completada:
-                completadas += 1
+    resumen = progresolecciones.objects.filter(
+        idcolaborador_id=colaborador_id,
+        idleccion_id__in=lecciones_ids
+    ).aggregate(
+        suma=Sum('progreso'),
+        completadas=Count('id_progreso', filter=_es_completada()),
+    )
 
+    progreso_total = float(resumen['suma'] or 0)
     promedio_modulo = round(progreso_total / total_lecciones, 2)
-    modulo_completado = completadas == total_lecciones
+    modulo_completado = resumen['completadas'] == total_lecciones
 
-    progreso_modulo, _ = progresoModulo.objects.update_or_create(
-        colaborador_id=colaborador_id,
-        modulo=modulo,
-        defaults={
-            'progreso': promedio_modulo,
-            'completada': modulo_completado
-        }
+    _guardar_progreso(
+        progresoModulo,
+        {'colaborador_id': colaborador_id, 'modulo_id': modulo_id},
+        {'progreso': promedio_modulo, 'completada': modulo_completado}
     )
+    return promedio_modulo
 
-    promedio_capacitacion = actualizar_progreso_capacitacion(colaborador_id, modulo.idcapacitacion)
+
+def actualizar_progreso_modulo(colaborador_id, modulo):
+    """
+    Calcula el promedio de progreso de todas las lecciones del módulo.
+    """
+    estructura = obtener_estructura_capacitacion(modulo.idcapacitacion_id)
+    promedio_modulo = _recalcular_modulo(
+        colaborador_id, modulo.pk, estructura['lecciones_por_modulo'].get(modulo.pk, [])
+    )
+    if promedio_modulo is None:
+        return {"progreso_modulo": 0, "progreso_capacitacion": 0}
+
+    promedio_capacitacion = actualizar_progreso_capacitacion(colaborador_id, modulo.idcapacitacion_id)
 
     return {
         "progreso_modulo": promedio_modulo,
@@ -81,42 +682,732 @@ def actualizar_progreso_modulo(colaborador_id, modulo):
     }
 
 
+def recalcular_progreso_modulos(colaborador_id, modulos_ids):
+    """
+    Recalcula varios módulos de un colaborador y cada capacitación afectada una sola vez.
+    Útil cuando un mismo lote toca varias lecciones de distintos módulos.
+    """
+    modulos = dict(
+        Modulos.objects.filter(id__in=set(modulos_ids)).values_list('id', 'idcapacitacion_id')
+    )
+
+    progreso_modulos = {}
+    for modulo_id, capacitacion_id in modulos.items():
+        lecciones_ids = obtener_estructura_capacitacion(capacitacion_id)['lecciones_por_modulo'].get(modulo_id, [])
+        promedio = _recalcular_modulo(colaborador_id, modulo_id, lecciones_ids)
+        if promedio is not None:
+            progreso_modulos[modulo_id] = promedio
+
+    progreso_capacitaciones = {}
+    for capacitacion_id in set(modulos[m] for m in progreso_modulos):
+        progreso_capacitaciones[capacitacion_id] = actualizar_progreso_capacitacion(
+            colaborador_id, capacitacion_id
+        )
+
+    return {"modulos": progreso_modulos, "capacitaciones": progreso_capacitaciones}
+
+
 def actualizar_progreso_capacitacion(colaborador_id, capacitacion):
     """
     Calcula el progreso general de una capacitación basado en sus módulos.
+
+    `capacitacion` puede ser la instancia o su id; los módulos salen del catálogo
+    de estructura y el promedio de un único agregado sobre progreso_modulo.
     """
-    modulos = Modulos.objects.filter(idcapacitacion=capacitacion)
-    total_modulos = modulos.count()
+    capacitacion_id = getattr(capacitacion, 'pk', capacitacion)
+    modulos_ids = obtener_estructura_capacitacion(capacitacion_id)['modulos']
+
+    total_modulos = len(modulos_ids)
     if total_modulos == 0:
         return 0
 
-    progreso_total = 0
-    completados = 0
+    resumen = progresoModulo.objects.filter(
+        colaborador_id=colaborador_id,
+        modulo_id__in=modulos_ids
+    ).aggregate(
+        suma=Sum('progreso'),
+        completados=Count('id', filter=_es_completada()),
+    )
+
+    progreso_total = float(resumen['suma'] or 0)
+    promedio_capacitacion = round(progreso_total / total_modulos, 2)
+    capacitacion_completada = resumen['completados'] == total_modulos
 
-    for modulo in modulos:
-        progreso_modulo = progresoModulo.objects.filter(
-            colaborador_id=colaborador_id,
-            modulo=modulo
-        ).first()
+    _guardar_progreso(
+        progresoCapacitaciones,
+        {'colaborador_id': colaborador_id, 'capacitacion_id': capacitacion_id},
+        {'progreso': promedio_capacitacion, 'completada': capacitacion_completada}
+    )
 
-        if progreso_modulo:
-            progreso_total += float(progreso_modulo.progreso)
-            if progreso_modulo.completada:
-                completados += 1
+    return promedio_capacitacion
 
-    promedio_capacitacion = round(progreso_total / total_modulos, 2)
-    capacitacion_completada = completados == total_modulos
 
-    progresoCapacitaciones.objects.update_or_create(
+@transaction.atomic
+def aplicar_progreso_lecciones(pendientes):
+    """
+    Escribe en bloque progreso de lecciones y recalcula el rollup una sola vez
+    por módulo y capacitación afectados.
+
+    `pendientes` es un dict {(colaborador_id, leccion_id): (progreso, completada, fecha)}
+    donde `fecha` (opcional) es el momento del evento, usado como fecha_completado.
+    El merge es monótono: nunca baja el progreso guardado ni desmarca una lección
+    completada. Retorna {colaborador_id: resultado de recalcular_progreso_modulos}.
+    """
+    if not pendientes:
+        return {}
+
+    colaboradores_ids = {c for c, _ in pendientes}
+    lecciones_ids = {l for _, l in pendientes}
+    modulo_por_leccion = dict(
+        Lecciones.objects.filter(id__in=lecciones_ids).values_list('id', 'idmodulo_id')
+    )
+
+    existentes = {
+        (p.idcolaborador_id, p.idleccion_id): p
+        for p in progresolecciones.objects.filter(
+            idcolaborador_id__in=colaboradores_ids,
+            idleccion_id__in=lecciones_ids
+        ).only('idcolaborador', 'idleccion', 'progreso', 'completada')
+    }
+
+    # La lectura previa sólo decide qué filas escribir y qué módulos recalcular;
+    # la escritura es el upsert monótono, así una carrera con otro request no
+    # puede bajar el progreso ni duplicar la fila
+    filas = []
+    modulos_por_colaborador = {}
+    con_completadas = set()
+    for (colaborador_id, leccion_id), (progreso, completada, fecha) in pendientes.items():
+        if leccion_id not in modulo_por_leccion:
+            continue
+        fila = existentes.get((colaborador_id, leccion_id))
+        if fila is not None:
+            sube_progreso = float(fila.progreso or 0) < progreso
+            nueva_completada = completada and not fila.completada
+            if not (sube_progreso or nueva_completada):
+                continue
+        filas.append((colaborador_id, leccion_id, progreso, completada, fecha))
+        modulos_por_colaborador.setdefault(colaborador_id, set()).add(modulo_por_leccion[leccion_id])
+        if completada:
+            con_completadas.add(colaborador_id)
+
+    upsert_progreso_lecciones(filas)
+
+    resultado = {
+        colaborador_id: recalcular_progreso_modulos(colaborador_id, modulos_ids)
+        for colaborador_id, modulos_ids in modulos_por_colaborador.items()
+    }
+    for colaborador_id in con_completadas:
+        for capacitacion_id in resultado[colaborador_id]['capacitaciones']:
+            actualizar_completado_capacitacion(colaborador_id, capacitacion_id)
+    return resultado
+
+
+def snapshot_progreso_capacitacion(colaborador_id, capacitacion_id):
+    """
+    Progreso actual del colaborador en toda la capacitación (capacitación,
+    módulos y lecciones) con la estructura del catálogo y 3 queries de solo
+    valores. Las filas faltantes se reportan como progreso 0 sin completar.
+    """
+    estructura = obtener_estructura_capacitacion(capacitacion_id)
+
+    inscripcion = progresoCapacitaciones.objects.filter(
         colaborador_id=colaborador_id,
-        capacitacion=capacitacion,
-        defaults={
-            'progreso': promedio_capacitacion,
-            'completada': capacitacion_completada
-        }
+        capacitacion_id=capacitacion_id
+    ).values('progreso', 'completada').first() or {'progreso': 0, 'completada': 0}
+
+    modulos = {
+        modulo_id: (progreso, completada)
+        for modulo_id, progreso, completada in progresoModulo.objects.filter(
+            colaborador_id=colaborador_id,
+            modulo_id__in=estructura['modulos']
+        ).values_list('modulo_id', 'progreso', 'completada')
+    }
+
+    lecciones = {
+        leccion_id: (progreso, completada)
+        for leccion_id, progreso, completada in progresolecciones.objects.filter(
+            idcolaborador_id=colaborador_id,
+            idleccion_id__in=list(estructura['modulo_por_leccion'])
+        ).values_list('idleccion_id', 'progreso', 'completada')
+    }
+
+    return {
+        'capacitacion_id': int(capacitacion_id),
+        'progreso': float(inscripcion['progreso'] or 0),
+        'completada': bool(inscripcion['completada']),
+        'modulos': [
+            {
+                'modulo_id': modulo_id,
+                'progreso': float(modulos.get(modulo_id, (0, 0))[0] or 0),
+                'completada': bool(modulos.get(modulo_id, (0, 0))[1]),
+                'lecciones': [
+                    {
+                        'leccion_id': leccion_id,
+                        'progreso': float(lecciones.get(leccion_id, (0, 0))[0] or 0),
+                        'completada': bool(lecciones.get(leccion_id, (0, 0))[1]),
+                    }
+                    for leccion_id in estructura['lecciones_por_modulo'].get(modulo_id, [])
+                ],
+            }
+            for modulo_id in estructura['modulos']
+        ],
+    }
+
+
+# ==================== BITMAP DE LECCIONES COMPLETADAS ====================
+# completado_capacitacion guarda por inscripción un bitset sobre las lecciones
+# de la capacitación (ordenadas por id) y el conteo de completadas, para que
+# perfil y "mis capacitaciones" lean "completadas / total" de una sola fila.
+# Se escribe al inscribir, cuando una lección queda completada y cuando la
+# estructura de la capacitación cambia (recalcular_completados_capacitacion).
+def empaquetar_bitmap(lecciones_ids, completadas_ids):
+    """Bitset de `lecciones_ids` (en ese orden) marcando las de `completadas_ids`"""
+    bitmap = bytearray((len(lecciones_ids) + 7) // 8)
+    for posicion, leccion_id in enumerate(lecciones_ids):
+        if leccion_id in completadas_ids:
+            bitmap[posicion >> 3] |= 1 << (posicion & 7)
+    return bytes(bitmap)
+
+
+def leccion_en_bitmap(bitmap, posicion):
+    """True si la lección en `posicion` está marcada como completada"""
+    byte = posicion >> 3
+    return byte < len(bitmap) and bool(bitmap[byte] & (1 << (posicion & 7)))
+
+
+def actualizar_completado_capacitacion(colaborador_id, capacitacion_id):
+    """Recalcula y guarda el bitmap de una inscripción. Retorna (completadas, total)."""
+    lecciones_ids = sorted(obtener_estructura_capacitacion(capacitacion_id)['modulo_por_leccion'])
+    completadas = set(
+        progresolecciones.objects.filter(
+            idcolaborador_id=colaborador_id,
+            idleccion_id__in=lecciones_ids
+        ).filter(_es_completada()).values_list('idleccion_id', flat=True)
     )
 
-    return promedio_capacitacion
+    filtros = {'colaborador_id': colaborador_id, 'capacitacion_id': capacitacion_id}
+    valores = {
+        'bitmap': empaquetar_bitmap(lecciones_ids, completadas),
+        'lecciones_completadas': len(completadas),
+        'total_lecciones': len(lecciones_ids),
+        'fecha_actualizacion': timezone.now(),
+    }
+    if not CompletadoCapacitacion.objects.filter(**filtros).update(**valores):
+        try:
+            with transaction.atomic():
+                CompletadoCapacitacion.objects.create(**filtros, **valores)
+        except IntegrityError:
+            # Otro request creó la fila entre el UPDATE y el INSERT
+            CompletadoCapacitacion.objects.filter(**filtros).update(**valores)
+
+    return len(completadas), len(lecciones_ids)
+
+
+def recalcular_completados_capacitacion(capacitacion_id, colaboradores_ids=None):
+    """
+    Recalcula en bloque las filas de los inscritos de la capacitación (o sólo de
+    `colaboradores_ids`). Se llama al inscribir y cuando cambia la estructura,
+    para que las lecturas encuentren la fila ya escrita. Retorna las filas escritas.
+    """
+    lecciones_ids = sorted(obtener_estructura_capacitacion(capacitacion_id)['modulo_por_leccion'])
+    inscritos = progresoCapacitaciones.objects.filter(capacitacion_id=capacitacion_id)
+    if colaboradores_ids is not None:
+        inscritos = inscritos.filter(colaborador_id__in=list(colaboradores_ids))
+    colaboradores_ids = set(inscritos.values_list('colaborador_id', flat=True))
+    if not colaboradores_ids:
+        return 0
+
+    completadas = {}
+    for colaborador_id, leccion_id in progresolecciones.objects.filter(
+        idcolaborador_id__in=colaboradores_ids,
+        idleccion_id__in=lecciones_ids
+    ).filter(_es_completada()).values_list('idcolaborador_id', 'idleccion_id'):
+        completadas.setdefault(colaborador_id, set()).add(leccion_id)
+
+    existentes = dict(
+        CompletadoCapacitacion.objects.filter(
+            capacitacion_id=capacitacion_id, colaborador_id__in=colaboradores_ids
+        ).values_list('colaborador_id', 'pk')
+    )
+    ahora = timezone.now()
+    actualizar, crear = [], []
+    for colaborador_id in colaboradores_ids:
+        propias = completadas.get(colaborador_id, set())
+        fila = CompletadoCapacitacion(
+            pk=existentes.get(colaborador_id),
+            colaborador_id=colaborador_id,
+            capacitacion_id=capacitacion_id,
+            bitmap=empaquetar_bitmap(lecciones_ids, propias),
+            lecciones_completadas=len(propias),
+            total_lecciones=len(lecciones_ids),
+            fecha_actualizacion=ahora,
+        )
+        (actualizar if fila.pk else crear).append(fila)
+
+    CompletadoCapacitacion.objects.bulk_update(
+        actualizar, ['bitmap', 'lecciones_completadas', 'total_lecciones', 'fecha_actualizacion'],
+        batch_size=1000
+    )
+    # Una lección completada en paralelo pudo crear la fila: esa ya está al día
+    CompletadoCapacitacion.objects.bulk_create(crear, batch_size=1000, ignore_conflicts=True)
+    return len(actualizar) + len(crear)
+
+
+def obtener_completados(colaborador_id, capacitaciones_ids):
+    """
+    {capacitacion_id: (lecciones_completadas, total_lecciones)} desde las filas
+    compactas. Sólo lee: las filas se escriben al inscribir, al completar una
+    lección y al editar la estructura. Una inscripción sin fila (anterior a la
+    tabla) se cuenta en una query sin escribirla; recompute_progreso la crea.
+    """
+    capacitaciones_ids = list(capacitaciones_ids)
+    completados = {
+        capacitacion_id: (completadas, total)
+        for capacitacion_id, completadas, total in CompletadoCapacitacion.objects.filter(
+            colaborador_id=colaborador_id,
+            capacitacion_id__in=capacitaciones_ids
+        ).values_list('capacitacion_id', 'lecciones_completadas', 'total_lecciones')
+    }
+    faltantes = [capacitacion_id for capacitacion_id in capacitaciones_ids if capacitacion_id not in completados]
+    if not faltantes:
+        return completados
+
+    capacitacion_por_leccion = {}
+    totales = {}
+    for capacitacion_id in faltantes:
+        lecciones_ids = obtener_estructura_capacitacion(capacitacion_id)['modulo_por_leccion']
+        totales[capacitacion_id] = len(lecciones_ids)
+        capacitacion_por_leccion.update(dict.fromkeys(lecciones_ids, capacitacion_id))
+    conteo = dict.fromkeys(faltantes, 0)
+    for leccion_id in progresolecciones.objects.filter(
+        idcolaborador_id=colaborador_id,
+        idleccion_id__in=list(capacitacion_por_leccion)
+    ).filter(_es_completada()).values_list('idleccion_id', flat=True).distinct():
+        conteo[capacitacion_por_leccion[leccion_id]] += 1
+    for capacitacion_id in faltantes:
+        completados[capacitacion_id] = (conteo[capacitacion_id], totales[capacitacion_id])
+    return completados
+
+
+# ==================== ÁRBOL DE PROGRESO DEL COLABORADOR ====================
+# CapacitacionProgresoSerializer arma módulos → lecciones → preguntas con el
+# progreso de un colaborador. Con la estructura prefetched y el progreso en
+# mapas precargados (contexto_progreso_colaborador) el árbol completo se
+# serializa desde memoria: una query por nivel en vez de varias por lección.
+PREFETCH_ARBOL_PROGRESO = 'modulos_set__lecciones_set__preguntaslecciones_set__respuestas_set'
+
+
+def prefetch_progreso_capacitacion(colaborador):
+    """Progreso del colaborador en cada capacitación, en `progreso_colaborador`"""
+    return Prefetch(
+        'progresocapacitaciones_set',
+        queryset=progresoCapacitaciones.objects.filter(colaborador=colaborador),
+        to_attr='progreso_colaborador'
+    )
+
+
+def capacitacion_con_progreso(capacitacion_id, colaborador, con_estructura=True):
+    """
+    Capacitación con el progreso del colaborador y, si `con_estructura`, su
+    árbol de módulos → lecciones → preguntas → respuestas prefetched.
+    Lanza Capacitaciones.DoesNotExist si no existe.
+    """
+    prefetch = [prefetch_progreso_capacitacion(colaborador)]
+    if con_estructura:
+        prefetch.append(PREFETCH_ARBOL_PROGRESO)
+    return Capacitaciones.objects.prefetch_related(*prefetch).get(pk=capacitacion_id)
+
+
+def contexto_progreso_colaborador(colaborador, capacitaciones_ids):
+    """
+    Contexto para CapacitacionProgresoSerializer: el colaborador y su progreso
+    por módulo y por lección en esas capacitaciones ({id: registro}), en 2 queries.
+    Ante registros repetidos gana el de menor id, como el .first() por objeto.
+    """
+    capacitaciones_ids = list(capacitaciones_ids)
+
+    progreso_modulos = {}
+    for progreso in progresoModulo.objects.filter(
+        colaborador=colaborador,
+        modulo__idcapacitacion_id__in=capacitaciones_ids
+    ).order_by('pk'):
+        progreso_modulos.setdefault(progreso.modulo_id, progreso)
+
+    progreso_lecciones = {}
+    for progreso in progresolecciones.objects.filter(
+        idcolaborador=colaborador,
+        idleccion__idmodulo__idcapacitacion_id__in=capacitaciones_ids
+    ).order_by('pk'):
+        progreso_lecciones.setdefault(progreso.idleccion_id, progreso)
+
+    return {
+        'colaborador': colaborador,
+        'progreso_modulos': progreso_modulos,
+        'progreso_lecciones': progreso_lecciones,
+    }
+
+
+# ==================== BUFFER DE PROGRESO (WRITE-BEHIND) ====================
+# Los heartbeats intermedios (lección no completada) se coalescen en Redis por
+# (colaborador, lección) y la tarea `volcar_progreso_buffer` los escribe en
+# bloque. Todo el buffer es un sorted set: miembro "colaborador:leccion",
+# score = progreso. Cada operación es atómica en Redis:
+#
+# - encolar: ZADD GT (el merge al máximo lo hace Redis, sin leer antes)
+# - volcar: RENAME del set pendiente a uno "volcando" (los heartbeats que
+#   lleguen después van a un set nuevo); sus miembros se borran (ZREM) solo
+#   después de escribirlos en la BD, así un error deja el lote para el
+#   siguiente volcado. Reaplicar es inocuo: el upsert es monótono.
+#
+# Necesita un alias de django_redis (PROGRESO_BUFFER_CACHE); sin él el modo
+# write-behind queda desactivado y todo se escribe en forma síncrona.
+PROGRESO_BUFFER_PREFIX = 'progreso_buffer'
+PROGRESO_BUFFER_PENDIENTES = f'{PROGRESO_BUFFER_PREFIX}:pendientes'
+PROGRESO_BUFFER_VOLCANDO = f'{PROGRESO_BUFFER_PREFIX}:volcando'
+PROGRESO_BUFFER_LOCK = f'{PROGRESO_BUFFER_PREFIX}:lock'
+PROGRESO_BUFFER_LOCK_TTL = 300
+
+
+def _redis_buffer():
+    """(cliente Redis, alias) del buffer de progreso, o (None, None) si no hay Redis"""
+    alias = getattr(settings, 'PROGRESO_BUFFER_CACHE', 'compartido')
+    if alias not in settings.CACHES:
+        return None, None
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection(alias), alias
+    except (ImportError, NotImplementedError):
+        # Alias que no es django_redis (p.ej. LocMemCache)
+        return None, None
+
+
+def _clave_redis(alias, clave):
+    """Clave con el KEY_PREFIX/versión del alias, como las de cache.set"""
+    from django.core.cache import caches
+    return caches[alias].make_key(clave)
+
+
+def _miembro_buffer(colaborador_id, leccion_id):
+    return f'{colaborador_id}:{leccion_id}'
+
+
+def write_behind_activo():
+    """True si el modo write-behind está habilitado en settings y hay Redis para el buffer."""
+    if not getattr(settings, 'PROGRESO_WRITE_BEHIND', False):
+        return False
+    return _redis_buffer()[0] is not None
+
+
+def encolar_progreso_leccion(colaborador_id, leccion_id, progreso):
+    """
+    Guarda un heartbeat intermedio en Redis (sin tocar la BD). Si ya hay un
+    valor pendiente para el par se conserva el mayor (ZADD GT, atómico).
+    """
+    cliente, alias = _redis_buffer()
+    clave = _clave_redis(alias, PROGRESO_BUFFER_PENDIENTES)
+    pipe = cliente.pipeline(transaction=False)
+    pipe.zadd(clave, {_miembro_buffer(colaborador_id, leccion_id): float(progreso or 0)}, gt=True)
+    pipe.expire(clave, getattr(settings, 'PROGRESO_BUFFER_TTL', 3600))
+    pipe.execute()
+
+
+def descartar_progreso_pendiente(colaborador_id, leccion_id):
+    """Elimina el heartbeat pendiente de un par (p.ej. al completarse la lección)."""
+    cliente, alias = _redis_buffer()
+    if cliente is not None:
+        cliente.zrem(_clave_redis(alias, PROGRESO_BUFFER_PENDIENTES), _miembro_buffer(colaborador_id, leccion_id))
+
+
+def _reclamar_pendientes(cliente, pendientes, volcando):
+    """Mueve el set pendiente a `volcando` (atómico); False si no había nada"""
+    from redis.exceptions import ResponseError
+
+    try:
+        cliente.rename(pendientes, volcando)
+    except ResponseError:
+        # "no such key": no hay heartbeats pendientes
+        return False
+    return True
+
+
+def _volcar_reclamados(cliente, volcando, tamano_lote):
+    """Escribe en la BD los heartbeats de `volcando`, borrando cada lote tras confirmarlo"""
+    procesados = 0
+    while True:
+        lote = cliente.zrange(volcando, 0, tamano_lote - 1, withscores=True)
+        if not lote:
+            return procesados
+
+        pendientes = {}
+        for miembro, progreso in lote:
+            colaborador_id, leccion_id = (int(v) for v in miembro.decode().split(':'))
+            pendientes[(colaborador_id, leccion_id)] = (progreso, False, None)
+
+        with transaction.atomic():
+            afectados = aplicar_progreso_lecciones(pendientes)
+        cliente.zrem(volcando, *[miembro for miembro, _ in lote])
+        if afectados:
+            invalidate_capacitacion_cache(colaboradores_ids=afectados)
+        procesados += len(pendientes)
+
+
+def volcar_progreso_pendiente(tamano_lote=1000):
+    """
+    Vuelca a la BD los heartbeats acumulados en Redis.
+    Retorna el número de pares (colaborador, lección) procesados.
+    """
+    cliente, alias = _redis_buffer()
+    if cliente is None:
+        return 0
+
+    lock = _clave_redis(alias, PROGRESO_BUFFER_LOCK)
+    token = uuid.uuid4().hex.encode()
+    if not cliente.set(lock, token, nx=True, ex=PROGRESO_BUFFER_LOCK_TTL):
+        # Otro worker ya está volcando
+        return 0
+
+    try:
+        pendientes = _clave_redis(alias, PROGRESO_BUFFER_PENDIENTES)
+        volcando = _clave_redis(alias, PROGRESO_BUFFER_VOLCANDO)
+        # Primero lo que dejó un volcado anterior que falló, luego lo nuevo
+        procesados = _volcar_reclamados(cliente, volcando, tamano_lote)
+        if _reclamar_pendientes(cliente, pendientes, volcando):
+            procesados += _volcar_reclamados(cliente, volcando, tamano_lote)
+        return procesados
+    finally:
+        liberar_lock_redis(cliente, lock, token)
+
+
+# ==================== CALENTAMIENTO DE CACHE ====================
+# Tras una escritura (creación, edición o cambio de inscritos) la tarea
+# `calentar_cache_capacitaciones` reconstruye en segundo plano las entradas que
+# la escritura dejó obsoletas, con las mismas funciones que usan las vistas en
+# un miss. Así el primer request después de la escritura ya encuentra el cache.
+# Los slots limitan cuántas tareas calientan a la vez (cache.add por slot).
+CALENTAMIENTO_SLOT_PREFIX = 'calentar_cache:slot'
+CALENTAMIENTO_SLOT_TTL = 300  # segundos máximos de una tarea de calentamiento
+
+
+def calentamiento_activo():
+    """True si el calentamiento de cache tras escrituras está habilitado en settings."""
+    return getattr(settings, 'CACHE_CALENTAMIENTO_ACTIVO', False)
+
+
+def clave_detalle_capacitacion(capacitacion_id, campos=None):
+    """
+    Clave de cap_detail: versión del catálogo de estructura + generación de la
+    capacitación (+ los campos, si es una representación parcial)
+    """
+    return get_cache_key(
+        'cap_detail', capacitacion_id, version_estructura(capacitacion_id), *(campos or ()),
+        capacitacion_id=capacitacion_id
+    )
+
+
+def clave_mis_capacitaciones(colaborador_id, campos=None):
+    """Clave de mis_caps: incluye la versión de progreso del colaborador (y los campos pedidos)"""
+    return get_cache_key('mis_caps', colaborador_id, version_progreso(colaborador_id), *(campos or ()))
+
+
+def anotar_inscritos(capacitaciones):
+    """
+    Anota total_inscritos y total_completados (colaboradores distintos) en el
+    mismo query del listado; capacitacionSerializer los usa en vez de contar por fila.
+    """
+    return capacitaciones.annotate(
+        total_inscritos=Count('progresocapacitaciones__colaborador', distinct=True),
+        total_completados=Count(
+            'progresocapacitaciones__colaborador',
+            filter=Q(progresocapacitaciones__completada=True),
+            distinct=True
+        ),
+    )
+
+
+def cachear_lista_capacitaciones():
+    """Construye, renderiza y guarda el listado de administración (capacitaciones_list_admin)"""
+    from .serializers import capacitacionSerializer
+
+    # Una sola query: solo campos necesarios, conteos de inscritos anotados, ordenado por fecha
+    capacitaciones = anotar_inscritos(Capacitaciones.objects.exclude(
+        estado=3
+    ).only(
+        'id', 'titulo', 'descripcion', 'imagen', 'estado',
+        'fecha_creacion', 'fecha_inicio', 'fecha_fin', 'tipo'
+    )).order_by('-fecha_creacion')
+
+    serializer = capacitacionSerializer(capacitaciones, many=True)
+    renderizada = renderizar_respuesta(serializer.data)
+    cache.set(
+        'capacitaciones_list_admin', renderizada,
+        getattr(settings, 'CACHE_TTL_CAPACITACIONES_LIST', 300)
+    )
+    return renderizada
+
+
+def cachear_detalle_capacitacion(capacitacion_id, cache_key=None, campos=None):
+    """
+    Construye, renderiza y guarda el detalle de una capacitación (solo `campos`
+    si es una representación parcial, ver core.campos).
+    Lanza Capacitaciones.DoesNotExist si no existe.
+    """
+    from .serializers import CapacitacionEstructuraSerializer
+
+    if cache_key is None:
+        cache_key = clave_detalle_capacitacion(capacitacion_id, campos)
+
+    capacitaciones = Capacitaciones.objects.all()
+    if pide_campo(campos, 'total_colaboradores'):
+        capacitaciones = anotar_inscritos(capacitaciones)
+    if not pide_campo(campos, 'modulos'):
+        # Sin módulos no hace falta el árbol lecciones → preguntas → respuestas
+        capacitacion = capacitaciones.get(pk=capacitacion_id)
+    else:
+        capacitacion = _prefetch_estructura(capacitaciones).get(pk=capacitacion_id)
+
+    serializer = CapacitacionEstructuraSerializer(capacitacion, campos=campos)
+    renderizada = renderizar_respuesta(serializer.data)
+    cache.set(cache_key, renderizada, getattr(settings, 'CACHE_TTL_CAPACITACION_DETAIL', 600))
+    return renderizada
+
+
+def _prefetch_estructura(capacitaciones):
+    """
+    Prefetch profundo de toda la estructura (optimizado). Los inscritos no se
+    incluyen, solo su cantidad: la entrada no crece con las inscripciones
+    """
+    return capacitaciones.prefetch_related(
+        Prefetch(
+            'modulos_set',
+            queryset=Modulos.objects.prefetch_related(
+                Prefetch(
+                    'lecciones_set',
+                    queryset=Lecciones.objects.prefetch_related(
+                        Prefetch(
+                            'preguntaslecciones_set',
+                            queryset=PreguntasLecciones.objects.prefetch_related(
+                                'respuestas_set'
+                            )
+                        )
+                    ).order_by('id')
+                )
+            ).order_by('id')
+        )
+    )
+
+
+def cachear_mis_capacitaciones(colaborador_id, cache_key=None, campos=None):
+    """
+    Construye, renderiza y guarda el listado "mis capacitaciones" de un colaborador
+    (solo `campos` si es una representación parcial, ver core.campos).
+    Retorna (renderizada, etag).
+    """
+    from .serializers import MisCapacitacionesSerializer
+
+    if cache_key is None:
+        cache_key = clave_mis_capacitaciones(colaborador_id, campos)
+
+    # Progreso de la inscripción por prefetch; "completadas / total" desde
+    # las filas compactas de completado_capacitacion (sin recorrer lecciones).
+    # Las ocultas (estado 2/3) se filtran aquí y no en SQL: el cache debe
+    # depender también de ellas para reaparecer cuando cambie su estado
+    inscritas = Capacitaciones.objects.filter(
+        progresocapacitaciones__colaborador_id=colaborador_id
+    )
+    if pide_campo(campos, 'progreso', 'completada'):
+        inscritas = inscritas.prefetch_related(
+            Prefetch(
+                'progresocapacitaciones_set',
+                queryset=progresoCapacitaciones.objects.filter(colaborador_id=colaborador_id),
+                to_attr='progreso_colaborador'
+            )
+        )
+    inscritas = list(inscritas.distinct().order_by('-fecha_creacion'))
+    capacitaciones = [c for c in inscritas if c.estado not in (2, 3)]
+
+    contexto = {}
+    if pide_campo(campos, 'lecciones_completadas', 'total_lecciones'):
+        contexto['completados'] = obtener_completados(colaborador_id, [c.id for c in capacitaciones])
+    serializer = MisCapacitacionesSerializer(
+        capacitaciones, many=True, context=contexto, campos=campos
+    )
+
+    renderizada = renderizar_respuesta(serializer.data)
+    etag = guardar_cache_etiquetado(
+        cache_key, renderizada, [c.id for c in inscritas],
+        getattr(settings, 'CACHE_TTL_MIS_CAPACITACIONES', 120),
+        getattr(settings, 'CACHE_TTL_ETAG_MIS_CAPACITACIONES', 60 * 60 * 24)
+    )
+    return renderizada, etag
+
+
+def colaboradores_mas_activos(capacitacion_id=None, limite=50):
+    """
+    Ids de los colaboradores con lecciones completadas más recientes (opcionalmente
+    solo los inscritos en `capacitacion_id`), los que más probablemente lean pronto.
+    """
+    filas = progresolecciones.objects.filter(fecha_completado__isnull=False)
+    if capacitacion_id:
+        filas = filas.filter(idcolaborador__in=progresoCapacitaciones.objects.filter(
+            capacitacion_id=capacitacion_id
+        ).values('colaborador_id'))
+    return list(
+        filas.values('idcolaborador').annotate(
+            ultima=Max('fecha_completado')
+        ).order_by('-ultima').values_list('idcolaborador', flat=True)[:limite]
+    )
+
+
+def tomar_slot_calentamiento():
+    """Reserva uno de los CACHE_CALENTAMIENTO_CONCURRENCIA slots; None si están todos ocupados"""
+    for numero in range(getattr(settings, 'CACHE_CALENTAMIENTO_CONCURRENCIA', 2)):
+        slot = f'{CALENTAMIENTO_SLOT_PREFIX}:{numero}'
+        if cache.add(slot, 1, CALENTAMIENTO_SLOT_TTL):
+            return slot
+    return None
+
+
+def calentar_cache_capacitaciones(capacitacion_id=None, colaboradores_ids=None, max_colaboradores=None):
+    """
+    Reconstruye las entradas de cache afectadas por una escritura:
+
+    - capacitaciones_list_admin (siempre)
+    - cap_detail de `capacitacion_id`
+    - mis_caps de `colaboradores_ids` (los afectados por la escritura) completados
+      con los inscritos más activos, hasta `max_colaboradores` en total
+
+    Las entradas que ya están vigentes no se reconstruyen.
+    Retorna el número de claves calentadas.
+    """
+    if max_colaboradores is None:
+        max_colaboradores = getattr(settings, 'CACHE_CALENTAMIENTO_MAX_COLABORADORES', 50)
+    calentadas = 0
+
+    if not es_respuesta_renderizada(cache.get('capacitaciones_list_admin')):
+        cachear_lista_capacitaciones()
+        calentadas += 1
+
+    if capacitacion_id:
+        cache_key = clave_detalle_capacitacion(capacitacion_id)
+        if not es_respuesta_renderizada(cache.get(cache_key)):
+            cachear_detalle_capacitacion(capacitacion_id, cache_key)
+            calentadas += 1
+
+    colaboradores = list(dict.fromkeys(colaboradores_ids or ()))[:max_colaboradores]
+    if len(colaboradores) < max_colaboradores:
+        for colaborador_id in colaboradores_mas_activos(capacitacion_id, max_colaboradores):
+            if len(colaboradores) >= max_colaboradores:
+                break
+            if colaborador_id not in colaboradores:
+                colaboradores.append(colaborador_id)
+
+    for colaborador_id in colaboradores:
+        cache_key = clave_mis_capacitaciones(colaborador_id)
+        if leer_cache_etiquetado(cache_key) is None:
+            cachear_mis_capacitaciones(colaborador_id, cache_key)
+            calentadas += 1
+
+    return calentadas
 
 
 def comprimir_pdf(file):
@@ -1,6 +1,5 @@
 # ==================== STANDARD LIBRARY ====================
 import csv
-import hashlib
 import io
 import os
 import shutil
@@ -18,7 +17,7 @@ from pathlib import Path
 from django.conf import settings
 from django.core.cache import cache
 from django.db import transaction
-from django.db.models import Count, Prefetch
+from django.db.models import Q
 from django.http import FileResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
@@ -43,41 +42,54 @@ import pypandoc as _pypandoc
 from .models import (
     Capacitaciones,
     CertificadoGenerado,
+    CompletadoCapacitacion,
     Lecciones,
-    Modulos,
-    PreguntasLecciones,
-    Respuestas,
-    RespuestasColaboradores,
     progresoCapacitaciones,
     progresolecciones,
 )
 from capacitaciones.serializers import (
     CapacitacionDetalleSerializer,
+    CapacitacionEstructuraSerializer,
     CapacitacionProgresoSerializer,
-    capacitacionSerializer,
+    ColaboradorSerializer,
     CrearCapacitacionSerializer,
+    EventoProgresoSerializer,
     MisCapacitacionesSerializer,
 )
-from .utils import actualizar_progreso_leccion, enviar_correo_capacitacion_creada
+from .utils import (
+    actualizar_progreso_leccion,
+    aplicar_progreso_lecciones,
+    descartar_progreso_pendiente,
+    encolar_progreso_leccion,
+    calificar_cuestionario,
+    clave_cuestionario,
+    desempaquetar_respuestas,
+    cachear_detalle_capacitacion,
+    cachear_lista_capacitaciones,
+    cachear_mis_capacitaciones,
+    calcular_etag,
+    capacitacion_con_progreso,
+    clave_detalle_capacitacion,
+    clave_mis_capacitaciones,
+    contexto_progreso_colaborador,
+    enviar_correo_capacitacion_creada,
+    etag_coincide,
+    invalidate_capacitacion_cache,
+    leer_cache_etiquetado,
+    leer_etag_etiquetado,
+    recalcular_completados_capacitacion,
+    registrar_intento_cuestionario,
+    snapshot_progreso_capacitacion,
+    ultimo_intento_cuestionario,
+    write_behind_activo,
+)
+from core.campos import CamposInvalidos, campos_solicitados, pide_campo
+from core.paginacion import CursorInvalido, paginar_request
+from core.respuestas import es_respuesta_renderizada, respuesta_renderizada
+from .tasks import programar_calentamiento
 from usuarios.models import Colaboradores
 from usuarios.permissions import IsAdminUser, IsSuperAdmin
-
-
-# ==================== HELPERS DE CACHE ====================
-def get_cache_key(prefix, *args):
-    """Genera una clave de cache única basada en prefijo y argumentos"""
-    key_data = f"{prefix}:" + ":".join(str(arg) for arg in args)
-    return hashlib.md5(key_data.encode()).hexdigest()
-
-
-def invalidate_capacitacion_cache(capacitacion_id=None, colaborador_id=None):
-    """Invalida caches relacionadas con capacitaciones"""
-    if capacitacion_id:
-        cache.delete(get_cache_key('cap_detail', capacitacion_id))
-    if colaborador_id:
-        cache.delete(get_cache_key('mis_caps', colaborador_id))
-    # Invalidar lista general de capacitaciones
-    cache.delete('capacitaciones_list_admin')
+from usuarios.utils import colaborador_actual
 
 
 class CrearCapacitacionView(APIView):
@@ -128,12 +140,18 @@ class CrearCapacitacionView(APIView):
         if serializer.is_valid():
             serializer.save()
 
-            # invalidate cache for the capacitacion and for affected collaborators
-            invalidate_capacitacion_cache(capacitacion_id=capacitacion.id)
+            # La generación nueva invalida a todos los inscritos; sólo los
+            # agregados/removidos requieren borrar su listado explícitamente
             new_collaborators = set(progresoCapacitaciones.objects.filter(capacitacion=capacitacion).values_list('colaborador_id', flat=True))
-            affected = current_collaborators | new_collaborators
-            for cid in affected:
-                invalidate_capacitacion_cache(colaborador_id=cid)
+            invalidate_capacitacion_cache(
+                capacitacion_id=capacitacion.id,
+                colaboradores_ids=current_collaborators ^ new_collaborators
+            )
+            programar_calentamiento(
+                capacitacion_id=capacitacion.id,
+                colaboradores_ids=current_collaborators ^ new_collaborators,
+                progreso_empresarial=current_collaborators != new_collaborators
+            )
 
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -185,6 +203,7 @@ class CrearCapacitacionView(APIView):
                     added.append(cid)
                 if bulk:
                     progresoCapacitaciones.objects.bulk_create(bulk)
+                    recalcular_completados_capacitacion(capacitacion.id, added)
 
                 # Enviar notificación solo a los agregados una vez la transacción se confirme
                 if added:
@@ -201,13 +220,19 @@ class CrearCapacitacionView(APIView):
                         progresolecciones.objects.filter(idcolaborador_id=cid, idleccion__idmodulo__idcapacitacion=capacitacion).delete()
                         from .models import progresoModulo as _progresoModulo
                         _progresoModulo.objects.filter(colaborador_id=cid, modulo__idcapacitacion=capacitacion).delete()
+                        CompletadoCapacitacion.objects.filter(capacitacion_id=capacitacion.id, colaborador_id=cid).delete()
                         progresoCapacitaciones.objects.filter(capacitacion=capacitacion, colaborador_id=cid).delete()
                         removed.append(cid)
 
                 # invalidar caches para colaboradores afectados y para la capacitación
-                invalidate_capacitacion_cache(capacitacion_id=capacitacion.id)
-                for cid in set(added + removed):
-                    invalidate_capacitacion_cache(colaborador_id=cid)
+                invalidate_capacitacion_cache(
+                    capacitacion_id=capacitacion.id, colaboradores_ids=set(added + removed)
+                )
+                # Reconstruir en segundo plano lo invalidado, ya confirmada la transacción
+                programar_calentamiento(
+                    capacitacion_id=capacitacion.id, colaboradores_ids=set(added + removed),
+                    progreso_empresarial=bool(added or removed)
+                )
 
                 return Response({'added': added, 'removed': removed}, status=status.HTTP_200_OK)
 
@@ -217,13 +242,15 @@ class CrearCapacitacionView(APIView):
             if serializer.is_valid():
                 capacitacion = serializer.save()
                 
-                # Invalidar cache de lista de capacitaciones
-                cache.delete('capacitaciones_list_admin')
-                
-                # Invalidar cache de colaboradores inscritos
-                colaboradores_ids = request.data.get('colaboradores', [])
-                for col_id in colaboradores_ids:
-                    invalidate_capacitacion_cache(colaborador_id=col_id)
+                # Invalidar lista de capacitaciones y cache de colaboradores inscritos
+                invalidate_capacitacion_cache(
+                    colaboradores_ids=request.data.get('colaboradores', [])
+                )
+                programar_calentamiento(
+                    capacitacion_id=capacitacion.id,
+                    colaboradores_ids=request.data.get('colaboradores', []),
+                    progreso_empresarial=True
+                )
                 
                 return Response(
                     {'id': capacitacion.id, 'titulo': capacitacion.titulo},
@@ -240,34 +267,24 @@ class CapacitacionesView(APIView):
     
     Optimización: 
     - Cache de 5 minutos para lista de capacitaciones
-    - Select_related para evitar N+1 queries
+    - Conteos de inscritos/completados anotados: una sola query sin importar
+      cuántas capacitaciones haya
     - Only() para cargar solo campos necesarios
     """
     
     def get(self, request, *args, **kwargs):
         try:
-            # Intentar obtener de cache
+            # Intentar obtener de cache (JSON ya renderizado: sin serializer ni renderer)
             cache_key = 'capacitaciones_list_admin'
             cached_data = cache.get(cache_key)
             
-            if cached_data is not None:
-                return Response(cached_data, status=status.HTTP_200_OK)
+            if es_respuesta_renderizada(cached_data):
+                return respuesta_renderizada(request, cached_data)
             
-            # Query optimizada: solo campos necesarios, ordenado por fecha
-            capacitaciones = Capacitaciones.objects.exclude(
-                estado=3
-            ).only(
-                'id', 'titulo', 'descripcion', 'estado',
-                'fecha_creacion', 'fecha_inicio', 'fecha_fin', 'tipo'
-            ).order_by('-fecha_creacion')
+            # Construir y guardar en cache (5 minutos)
+            renderizada = cachear_lista_capacitaciones()
             
-            serializer = capacitacionSerializer(capacitaciones, many=True)
-            
-            # Guardar en cache (5 minutos)
-            cache_ttl = getattr(settings, 'CACHE_TTL_CAPACITACIONES_LIST', 300)
-            cache.set(cache_key, serializer.data, cache_ttl)
-            
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return respuesta_renderizada(request, renderizada)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
@@ -284,12 +301,9 @@ class CapacitacionesView(APIView):
             capacitacion.estado = 3  # estado eliminado
             capacitacion.save()
             
-            # Invalidate caches
+            # Invalidate caches (detalle, listado de cada inscrito y lista general)
             invalidate_capacitacion_cache(capacitacion_id=capacitacion.id)
-            colaboradores_ids = progresoCapacitaciones.objects.filter(capacitacion=capacitacion).values_list('colaborador_id', flat=True)
-            for col_id in colaboradores_ids:
-                invalidate_capacitacion_cache(colaborador_id=col_id)
-            cache.delete('capacitaciones_list_admin')
+            programar_calentamiento()
             
             return Response({'mensaje': 'Capacitación eliminada exitosamente'}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -307,9 +321,18 @@ class CapacitacionDetailView(APIView):
     Optimización: 
     - Prefetch_related profundo para cargar toda la estructura (226 → 4 queries)
     - Cache por capacitación (10 minutos) - estructura no cambia frecuentemente
+    - Sin la lista de inscritos (solo total_colaboradores): se consultan
+      paginados en CapacitacionColaboradoresView
+    - ?view=summary / ?fields=: representación parcial; sin 'modulos' no se
+      prefetchea el árbol de lecciones → preguntas → respuestas
     """
     
     def get(self, request, capacitacion_id, *args, **kwargs):
+        try:
+            campos = campos_solicitados(request, CapacitacionEstructuraSerializer)
+        except CamposInvalidos as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             # Verificar que el usuario tiene colaborador asociado
             colaborador = getattr(request.user, 'idcolaboradoru', None)
@@ -331,40 +354,23 @@ class CapacitacionDetailView(APIView):
                     status=status.HTTP_403_FORBIDDEN
                 )
             
-            # Intentar obtener de cache (la estructura de la capacitación no cambia)
-            cache_key = get_cache_key('cap_detail', capacitacion_id)
+            # Intentar obtener de cache; la clave incluye la versión del catálogo de
+            # estructura y la generación de la capacitación, así una edición la deja obsoleta.
+            # El ETag se deriva de la misma clave: si el cliente ya la tiene, 304 sin serializar
+            cache_key = clave_detalle_capacitacion(capacitacion_id, campos)
+            headers = {'ETag': calcular_etag(cache_key), 'Cache-Control': 'private, no-cache'}
+            if etag_coincide(request, headers['ETag']):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
             cached_data = cache.get(cache_key)
             
-            if cached_data is not None:
-                return Response(cached_data, status=status.HTTP_200_OK)
-            
-            # Prefetch profundo de toda la estructura (optimizado)
-            capacitacion = Capacitaciones.objects.prefetch_related(
-                Prefetch(
-                    'modulos_set',
-                    queryset=Modulos.objects.prefetch_related(
-                        Prefetch(
-                            'lecciones_set',
-                            queryset=Lecciones.objects.prefetch_related(
-                                Prefetch(
-                                    'preguntaslecciones_set',
-                                    queryset=PreguntasLecciones.objects.prefetch_related(
-                                        'respuestas_set'
-                                    )
-                                )
-                            ).order_by('id')
-                        )
-                    ).order_by('id')
-                )
-            ).get(pk=capacitacion_id)
-            
-            serializer = CapacitacionDetalleSerializer(capacitacion)
+            if es_respuesta_renderizada(cached_data):
+                return respuesta_renderizada(request, cached_data, headers=headers)
             
-            # Guardar en cache (10 minutos)
-            cache_ttl = getattr(settings, 'CACHE_TTL_CAPACITACION_DETAIL', 600)
-            cache.set(cache_key, serializer.data, cache_ttl)
+            # Prefetch profundo de toda la estructura; se guarda en cache (10 minutos)
+            renderizada = cachear_detalle_capacitacion(capacitacion_id, cache_key, campos)
             
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return respuesta_renderizada(request, renderizada, headers=headers)
         except Capacitaciones.DoesNotExist:
             return Response(
                 {'error': 'Capacitación no encontrada'},
@@ -374,6 +380,45 @@ class CapacitacionDetailView(APIView):
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class CapacitacionColaboradoresView(APIView):
+    permission_classes = [IsAuthenticated, IsSuperAdmin | IsAdminUser]
+    """
+    Inscritos de una capacitación, paginados por cursor (keyset sobre el id del
+    colaborador). El detalle de la capacitación solo trae su cantidad.
+
+    Query params:
+    - cursor: `next_cursor` de la página anterior (vacío para la primera)
+    - page_size: 1-200 (por defecto 50)
+    - search: cédula (prefijo) o nombre/apellido (contiene)
+    - total=1: incluir total_aproximado
+    """
+
+    def get(self, request, capacitacion_id, *args, **kwargs):
+        if not Capacitaciones.objects.filter(pk=capacitacion_id).exists():
+            return Response({'error': 'Capacitación no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+
+        colaboradores = Colaboradores.objects.filter(
+            idcolaborador__in=progresoCapacitaciones.objects.filter(
+                capacitacion_id=capacitacion_id
+            ).values('colaborador_id')
+        ).only('idcolaborador', 'nombrecolaborador', 'apellidocolaborador', 'cccolaborador')
+
+        search = request.query_params.get('search', '').strip()
+        if search:
+            colaboradores = colaboradores.filter(
+                Q(cccolaborador__startswith=search) |
+                Q(nombrecolaborador__icontains=search) |
+                Q(apellidocolaborador__icontains=search)
+            )
+
+        try:
+            filas, datos = paginar_request(request, colaboradores, ('idcolaborador',))
+        except CursorInvalido as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'results': ColaboradorSerializer(filas, many=True).data, **datos})
+
+
 class RegistrarProgresoView(APIView):
     permission_classes = [IsAuthenticated]
     """Registrar progreso en una lección y actualizar progreso de módulo y capacitación
@@ -381,6 +426,8 @@ class RegistrarProgresoView(APIView):
     Optimización:
     - Select_related para obtener módulo y capacitación en una sola query
     - Invalidación de cache del colaborador al actualizar progreso
+    - Con PROGRESO_WRITE_BEHIND activo, los heartbeats no completados se
+      acumulan en cache (202) y se vuelcan en bloque por Celery
     """
     
     @transaction.atomic
@@ -409,6 +456,23 @@ class RegistrarProgresoView(APIView):
                 'idmodulo__idcapacitacion'
             ).get(id=leccion_id)
             
+            # Heartbeat intermedio: acumular en cache y responder sin escribir en BD
+            if not completada and write_behind_activo():
+                encolar_progreso_leccion(colaborador.idcolaborador, leccion.id, progreso)
+                return Response(
+                    {
+                        'mensaje': 'Progreso registrado (pendiente de consolidar)',
+                        'leccion_id': leccion_id,
+                        'progreso_leccion': progreso,
+                        'completada': completada,
+                        'pendiente': True
+                    },
+                    status=status.HTTP_202_ACCEPTED
+                )
+            
+            # Una escritura síncrona reemplaza cualquier heartbeat pendiente del par
+            descartar_progreso_pendiente(colaborador.idcolaborador, leccion.id)
+            
             # Usar la función de utils que actualiza toda la cadena de progreso
             progreso_data = actualizar_progreso_leccion(
                 colaborador_id=colaborador.idcolaborador,
@@ -424,8 +488,8 @@ class RegistrarProgresoView(APIView):
                 {
                     'mensaje': 'Progreso actualizado exitosamente',
                     'leccion_id': leccion_id,
-                    'progreso_leccion': progreso,
-                    'completada': completada,
+                    'progreso_leccion': progreso_data['progreso_leccion'],
+                    'completada': progreso_data['leccion_completada'],
                     'progreso_modulo': progreso_data.get('progreso_modulo', 0),
                     'progreso_capacitacion': progreso_data.get('progreso_capacitacion', 0)
                 },
@@ -440,6 +504,105 @@ class RegistrarProgresoView(APIView):
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class RegistrarProgresoLoteView(APIView):
+    permission_classes = [IsAuthenticated]
+    """Registrar en un solo request varios eventos de progreso (clientes offline)
+    
+    Payload: {"eventos": [{"leccion_id", "progreso", "completada", "timestamp"}, ...]}
+    
+    Optimización:
+    - Lecciones e inscripciones de todas las capacitaciones validadas en 2 queries
+    - Eventos de la misma lección se fusionan (máximo progreso, completada si alguna lo está)
+    - Merge monótono: nunca baja el progreso guardado
+    - Rollup una sola vez por módulo y capacitación afectados, en una transacción
+    """
+    MAX_EVENTOS = 500
+    
+    def post(self, request, *args, **kwargs):
+        try:
+            colaborador = request.user.idcolaboradoru
+            if not colaborador:
+                return Response(
+                    {'error': 'El usuario no tiene un colaborador asociado'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            eventos = request.data.get('eventos') if isinstance(request.data, dict) else request.data
+            if not isinstance(eventos, list) or not eventos:
+                return Response(
+                    {'error': 'Se requiere una lista de eventos'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if len(eventos) > self.MAX_EVENTOS:
+                return Response(
+                    {'error': f'Máximo {self.MAX_EVENTOS} eventos por lote'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            serializer = EventoProgresoSerializer(data=eventos, many=True)
+            if not serializer.is_valid():
+                return Response({'errores': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Estructura (módulo y capacitación) de todas las lecciones en una query
+            lecciones_ids = {e['leccion_id'] for e in serializer.validated_data}
+            estructura = {
+                leccion_id: capacitacion_id
+                for leccion_id, capacitacion_id in Lecciones.objects.filter(
+                    id__in=lecciones_ids
+                ).values_list('id', 'idmodulo__idcapacitacion_id')
+            }
+            
+            # Inscripción para todas las capacitaciones afectadas en una query
+            inscritas = set(progresoCapacitaciones.objects.filter(
+                colaborador=colaborador,
+                capacitacion_id__in=set(estructura.values())
+            ).values_list('capacitacion_id', flat=True))
+            
+            colaborador_id = colaborador.idcolaborador
+            pendientes = {}
+            rechazados = []
+            for evento in serializer.validated_data:
+                leccion_id = evento['leccion_id']
+                if leccion_id not in estructura:
+                    rechazados.append({'leccion_id': leccion_id, 'motivo': 'Lección no encontrada'})
+                    continue
+                if estructura[leccion_id] not in inscritas:
+                    rechazados.append({'leccion_id': leccion_id, 'motivo': 'No inscrito en la capacitación'})
+                    continue
+                
+                progreso, completada = evento['progreso'], evento['completada']
+                fecha = evento.get('timestamp') if completada else None
+                previo = pendientes.get((colaborador_id, leccion_id))
+                if previo:
+                    if previo[1] and (not completada or (previo[2] and fecha and previo[2] < fecha)):
+                        fecha = previo[2]
+                    progreso = max(progreso, previo[0])
+                    completada = completada or previo[1]
+                pendientes[(colaborador_id, leccion_id)] = (progreso, completada, fecha)
+            
+            with transaction.atomic():
+                resultado = aplicar_progreso_lecciones(pendientes).get(colaborador_id, {})
+            
+            for (_, leccion_id), (_, completada, _) in pendientes.items():
+                if completada:
+                    descartar_progreso_pendiente(colaborador_id, leccion_id)
+            if resultado:
+                invalidate_capacitacion_cache(colaborador_id=colaborador_id)
+            
+            return Response(
+                {
+                    'mensaje': 'Lote de progreso procesado',
+                    'procesados': len(pendientes),
+                    'rechazados': rechazados,
+                    'progreso_modulos': resultado.get('modulos', {}),
+                    'progreso_capacitaciones': resultado.get('capacitaciones', {})
+                },
+                status=status.HTTP_200_OK
+            )
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class CompletarLeccionView(APIView):
     permission_classes = [IsAuthenticated]
     """Marcar una lección como completada y actualizar progreso de módulo y capacitación
@@ -521,11 +684,46 @@ class ResponderCuestionarioView(APIView):
     
     Optimización:
     - Select_related para obtener lección, módulo y capacitación en una query
-    - Bulk operations para guardar respuestas
-    - Prefetch de preguntas con respuestas correctas
+    - Clave de respuestas compilada por lección (frozensets) y calificación en memoria
+    - Intentos append-only (un INSERT) con puntero al último intento por lección
     - Transacción atómica para consistencia
+    
+    Con `completar_leccion: true` el envío aprobado completa la lección (un solo
+    rollup) y la respuesta incluye el snapshot de progreso de la capacitación,
+    así el cliente no necesita llamar a CompletarLeccionView después.
+    
+    GET: último intento del colaborador en la lección (lectura por índice único)
     """
     
+    def get(self, request, leccion_id, *args, **kwargs):
+        colaborador = request.user.idcolaboradoru
+        if not colaborador:
+            return Response(
+                {'error': 'El usuario no tiene un colaborador asociado'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        intento = ultimo_intento_cuestionario(colaborador.idcolaborador, leccion_id)
+        if intento is None:
+            return Response(
+                {'error': 'No hay intentos registrados para esta lección'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        return Response(
+            {
+                'intento_id': intento.id,
+                'leccion_id': intento.leccion_id,
+                'total_preguntas': intento.total_preguntas,
+                'respuestas_correctas': intento.respuestas_correctas,
+                'porcentaje_acierto': float(intento.porcentaje),
+                'aprobada': intento.aprobada,
+                'respuestas': desempaquetar_respuestas(intento.respuestas),
+                'fecha': intento.fecha
+            },
+            status=status.HTTP_200_OK
+        )
+    
     @transaction.atomic
     def post(self, request, leccion_id, *args, **kwargs):
         try:
@@ -538,6 +736,7 @@ class ResponderCuestionarioView(APIView):
             
             colaborador = request.user.idcolaboradoru
             respuestas_ids = request.data.get('respuestas', [])
+            completar_leccion = request.data.get('completar_leccion', False) in (True, 1, '1', 'true', 'True')
             
             if not respuestas_ids:
                 return Response(
@@ -565,89 +764,60 @@ class ResponderCuestionarioView(APIView):
                     status=status.HTTP_403_FORBIDDEN
                 )
             
-            # Obtener preguntas con respuestas correctas en una query optimizada
-            preguntas = PreguntasLecciones.objects.filter(
-                id_leccion=leccion
-            ).prefetch_related(
-                Prefetch(
-                    'respuestas_set',
-                    queryset=Respuestas.objects.filter(escorrecto=1),
-                    to_attr='respuestas_correctas'
-                )
-            )
-            
-            total_preguntas = preguntas.count()
+            # Clave de respuestas compilada (sin queries); calificación en memoria
+            clave = clave_cuestionario(capacitacion.id, leccion.id)
             
-            if total_preguntas == 0:
+            if not clave:
                 return Response(
                     {'error': 'Esta lección no tiene preguntas asociadas'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Obtener IDs de respuestas correctas
-            respuestas_correctas_ids = set()
-            for pregunta in preguntas:
-                for resp in pregunta.respuestas_correctas:
-                    respuestas_correctas_ids.add(resp.id)
-            
-            # Eliminar respuestas anteriores en bulk
-            preguntas_ids = [p.id for p in preguntas]
-            RespuestasColaboradores.objects.filter(
-                idcolaborador=colaborador,
-                idpregunta_id__in=preguntas_ids
-            ).delete()
-            
-            # Obtener respuestas válidas y crear en bulk
-            respuestas_validas = Respuestas.objects.filter(
-                id__in=respuestas_ids
-            ).select_related('idpregunta')
-            
-            nuevas_respuestas = [
-                RespuestasColaboradores(
-                    idcolaborador=colaborador,
-                    idpregunta=respuesta.idpregunta,
-                    idrespuesta=respuesta
-                )
-                for respuesta in respuestas_validas
-            ]
-            RespuestasColaboradores.objects.bulk_create(nuevas_respuestas)
-            
-            # Calcular respuestas correctas del usuario
-            respuestas_correctas_usuario = set(respuestas_ids) & respuestas_correctas_ids
-            total_correctas = len(respuestas_correctas_usuario)
+            calificacion = calificar_cuestionario(clave, respuestas_ids)
+            total_preguntas = calificacion['total_preguntas']
+            total_correctas = calificacion['respuestas_correctas']
+            porcentaje_acierto = calificacion['porcentaje_acierto']
+            aprobada = calificacion['aprobada']
             
-            # Calcular porcentaje de acierto
-            porcentaje_acierto = (total_correctas / total_preguntas) * 100
-            
-            # Determinar si pasó la lección (>60%)
-            aprobada = porcentaje_acierto >= 60
+            # Registrar el intento (append-only) y mover el puntero al último
+            intento = registrar_intento_cuestionario(
+                colaborador.idcolaborador, leccion.id, calificacion
+            )
             
-            # Actualizar progreso usando la función de utils
-            progreso = 100 if aprobada else 0
+            # Actualizar progreso usando la función de utils (un reintento reprobado
+            # no baja una lección ya aprobada: se reporta lo que quedó guardado)
             progreso_data = actualizar_progreso_leccion(
                 colaborador_id=colaborador.idcolaborador,
                 leccion=leccion,
-                progreso=progreso,
+                progreso=100 if aprobada else 0,
                 completada=aprobada
             )
             
             # Invalidar cache del colaborador
             invalidate_capacitacion_cache(colaborador_id=colaborador.idcolaborador)
             
-            return Response(
-                {
-                    'mensaje': 'Cuestionario respondido exitosamente',
-                    'leccion_id': leccion_id,
-                    'total_preguntas': total_preguntas,
-                    'respuestas_correctas': total_correctas,
-                    'porcentaje_acierto': round(porcentaje_acierto, 2),
-                    'aprobada': aprobada,
-                    'progreso_leccion': progreso,
-                    'progreso_modulo': progreso_data.get('progreso_modulo', 0),
-                    'progreso_capacitacion': progreso_data.get('progreso_capacitacion', 0)
-                },
-                status=status.HTTP_200_OK
-            )
+            respuesta = {
+                'mensaje': 'Cuestionario respondido exitosamente',
+                'leccion_id': leccion_id,
+                'intento_id': intento.id,
+                'total_preguntas': total_preguntas,
+                'respuestas_correctas': total_correctas,
+                'porcentaje_acierto': round(porcentaje_acierto, 2),
+                'aprobada': aprobada,
+                'progreso_leccion': progreso_data['progreso_leccion'],
+                'progreso_modulo': progreso_data.get('progreso_modulo', 0),
+                'progreso_capacitacion': progreso_data.get('progreso_capacitacion', 0)
+            }
+            
+            if completar_leccion:
+                # El rollup y la invalidación ya corrieron arriba; aquí solo se lee
+                # el estado guardado (un reintento reprobado no descompleta la lección)
+                respuesta['leccion_completada'] = progreso_data['leccion_completada']
+                respuesta['capacitacion'] = snapshot_progreso_capacitacion(
+                    colaborador.idcolaborador, capacitacion.id
+                )
+            
+            return Response(respuesta, status=status.HTTP_200_OK)
         except Lecciones.DoesNotExist:
             return Response(
                 {'error': 'Lección no encontrada'},
@@ -933,14 +1103,9 @@ class DescargarCertificadoView(APIView):
                         status=status.HTTP_403_FORBIDDEN
                     )
             
-            # Obtener colaborador con centro y cargo (necesarios para derivar empresa)
-            colaborador = Colaboradores.objects.select_related(
-                'centroop__id_proyecto__id_unidad__id_empresa',
-                'cargocolaborador'
-            ).only(
-                'idcolaborador', 'cccolaborador', 'nombrecolaborador',
-                'apellidocolaborador', 'correocolaborador', 'cargocolaborador', 'centroop'
-            ).get(idcolaborador=id_colaborador)
+            # Colaborador con centro y cargo (necesarios para derivar empresa): siempre
+            # es el del token, ya precargado con su cadena organizacional
+            colaborador = colaborador_actual(request)
             capacitacion = get_object_or_404(Capacitaciones, id=id_capacitacion)
             
             # Verificar que el colaborador completó la capacitación
@@ -1277,9 +1442,18 @@ class DescargarCertificadoView(APIView):
 
 class MisCapacitacionesView(APIView):
     permission_classes = [IsAuthenticated]
-    """Ver mis capacitaciones asignadas (una capacitación específica)"""
+    """
+    Ver mis capacitaciones asignadas (una capacitación específica).
+    Con ?view=summary / ?fields= sin 'modulos' solo se consulta el progreso
+    de la inscripción, sin el árbol de la capacitación.
+    """
     
     def get(self, request, capacitacion_id, *args, **kwargs):
+        try:
+            campos = campos_solicitados(request, CapacitacionProgresoSerializer)
+        except CamposInvalidos as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             # Obtener colaborador desde el token
             colaborador = getattr(request.user, 'idcolaboradoru', None)
@@ -1289,20 +1463,16 @@ class MisCapacitacionesView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Prefetch optimizado con filtro del colaborador para progreso y estructura
-            capacitacion = Capacitaciones.objects.prefetch_related(
-                Prefetch(
-                    'progresocapacitaciones_set',
-                    queryset=progresoCapacitaciones.objects.filter(colaborador=colaborador),
-                    to_attr='progreso_colaborador'
-                ),
-                'modulos_set__lecciones_set'
-            ).get(pk=capacitacion_id)
+            # Estructura completa y progreso del colaborador precargados: el
+            # árbol se serializa desde memoria (una query por nivel)
+            con_estructura = pide_campo(campos, 'modulos')
+            capacitacion = capacitacion_con_progreso(capacitacion_id, colaborador, con_estructura)
 
-            serializer = CapacitacionProgresoSerializer(
-                capacitacion,
-                context={'colaborador': colaborador}
-            )
+            if con_estructura:
+                contexto = contexto_progreso_colaborador(colaborador, [capacitacion.id])
+            else:
+                contexto = {'colaborador': colaborador}
+            serializer = CapacitacionProgresoSerializer(capacitacion, context=contexto, campos=campos)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Capacitaciones.DoesNotExist:
             return Response(
@@ -1318,27 +1488,20 @@ class AdminCapacitacionProgresoView(APIView):
     """
     Ver progreso de un colaborador en una capacitación específica (admin).
     
-    Optimización: Usa prefetch_related con to_attr para acceso directo
-    al progreso del colaborador específico.
+    Optimización: estructura prefetched y progreso del colaborador en mapas
+    precargados (utils.contexto_progreso_colaborador).
     """
     
     def get(self, request, capacitacion_id, colaborador_id, *args, **kwargs):
         try:
             colaborador = get_object_or_404(Colaboradores, id_colaborador=colaborador_id)
             
-            # Prefetch optimizado con filtro del colaborador
-            capacitacion = Capacitaciones.objects.prefetch_related(
-                Prefetch(
-                    'progresocapacitaciones_set',
-                    queryset=progresoCapacitaciones.objects.filter(colaborador=colaborador),
-                    to_attr='progreso_colaborador'
-                ),
-                'modulos_set__lecciones_set'
-            ).get(pk=capacitacion_id)
+            # Estructura completa y progreso del colaborador precargados
+            capacitacion = capacitacion_con_progreso(capacitacion_id, colaborador)
             
             serializer = CapacitacionProgresoSerializer(
                 capacitacion,
-                context={'colaborador': colaborador}
+                context=contexto_progreso_colaborador(colaborador, [capacitacion.id])
             )
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Capacitaciones.DoesNotExist:
@@ -1365,10 +1528,18 @@ class MisCapacitacionesListView(APIView):
     
     Optimización: 
     - Cache de 2 minutos por colaborador
-    - Annotate + prefetch_related + to_attr para reducir queries (87% optimización)
+    - Prefetch con to_attr para el progreso de la inscripción
+    - Lecciones completadas / total desde una fila compacta por inscripción
+    - ?view=summary / ?fields=: representación parcial con su propia entrada
+      de cache; solo se consulta lo que piden los campos
     """
     
     def get(self, request, *args, **kwargs):
+        try:
+            campos = campos_solicitados(request, MisCapacitacionesSerializer)
+        except CamposInvalidos as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             # Obtener colaborador SOLO desde el token del usuario autenticado
             colaborador = getattr(request.user, 'idcolaboradoru', None)
@@ -1379,47 +1550,35 @@ class MisCapacitacionesListView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Intentar obtener de cache
-            cache_key = get_cache_key('mis_caps', colaborador.idcolaborador)
-            cached_data = cache.get(cache_key)
-            
-            if cached_data is not None:
-                return Response(cached_data, status=status.HTTP_200_OK)
-            
-            # Optimización: Annotate + Prefetch con to_attr
-            capacitaciones = Capacitaciones.objects.filter(
-                progresocapacitaciones__colaborador=colaborador
-            ).annotate(
-                total_lecciones_count=Count('modulos__lecciones', distinct=True)
-            ).prefetch_related(
-                Prefetch(
-                    'progresocapacitaciones_set',
-                    queryset=progresoCapacitaciones.objects.filter(colaborador=colaborador),
-                    to_attr='progreso_colaborador'
-                ),
-                Prefetch(
-                    'modulos_set',
-                    queryset=Modulos.objects.prefetch_related(
-                        Prefetch(
-                            'lecciones_set',
-                            queryset=Lecciones.objects.prefetch_related(
-                                Prefetch(
-                                    'progresolecciones_set',
-                                    queryset=progresolecciones.objects.filter(idcolaborador=colaborador),
-                                    to_attr='progreso_leccion_colaborador'
-                                )
-                            )
-                        )
+            # Intentar obtener de cache: la clave incluye la versión de progreso del
+            # colaborador y la entrada se descarta si alguna de sus capacitaciones
+            # cambió de generación. El ETag guardado con la entrada permite un 304
+            # sin serializar ni consultar la BD
+            cache_key = clave_mis_capacitaciones(colaborador.idcolaborador, campos)
+            cached_data, etag = leer_cache_etiquetado(cache_key, con_etag=True)
+            
+            if es_respuesta_renderizada(cached_data):
+                headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+                if etag_coincide(request, etag):
+                    return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+                return respuesta_renderizada(request, cached_data, headers=headers)
+
+            # Datos vencidos: el ETag vive aparte más tiempo, así un cliente que
+            # sondea sin cambios recibe 304 antes de reconstruir el listado
+            if request.headers.get('If-None-Match'):
+                etag = leer_etag_etiquetado(cache_key)
+                if etag and etag_coincide(request, etag):
+                    return Response(
+                        status=status.HTTP_304_NOT_MODIFIED,
+                        headers={'ETag': etag, 'Cache-Control': 'private, no-cache'}
                     )
-                )
-            ).distinct().exclude(estado__in=[2, 3]).order_by('-fecha_creacion')
             
-            serializer = MisCapacitacionesSerializer(capacitaciones, many=True)
+            # Construir y guardar en cache (2 minutos - cambia más frecuentemente)
+            renderizada, etag = cachear_mis_capacitaciones(colaborador.idcolaborador, cache_key, campos)
+            headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+            if etag_coincide(request, etag):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
             
-            # Guardar en cache (2 minutos - cambia más frecuentemente)
-            cache_ttl = getattr(settings, 'CACHE_TTL_MIS_CAPACITACIONES', 120)
-            cache.set(cache_key, serializer.data, cache_ttl)
-            
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return respuesta_renderizada(request, renderizada, headers=headers)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,478 @@
+"""
+Backend de cache en dos niveles para Django.
+
+L1: LRU acotado en memoria del proceso (compartido entre hilos del worker).
+L2: otro alias de CACHES compartido entre workers (Redis en producción).
+
+Invalidación entre workers: cada escritura/borrado se registra en un journal
+dentro de L2 (contador atómico + las claves afectadas por evento). Con Redis el
+journal es una lista y la escritura del valor, el contador y la lista van en un
+solo MULTI (un round trip); con otro L2 es un slot por evento. Cada worker
+revisa el contador como máximo cada SYNC_INTERVAL segundos y descarta de su L1
+las claves publicadas por los demás; si el journal expiró o se reinició, vacía
+su L1 completo. Un delete es visible en todos los workers en a lo sumo
+SYNC_INTERVAL segundos (0 = revisar en cada lectura).
+
+Cada clave de L1 tiene una generación que sube al descartarla o reescribirla.
+Un get que no la encontró anota la generación antes de leer L2 y sólo guarda
+lo leído si sigue igual: un valor viejo leído antes de una invalidación no
+vuelve a L1 después de ella.
+
+Los valores en L1 se comparten por referencia entre requests del mismo
+proceso: quien lee del cache no debe modificarlos.
+
+Configuración:
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.DosNivelesCache',
+            'LOCATION': 'lms-l1',
+            'OPTIONS': {
+                'L2': 'compartido',          # alias del cache compartido
+                'MAX_ENTRIES': 1000,         # tamaño del LRU en memoria
+                'L1_TIMEOUT': 30,            # segundos máximos de una entrada en L1
+                'SYNC_INTERVAL': 1,          # segundos entre revisiones del journal
+                'EXCLUDE_PREFIXES': [],      # claves que nunca pasan por L1
+            },
+        },
+        'compartido': {...},
+    }
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+JOURNAL_SEQ = 'cache_l1:seq'
+JOURNAL_LISTA = 'cache_l1:journal'
+JOURNAL_TTL = 5 * 60
+JOURNAL_MAX_PENDIENTES = 1000
+
+_NO_ENCONTRADO = object()
+
+# Estado de L1 por LOCATION: Django crea una instancia del backend por hilo,
+# pero el L1 debe ser uno solo por proceso
+_niveles = {}
+_niveles_lock = threading.Lock()
+
+
+class _EstadoL1:
+    def __init__(self):
+        self.datos = OrderedDict()  # clave -> (expira_en, valor)
+        self.lock = threading.Lock()
+        self.visto = None  # último número de journal procesado
+        self.ultimo_sync = 0.0
+        self.propios = set()  # eventos publicados por este proceso
+        self.generaciones = OrderedDict()  # clave -> número de invalidaciones
+        self.epoca = 0  # sube al vaciar L1 o al olvidar una generación
+
+
+BACKENDS_DE_PROCESO = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def alias_real(alias='default'):
+    """
+    Alias del backend que termina guardando los valores de `alias`: sigue los
+    envoltorios (DESTINO de MedicionCache, L2 de DosNivelesCache). None si hay un ciclo.
+    """
+    vistos = set()
+    while alias not in vistos:
+        vistos.add(alias)
+        opciones = settings.CACHES.get(alias, {}).get('OPTIONS', {})
+        siguiente = opciones.get('DESTINO') or opciones.get('L2')
+        if not siguiente:
+            return alias
+        alias = siguiente
+    return None
+
+
+def es_cache_compartido(alias='default'):
+    """
+    True si `alias` termina guardando los valores en un cache visible para todos
+    los workers (ver alias_real).
+    """
+    real = alias_real(alias)
+    return real is not None and settings.CACHES.get(real, {}).get('BACKEND') not in BACKENDS_DE_PROCESO
+
+
+def cliente_redis(alias='default'):
+    """(cliente Redis, alias real) si `alias` termina en django_redis, o (None, None)"""
+    real = alias_real(alias)
+    if real is None or real not in settings.CACHES:
+        return None, None
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection(real), real
+    except (ImportError, NotImplementedError):
+        # Backend que no es django_redis (p.ej. LocMemCache)
+        return None, None
+
+
+def liberar_lock_redis(cliente, clave, token):
+    """Borra el lock `clave` solo si sigue siendo nuestro (pudo expirar y tomarlo otro)"""
+    from redis.exceptions import WatchError
+
+    with cliente.pipeline() as pipe:
+        try:
+            pipe.watch(clave)
+            if pipe.get(clave) == token:
+                pipe.multi()
+                pipe.delete(clave)
+                pipe.execute()
+        except WatchError:
+            # Cambió entre el GET y el DEL: ya no es nuestro
+            pass
+
+
+def _slot_journal(numero):
+    return f'cache_l1:inv:{numero}'
+
+
+class DosNivelesCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        opciones = params.get('OPTIONS', {})
+        self._alias_l2 = opciones.get('L2', 'compartido')
+        self._l1_timeout = opciones.get('L1_TIMEOUT', 30)
+        self._sync_interval = opciones.get('SYNC_INTERVAL', 1)
+        self._excluidos = tuple(opciones.get('EXCLUDE_PREFIXES', ()))
+        with _niveles_lock:
+            self._estado = _niveles.setdefault(location, _EstadoL1())
+
+    @property
+    def l2(self):
+        return caches[self._alias_l2]
+
+    # ---------------- L1 ----------------
+    def _clave_l1(self, key, version):
+        return self.make_and_validate_key(key, version=version)
+
+    def _usa_l1(self, key):
+        return not (self._excluidos and str(key).startswith(self._excluidos))
+
+    def _leer_l1(self, clave):
+        estado = self._estado
+        with estado.lock:
+            entrada = estado.datos.get(clave)
+            if entrada is None:
+                return _NO_ENCONTRADO
+            if entrada[0] <= time.monotonic():
+                del estado.datos[clave]
+                return _NO_ENCONTRADO
+            estado.datos.move_to_end(clave)
+            return entrada[1]
+
+    def _ttl_l1(self, timeout):
+        """Segundos que una entrada puede vivir en L1 (0 = no guardarla)"""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self._l1_timeout
+        return max(0, min(self._l1_timeout, timeout))
+
+    def _generacion(self, clave):
+        """Generación vigente de la clave (anotarla antes de leer L2)"""
+        estado = self._estado
+        with estado.lock:
+            return estado.epoca, estado.generaciones.get(clave, 0)
+
+    def _subir_generacion(self, clave):
+        # Llamar con estado.lock tomado
+        estado = self._estado
+        estado.generaciones[clave] = estado.generaciones.get(clave, 0) + 1
+        estado.generaciones.move_to_end(clave)
+        if len(estado.generaciones) > 4 * self._max_entries:
+            # Olvidar una generación obliga a descartar todas las lecturas en curso
+            estado.generaciones.popitem(last=False)
+            estado.epoca += 1
+
+    def _guardar_l1(self, clave, value, timeout, generacion=None, propio=False):
+        """
+        Guarda en L1. `generacion` (de _generacion) descarta el valor si la clave
+        se invalidó mientras se leía L2; `propio` marca un valor recién escrito
+        por este proceso, que reemplaza a cualquier lectura en curso.
+        """
+        ttl = self._ttl_l1(timeout)
+        estado = self._estado
+        with estado.lock:
+            if propio:
+                self._subir_generacion(clave)
+            elif generacion is not None and generacion != (estado.epoca, estado.generaciones.get(clave, 0)):
+                return
+            if not ttl:
+                estado.datos.pop(clave, None)
+                return
+            estado.datos[clave] = (time.monotonic() + ttl, value)
+            estado.datos.move_to_end(clave)
+            while len(estado.datos) > self._max_entries:
+                estado.datos.popitem(last=False)
+
+    def _descartar_l1(self, claves):
+        estado = self._estado
+        with estado.lock:
+            for clave in claves:
+                estado.datos.pop(clave, None)
+                self._subir_generacion(clave)
+
+    def _vaciar_l1(self):
+        estado = self._estado
+        with estado.lock:
+            estado.datos.clear()
+            estado.generaciones.clear()
+            estado.epoca += 1
+
+    # ---------------- journal de invalidación ----------------
+    def _redis_l2(self):
+        """Cliente de django_redis de L2, o None si L2 es otro backend"""
+        cliente = getattr(self.l2, 'client', None)
+        return cliente if hasattr(cliente, 'get_client') else None
+
+    def _escribir_y_publicar(self, claves, en_l2, en_redis):
+        """
+        Escribe en L2 y publica `claves` en el journal. Con Redis,
+        `en_redis(cliente, pipeline)` encola la escritura (los métodos del cliente
+        de django_redis aceptan `client=pipeline`) y todo va en un solo MULTI;
+        retorna las respuestas de lo encolado. Con otro L2 llama `en_l2()` y
+        retorna su resultado.
+        """
+        redis = self._redis_l2()
+        if redis is None:
+            resultado = en_l2()
+            self._publicar(claves)
+            return resultado
+
+        pipeline = redis.get_client(write=True).pipeline(transaction=True)
+        en_redis(redis, pipeline)
+        encolados = len(pipeline)
+        if claves:
+            lista = redis.make_key(JOURNAL_LISTA)
+            pipeline.incr(redis.make_key(JOURNAL_SEQ))
+            pipeline.rpush(lista, json.dumps(list(claves)))
+            pipeline.ltrim(lista, -JOURNAL_MAX_PENDIENTES, -1)
+            pipeline.expire(lista, JOURNAL_TTL)
+        respuestas = pipeline.execute()
+        if claves:
+            with self._estado.lock:
+                self._estado.propios.add(respuestas[encolados])
+        return respuestas[:encolados]
+
+    def _publicar(self, claves):
+        """Registra en L2 las claves modificadas para que los demás workers las descarten"""
+        if not claves:
+            return
+        if self._redis_l2() is not None:
+            self._escribir_y_publicar(claves, None, lambda redis, pipeline: None)
+            return
+        try:
+            numero = self.l2.incr(JOURNAL_SEQ)
+        except (ValueError, TypeError):
+            # Contador inexistente (django_redis sin Lua lanza TypeError en vez de ValueError)
+            self.l2.add(JOURNAL_SEQ, 0, None)
+            numero = self.l2.incr(JOURNAL_SEQ)
+        self.l2.set(_slot_journal(numero), list(claves), JOURNAL_TTL)
+        with self._estado.lock:
+            self._estado.propios.add(numero)
+
+    def _eventos_redis(self, redis, visto, seq):
+        """
+        (seq, {número: claves}) de los eventos visto+1..seq de la lista, o
+        (seq, None) si ya no están todos. Contador y lista se leen en el mismo
+        MULTI; si entretanto llegaron eventos nuevos se reintenta con el rango mayor.
+        """
+        for _ in range(3):
+            pipeline = redis.get_client(write=False).pipeline(transaction=True)
+            pipeline.get(redis.make_key(JOURNAL_SEQ))
+            pipeline.lrange(redis.make_key(JOURNAL_LISTA), visto - seq, -1)
+            actual, entradas = pipeline.execute()
+            actual = int(actual or 0)
+            if actual < seq or actual - visto > JOURNAL_MAX_PENDIENTES:
+                return actual, None
+            if actual == seq:
+                if len(entradas) < seq - visto:
+                    return seq, None
+                return seq, {
+                    numero: json.loads(entrada)
+                    for numero, entrada in zip(range(visto + 1, seq + 1), entradas)
+                }
+            seq = actual
+        return seq, None
+
+    def _sincronizar(self):
+        estado = self._estado
+        ahora = time.monotonic()
+        if self._sync_interval and ahora - estado.ultimo_sync < self._sync_interval:
+            return
+        estado.ultimo_sync = ahora
+
+        seq = self.l2.get(JOURNAL_SEQ) or 0
+        visto = estado.visto
+        if visto is None or seq == visto:
+            # Primer uso en este proceso: L1 vacío, basta con anotar la posición
+            estado.visto = seq
+            return
+
+        redis = self._redis_l2()
+        if seq < visto or seq - visto > JOURNAL_MAX_PENDIENTES:
+            self._vaciar_l1()
+        elif redis is not None:
+            seq, eventos = self._eventos_redis(redis, visto, seq)
+            if eventos is None:
+                # Eventos expirados o demasiados: no se sabe qué cambió
+                self._vaciar_l1()
+            else:
+                with estado.lock:
+                    ajenos = [n for n in eventos if n not in estado.propios]
+                self._descartar_l1([clave for numero in ajenos for clave in eventos[numero]])
+        else:
+            with estado.lock:
+                ajenos = [n for n in range(visto + 1, seq + 1) if n not in estado.propios]
+            slots = [_slot_journal(numero) for numero in ajenos]
+            eventos = self.l2.get_many(slots) if slots else {}
+            if len(eventos) < len(slots):
+                # Eventos expirados: no se sabe qué cambió
+                self._vaciar_l1()
+            else:
+                self._descartar_l1([clave for claves in eventos.values() for clave in claves])
+        with estado.lock:
+            estado.propios = {n for n in estado.propios if n > seq}
+        estado.visto = seq
+
+    # ---------------- API de BaseCache ----------------
+    def get(self, key, default=None, version=None):
+        if not self._usa_l1(key):
+            return self.l2.get(key, default, version=version)
+
+        self._sincronizar()
+        clave = self._clave_l1(key, version)
+        valor = self._leer_l1(clave)
+        if valor is not _NO_ENCONTRADO:
+            return valor
+
+        generacion = self._generacion(clave)
+        valor = self.l2.get(key, _NO_ENCONTRADO, version=version)
+        if valor is _NO_ENCONTRADO:
+            return default
+        self._guardar_l1(clave, valor, self._l1_timeout, generacion=generacion)
+        return valor
+
+    def get_many(self, keys, version=None):
+        self._sincronizar()
+        resultado = {}
+        faltantes = []
+        for key in keys:
+            if self._usa_l1(key):
+                valor = self._leer_l1(self._clave_l1(key, version))
+                if valor is not _NO_ENCONTRADO:
+                    resultado[key] = valor
+                    continue
+            faltantes.append(key)
+
+        if faltantes:
+            generaciones = {
+                key: self._generacion(self._clave_l1(key, version))
+                for key in faltantes if self._usa_l1(key)
+            }
+            desde_l2 = self.l2.get_many(faltantes, version=version)
+            for key, valor in desde_l2.items():
+                if key in generaciones:
+                    self._guardar_l1(
+                        self._clave_l1(key, version), valor, self._l1_timeout, generacion=generaciones[key]
+                    )
+            resultado.update(desde_l2)
+        return resultado
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if not self._usa_l1(key):
+            self.l2.set(key, value, timeout, version=version)
+            return
+        clave = self._clave_l1(key, version)
+        self._escribir_y_publicar(
+            [clave],
+            lambda: self.l2.set(key, value, timeout, version=version),
+            lambda redis, pipeline: redis.set(key, value, timeout, version=version, client=pipeline),
+        )
+        self._guardar_l1(clave, value, timeout, propio=True)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        claves = {key: self._clave_l1(key, version) for key in data if self._usa_l1(key)}
+
+        def en_redis(redis, pipeline):
+            for key, value in data.items():
+                redis.set(key, value, timeout, version=version, client=pipeline)
+
+        resultado = self._escribir_y_publicar(
+            list(claves.values()), lambda: self.l2.set_many(data, timeout, version=version), en_redis
+        )
+        # Un MULTI que falla lanza excepción: con Redis no hay fallidas parciales
+        fallidas = [] if self._redis_l2() is not None else resultado
+        for key, clave in claves.items():
+            if key not in fallidas:
+                self._guardar_l1(clave, data[key], timeout, propio=True)
+        return fallidas
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # add depende del estado compartido: siempre se resuelve en L2
+        agregado = self.l2.add(key, value, timeout, version=version)
+        if agregado and self._usa_l1(key):
+            clave = self._clave_l1(key, version)
+            self._descartar_l1([clave])
+            self._publicar([clave])
+        return agregado
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        valor = self.l2.incr(key, delta, version=version)
+        if self._usa_l1(key):
+            clave = self._clave_l1(key, version)
+            self._descartar_l1([clave])
+            self._publicar([clave])
+        return valor
+
+    def delete(self, key, version=None):
+        if not self._usa_l1(key):
+            return self.l2.delete(key, version=version)
+        clave = self._clave_l1(key, version)
+        borrado = self._escribir_y_publicar(
+            [clave],
+            lambda: self.l2.delete(key, version=version),
+            lambda redis, pipeline: redis.delete(key, version=version, client=pipeline),
+        )
+        self._descartar_l1([clave])
+        return bool(borrado[0]) if self._redis_l2() is not None else borrado
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        claves = [self._clave_l1(key, version) for key in keys if self._usa_l1(key)]
+        self._escribir_y_publicar(
+            claves,
+            lambda: self.l2.delete_many(keys, version=version),
+            lambda redis, pipeline: redis.delete_many(keys, version=version, client=pipeline),
+        )
+        self._descartar_l1(claves)
+
+    def has_key(self, key, version=None):
+        if self._usa_l1(key):
+            self._sincronizar()
+            if self._leer_l1(self._clave_l1(key, version)) is not _NO_ENCONTRADO:
+                return True
+        return self.l2.has_key(key, version=version)
+
+    def clear(self):
+        self.l2.clear()
+        self._vaciar_l1()
+        # El journal se borró con L2: se reinicia el contador con un salto mayor
+        # al máximo pendiente para que los demás workers vacíen su L1
+        self.l2.set(JOURNAL_SEQ, int(time.time() * 1000), None)
+        self._estado.visto = None
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
@@ -0,0 +1,51 @@
+"""
+Representaciones parciales (sparse fieldsets) de los listados.
+
+?fields=a,b,c limita la respuesta a esos campos y ?view=summary usa los campos
+de resumen del serializer (Meta.campos_resumen). La vista obtiene los campos
+pedidos con campos_solicitados y los usa también para podar su plan de
+consultas: si no se pide un campo anidado, no se prefetchea su árbol; si no se
+piden conteos, no se anotan.
+"""
+VISTA_RESUMEN = 'summary'
+
+
+class CamposInvalidos(ValueError):
+    """Se pidieron campos que el serializer no tiene"""
+
+
+def campos_solicitados(request, serializer_class):
+    """
+    Tupla con los campos pedidos (en el orden de Meta.fields), o None para la
+    representación completa. view=summary tiene prioridad sobre fields.
+    Lanza CamposInvalidos si algún campo no existe.
+    """
+    disponibles = list(serializer_class.Meta.fields)
+    resumen = getattr(serializer_class.Meta, 'campos_resumen', None)
+    if resumen is not None and request.query_params.get('view') == VISTA_RESUMEN:
+        return tuple(campo for campo in disponibles if campo in resumen)
+
+    pedidos = {
+        campo.strip() for campo in request.query_params.get('fields', '').split(',') if campo.strip()
+    }
+    if not pedidos:
+        return None
+    desconocidos = pedidos.difference(disponibles)
+    if desconocidos:
+        raise CamposInvalidos(f"Campos no disponibles: {', '.join(sorted(desconocidos))}")
+    return tuple(campo for campo in disponibles if campo in pedidos)
+
+
+def pide_campo(campos, *nombres):
+    """True si la representación (None = completa) incluye alguno de `nombres`"""
+    return campos is None or any(nombre in campos for nombre in nombres)
+
+
+class RepresentacionParcialMixin:
+    """Serializer que acepta `campos` (ver campos_solicitados) y descarta el resto"""
+
+    def __init__(self, *args, campos=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if campos is not None:
+            for nombre in set(self.fields).difference(campos):
+                self.fields.pop(nombre)
@@ -43,6 +43,14 @@ app.conf.beat_schedule = {
         'task': 'analitica.tasks.calcular_progreso_empresarial_diario',
         'schedule': crontab(hour=0, minute=0),  # Cada día a las 00:00
     },
+    'refrescar-progreso-empresarial-cache': {
+        'task': 'analitica.tasks.refrescar_progreso_empresarial_cache',
+        'schedule': 60.0 * 25,  # Antes de que venzan los 30 min de CACHE_TTL_PROGRESO_EMPRESARIAL
+    },
+    'volcar-progreso-buffer': {
+        'task': 'capacitaciones.tasks.volcar_progreso_buffer',
+        'schedule': 60.0,  # Cada minuto (solo hace algo con PROGRESO_WRITE_BEHIND)
+    },
 }
 
 app.conf.timezone = 'America/Bogota'
@@ -100,8 +100,12 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
     'ngrok-skip-browser-warning',
+    'if-none-match',
 ]
 
+# Permite al frontend leer el ETag para enviarlo en If-None-Match
+CORS_EXPOSE_HEADERS = ['etag']
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(hours=5),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
@@ -110,7 +114,7 @@ SIMPLE_JWT = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'auth.authentication.JWTColaboradorAuthentication',
         'rest_framework.authentication.TokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
@@ -227,20 +231,86 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = config('MEDIA_ROOT', default=str(os.path.join(BASE_DIR.parent, 'media')))
 
 # Cache Configuration
-# Usa cache en memoria para desarrollo, Redis para producción
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'OPTIONS': {
-            "PASSWORD": "TU_PASSWORD",
-            "CLIENT_CLASS": "django_redis.client.DefaultClient",
-        }
+# Sin CACHE_REDIS_URL (desarrollo local/tests): cache en memoria del proceso.
+# Con CACHE_REDIS_URL: dos niveles, LRU en memoria (L1) delante de Redis (L2),
+# con invalidación entre workers (ver core/cache.py).
+# En ambos casos 'default' cuenta hits/misses/sets por familia de claves
+# (ver core/metricas_cache.py y el comando `metricas_cache`).
+CACHE_REDIS_URL = config('CACHE_REDIS_URL', default='')
+
+if CACHE_REDIS_URL and 'test' not in sys.argv:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.metricas_cache.MedicionCache',
+            'OPTIONS': {
+                'DESTINO': 'niveles',
+                'METRICAS': 'compartido',
+                'METRICAS_INTERVALO': 10,
+                'METRICAS_MUESTREO': 10,
+            },
+        },
+        'niveles': {
+            'BACKEND': 'core.cache.DosNivelesCache',
+            'LOCATION': 'lms-l1',
+            'OPTIONS': {
+                'L2': 'compartido',
+                'MAX_ENTRIES': config('CACHE_L1_MAX_ENTRIES', default=1000, cast=int),
+                'L1_TIMEOUT': 30,
+                'SYNC_INTERVAL': 1,
+                'EXCLUDE_PREFIXES': [],
+            },
+        },
+        'compartido': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.metricas_cache.MedicionCache',
+            'OPTIONS': {'DESTINO': 'local'},
+        },
+        'local': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        },
     }
-}
 
 # Tiempos de cache específicos (en segundos)
 CACHE_TTL_CAPACITACIONES_LIST = 60 * 5  # 5 minutos para lista de capacitaciones
 CACHE_TTL_CAPACITACION_DETAIL = 60 * 10  # 10 minutos para detalle de capacitación
 CACHE_TTL_MIS_CAPACITACIONES = 60 * 2  # 2 minutos para mis capacitaciones (cambia más frecuentemente)
+CACHE_TTL_ETAG_MIS_CAPACITACIONES = 60 * 60 * 24  # 24 horas de ETag de mis capacitaciones (304 tras vencer los datos)
 CACHE_TTL_PROGRESO_EMPRESARIAL = 60 * 30  # 30 minutos para analítica empresarial (datos pesados)
+CACHE_STALE_PROGRESO_EMPRESARIAL = 60 * 60 * 24  # 24 horas sirviendo el valor vencido mientras se recalcula
+CACHE_TTL_ESTRUCTURA_CAPACITACION = 60 * 60  # 1 hora para el catálogo de estructura (se versiona al editar)
+CACHE_TTL_ESTRUCTURA_SIN_COMPARTIR = 60  # 1 minuto de token de estructura cuando el cache es por proceso (LocMem)
+CACHE_ESTRUCTURAS_LOCALES_MAX = 256  # capacitaciones con estructura en memoria de cada proceso (LRU)
+CACHE_TTL_LISTADOS_EXAMENES = 60 * 60 * 6  # 6 horas para listados paginados de exámenes (se versionan al cambiar)
+CACHE_TTL_CATALOGO_ORGANIZACION = 60 * 10  # 10 minutos para el catálogo empresa/unidad/proyecto/centro/cargo/examen (se versiona al editar)
+CACHE_RESPUESTAS_GZIP_MIN_BYTES = 1024  # Respuestas cacheadas mayores se guardan comprimidas (None = nunca)
+AUTH_USUARIO_CACHE_TTL = 60  # 1 minuto reutilizando usuario + colaborador por token JWT (0 = sin cache)
+
+# Write-behind de heartbeats de progreso: los avances intermedios se acumulan en
+# cache y la tarea capacitaciones.tasks.volcar_progreso_buffer los escribe en bloque.
+# Requiere que PROGRESO_BUFFER_CACHE sea un alias de django_redis; si no, se
+# ignora y el progreso se escribe en forma síncrona.
+PROGRESO_WRITE_BEHIND = config('PROGRESO_WRITE_BEHIND', default=False, cast=bool)
+PROGRESO_BUFFER_CACHE = 'compartido'  # alias de CACHES con el buffer (Redis)
+PROGRESO_BUFFER_TTL = 60 * 60  # 1 hora sin heartbeats ni volcados antes de descartarse
+# timestamp de completado enviado por clientes offline (ingesta por lotes): se acota
+# a la hora del servidor y se ignora si es más viejo o más futuro que estos márgenes
+PROGRESO_TIMESTAMP_MAX_ANTIGUEDAD = 60 * 60 * 24 * 30  # 30 días
+PROGRESO_TIMESTAMP_DESFASE_FUTURO = 60 * 5  # 5 minutos de desfase de reloj tolerado
+
+# Calentamiento de cache tras escrituras: al confirmarse una creación, edición o
+# cambio de inscritos se encola capacitaciones.tasks.calentar_cache, que reconstruye
+# las entradas invalidadas. Requiere un worker de Celery; desactivado, las entradas
+# se reconstruyen en la siguiente lectura.
+CACHE_CALENTAMIENTO_ACTIVO = config('CACHE_CALENTAMIENTO_ACTIVO', default=False, cast=bool)
+CACHE_CALENTAMIENTO_CONCURRENCIA = 2  # tareas de calentamiento simultáneas como máximo
+CACHE_CALENTAMIENTO_MAX_COLABORADORES = 50  # listados "mis capacitaciones" reconstruidos por tarea
@@ -30,6 +30,25 @@ DATABASES = {
 
 CACHES = {
     "default": {
+        "BACKEND": "core.metricas_cache.MedicionCache",
+        "OPTIONS": {
+            "DESTINO": "niveles",
+            "METRICAS": "compartido",
+            "METRICAS_INTERVALO": 10,
+        }
+    },
+    "niveles": {
+        "BACKEND": "core.cache.DosNivelesCache",
+        "LOCATION": "lms-l1",
+        "OPTIONS": {
+            "L2": "compartido",
+            "MAX_ENTRIES": 1000,
+            "L1_TIMEOUT": 30,
+            "SYNC_INTERVAL": 1,
+            "EXCLUDE_PREFIXES": [],
+        }
+    },
+    "compartido": {
         "BACKEND": "django_redis.cache.RedisCache",
         "LOCATION": "redis://redis:6379/1",
         "OPTIONS": {
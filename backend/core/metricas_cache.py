@@ -0,0 +1,306 @@
+"""
+Métricas de uso del cache por familia de claves.
+
+MedicionCache envuelve otro alias de CACHES y cuenta, por familia (prefijo de
+la clave: cap_detail, mis_caps, reporte_correos, progreso_empresarial...):
+hits, misses, sets, deletes, bytes escritos y el tiempo de reconstrucción tras
+un miss (lo que tarda el mismo hilo en hacer el set de una clave que no
+encontró).
+
+Los contadores se acumulan en memoria del proceso y se vuelcan cada
+METRICAS_INTERVALO segundos con incr sobre el alias METRICAS (compartido entre
+workers), así leer_metricas_cache() ve el total de todos los procesos. Si
+METRICAS es django_redis el volcado completo (contadores y conjunto de
+familias) es un solo pipeline.
+
+Los bytes escritos son exactos para bytes/str y respuestas pre-renderizadas
+(core.respuestas); otros valores se serializan sólo en 1 de cada
+METRICAS_MUESTREO escrituras y se cuentan multiplicados, una estimación.
+
+Configuración:
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.metricas_cache.MedicionCache',
+            'OPTIONS': {
+                'DESTINO': 'niveles',       # alias que guarda realmente los valores
+                'METRICAS': 'compartido',   # alias donde se suman los contadores
+                'METRICAS_INTERVALO': 10,   # segundos entre volcados
+                'METRICAS_MUESTREO': 10,    # 1 de cada N valores se serializa para medirlo
+            },
+        },
+        'niveles': {...},
+        'compartido': {...},
+    }
+"""
+import pickle
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+METRICAS_PREFIX = 'metricas_cache'
+METRICAS_FAMILIAS = f'{METRICAS_PREFIX}:familias'
+CONTADORES = ('hits', 'misses', 'sets', 'deletes', 'bytes', 'reconstrucciones', 'reconstruccion_ms')
+SIN_PREFIJO = 'sin_prefijo'
+MAX_MISSES_PENDIENTES = 1000
+
+_NO_ENCONTRADO = object()
+
+_hash = re.compile(r'[0-9a-f]{32,}')
+_sufijo_numerico = re.compile(r'(_?\d+)+$')
+
+# Contadores pendientes de volcar, compartidos por los hilos del proceso
+_pendientes = {}  # {familia: {contador: valor}}
+_pendientes_lock = threading.Lock()
+_ultimo_volcado = [0.0]
+_misses = threading.local()  # {clave: instante del miss} por hilo
+
+
+def familia_clave(key):
+    """Familia de una clave: su primer segmento sin ids numéricos al final"""
+    segmento = str(key).split(':', 1)[0]
+    if _hash.fullmatch(segmento):
+        return SIN_PREFIJO
+    return _sufijo_numerico.sub('', segmento) or SIN_PREFIJO
+
+
+def _alias_metricas():
+    opciones = settings.CACHES.get('default', {}).get('OPTIONS', {})
+    return opciones.get('METRICAS', opciones.get('DESTINO'))
+
+
+def _sumar(familia, **valores):
+    with _pendientes_lock:
+        contadores = _pendientes.setdefault(familia, {})
+        for nombre, valor in valores.items():
+            contadores[nombre] = contadores.get(nombre, 0) + valor
+
+
+def _clave_contador(familia, nombre):
+    return f'{METRICAS_PREFIX}:{familia}:{nombre}'
+
+
+def _incrementar(destino, clave, valor):
+    try:
+        destino.incr(clave, valor)
+    except (ValueError, TypeError):
+        # Contador inexistente (django_redis sin Lua lanza TypeError en vez de ValueError)
+        destino.add(clave, 0, None)
+        destino.incr(clave, valor)
+
+
+def _redis_metricas(destino):
+    """Cliente de django_redis del alias de métricas, o None si es otro backend"""
+    cliente = getattr(destino, 'client', None)
+    return cliente if hasattr(cliente, 'get_client') else None
+
+
+def _leer_familias(destino):
+    redis = _redis_metricas(destino)
+    if redis is not None:
+        miembros = redis.get_client(write=False).smembers(redis.make_key(METRICAS_FAMILIAS))
+        return sorted(miembro.decode() for miembro in miembros)
+    return destino.get(METRICAS_FAMILIAS) or []
+
+
+def volcar_metricas(alias=None):
+    """Suma los contadores pendientes del proceso en el alias de métricas"""
+    alias = alias or _alias_metricas()
+    if not alias:
+        return
+    with _pendientes_lock:
+        pendientes = dict(_pendientes)
+        _pendientes.clear()
+        _ultimo_volcado[0] = time.monotonic()
+    if not pendientes:
+        return
+
+    destino = caches[alias]
+    redis = _redis_metricas(destino)
+    if redis is not None:
+        # Un round trip: INCRBY por contador y SADD de las familias (conjunto,
+        # sin carrera entre procesos que registran familias a la vez)
+        pipeline = redis.get_client(write=True).pipeline(transaction=False)
+        for familia, contadores in pendientes.items():
+            for nombre, valor in contadores.items():
+                if valor:
+                    pipeline.incrby(redis.make_key(_clave_contador(familia, nombre)), valor)
+        pipeline.sadd(redis.make_key(METRICAS_FAMILIAS), *pendientes)
+        pipeline.execute()
+        return
+
+    for familia, contadores in pendientes.items():
+        for nombre, valor in contadores.items():
+            if valor:
+                _incrementar(destino, _clave_contador(familia, nombre), valor)
+
+    # Registrar familias nuevas; se revisa en cada volcado por si otro proceso
+    # sobrescribió la lista al mismo tiempo
+    familias = set(destino.get(METRICAS_FAMILIAS) or ())
+    if not set(pendientes) <= familias:
+        destino.set(METRICAS_FAMILIAS, sorted(familias | set(pendientes)), None)
+
+
+def leer_metricas_cache(alias=None):
+    """
+    {familia: contadores} acumulados por todos los procesos, con derivados:
+    hit_ratio, bytes_promedio (por set) y reconstruccion_ms_promedio.
+    """
+    alias = alias or _alias_metricas()
+    if not alias:
+        return {}
+    volcar_metricas(alias)
+    destino = caches[alias]
+    familias = _leer_familias(destino)
+    claves = [_clave_contador(f, nombre) for f in familias for nombre in CONTADORES]
+    valores = destino.get_many(claves) if claves else {}
+
+    resultado = {}
+    for familia in familias:
+        fila = {nombre: valores.get(_clave_contador(familia, nombre), 0) for nombre in CONTADORES}
+        lecturas = fila['hits'] + fila['misses']
+        fila['hit_ratio'] = round(fila['hits'] / lecturas, 4) if lecturas else None
+        fila['bytes_promedio'] = fila['bytes'] // fila['sets'] if fila['sets'] else None
+        fila['reconstruccion_ms_promedio'] = (
+            round(fila['reconstruccion_ms'] / fila['reconstrucciones'], 1)
+            if fila['reconstrucciones'] else None
+        )
+        resultado[familia] = fila
+    return resultado
+
+
+def reiniciar_metricas_cache(alias=None):
+    """Borra los contadores acumulados (los de todos los procesos)"""
+    alias = alias or _alias_metricas()
+    with _pendientes_lock:
+        _pendientes.clear()
+    if not alias:
+        return
+    destino = caches[alias]
+    familias = _leer_familias(destino)
+    destino.delete_many(
+        [_clave_contador(f, nombre) for f in familias for nombre in CONTADORES] + [METRICAS_FAMILIAS]
+    )
+
+
+class MedicionCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        opciones = params.get('OPTIONS', {})
+        self._alias_destino = opciones['DESTINO']
+        self._alias_metricas = opciones.get('METRICAS', self._alias_destino)
+        self._intervalo = opciones.get('METRICAS_INTERVALO', 10)
+        self._muestreo = max(1, opciones.get('METRICAS_MUESTREO', 10))
+
+    @property
+    def destino(self):
+        return caches[self._alias_destino]
+
+    # ---------------- registro ----------------
+    def _misses_hilo(self):
+        misses = getattr(_misses, 'claves', None)
+        if misses is None or len(misses) > MAX_MISSES_PENDIENTES:
+            misses = _misses.claves = {}
+        return misses
+
+    def _registrar_lectura(self, key, hit):
+        if hit:
+            _sumar(familia_clave(key), hits=1)
+        else:
+            _sumar(familia_clave(key), misses=1)
+            self._misses_hilo()[key] = time.monotonic()
+        self._quizas_volcar()
+
+    def _tamano(self, value):
+        """Bytes del valor: exacto si es barato, si no una muestra escalada (0 si no toca)"""
+        if isinstance(value, (bytes, bytearray, str)):
+            return len(value)
+        if isinstance(value, dict) and isinstance(value.get('cuerpo'), bytes):
+            return len(value['cuerpo'])
+        if self._muestreo > 1 and random.random() >= 1 / self._muestreo:
+            return 0
+        try:
+            return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) * self._muestreo
+        except Exception:
+            return 0
+
+    def _registrar_escritura(self, key, value):
+        familia = familia_clave(key)
+        valores = {'sets': 1, 'bytes': self._tamano(value)}
+        inicio = self._misses_hilo().pop(key, None)
+        if inicio is not None:
+            valores['reconstrucciones'] = 1
+            valores['reconstruccion_ms'] = int((time.monotonic() - inicio) * 1000)
+        _sumar(familia, **valores)
+        self._quizas_volcar()
+
+    def _registrar_borrado(self, key):
+        _sumar(familia_clave(key), deletes=1)
+        self._misses_hilo().pop(key, None)
+        self._quizas_volcar()
+
+    def _quizas_volcar(self):
+        if time.monotonic() - _ultimo_volcado[0] >= self._intervalo:
+            volcar_metricas(self._alias_metricas)
+
+    # ---------------- API de BaseCache ----------------
+    def get(self, key, default=None, version=None):
+        valor = self.destino.get(key, _NO_ENCONTRADO, version=version)
+        self._registrar_lectura(key, valor is not _NO_ENCONTRADO)
+        return default if valor is _NO_ENCONTRADO else valor
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        resultado = self.destino.get_many(keys, version=version)
+        for key in keys:
+            self._registrar_lectura(key, key in resultado)
+        return resultado
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.destino.set(key, value, timeout, version=version)
+        self._registrar_escritura(key, value)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        fallidas = self.destino.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in fallidas:
+                self._registrar_escritura(key, value)
+        return fallidas
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        agregado = self.destino.add(key, value, timeout, version=version)
+        if agregado:
+            self._registrar_escritura(key, value)
+        return agregado
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.destino.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self.destino.incr(key, delta, version=version)
+
+    def delete(self, key, version=None):
+        borrado = self.destino.delete(key, version=version)
+        self._registrar_borrado(key)
+        return borrado
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.destino.delete_many(keys, version=version)
+        for key in keys:
+            self._registrar_borrado(key)
+
+    def has_key(self, key, version=None):
+        return self.destino.has_key(key, version=version)
+
+    def clear(self):
+        self.destino.clear()
+
+    def close(self, **kwargs):
+        self.destino.close(**kwargs)
+
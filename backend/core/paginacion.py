@@ -0,0 +1,158 @@
+"""
+Paginación por cursor (keyset) para listados grandes.
+
+En vez de OFFSET, cada página continúa desde los valores de orden de la última
+fila de la anterior (WHERE (a, b) > (x, y) ORDER BY a, b LIMIT n+1), así pedir
+la página 500 cuesta lo mismo que la primera y no hace falta contar el total.
+El cursor que viaja al cliente es opaco: los valores de orden codificados en
+base64. El total es opcional (total=1) y se estima con las estadísticas de la
+tabla en vez de un COUNT. El orden debe terminar en un campo único (normalmente
+la pk) para que el cursor sea estable ante empates, y sus campos no deben
+admitir nulos.
+"""
+import base64
+import json
+
+from django.db import connections
+from django.db.models import Q
+
+TAMANO_PAGINA_DEFECTO = 50
+TAMANO_PAGINA_MAXIMO = 200
+
+
+class CursorInvalido(ValueError):
+    """El cursor recibido no se puede decodificar o no corresponde al orden del listado"""
+
+
+def codificar_cursor(valores):
+    """Cursor opaco a partir de los valores de orden de la última fila"""
+    crudo = json.dumps(list(valores), default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, cantidad):
+    """Valores de orden de un cursor; CursorInvalido si está mal formado"""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (ValueError, TypeError) as e:
+        raise CursorInvalido('Cursor inválido') from e
+    if not isinstance(valores, list) or len(valores) != cantidad:
+        raise CursorInvalido('Cursor inválido')
+    return valores
+
+
+def tamano_pagina(request, defecto=TAMANO_PAGINA_DEFECTO, maximo=TAMANO_PAGINA_MAXIMO, parametro='page_size'):
+    """page_size del query string acotado a [1, maximo]; `defecto` si no es un número"""
+    try:
+        valor = int(request.query_params.get(parametro, defecto))
+    except (TypeError, ValueError):
+        return defecto
+    return min(max(valor, 1), maximo)
+
+
+def _filtro_despues_de(orden, valores):
+    """Q de las filas que van después de `valores` según `orden` (comparación lexicográfica)"""
+    filtro = Q()
+    iguales = Q()
+    for campo, valor in zip(orden, valores):
+        nombre = campo.lstrip('-')
+        operador = 'lt' if campo.startswith('-') else 'gt'
+        filtro |= iguales & Q(**{f'{nombre}__{operador}': valor})
+        iguales &= Q(**{nombre: valor})
+    return filtro
+
+
+def paginar_por_cursor(queryset, orden, cursor=None, page_size=TAMANO_PAGINA_DEFECTO):
+    """
+    (filas, siguiente_cursor) de `queryset` ordenado por `orden` (p. ej.
+    ('-fecha', 'pk')) a partir de `cursor`; siguiente_cursor es None en la
+    última página. Los campos del orden deben ser atributos de las filas (o
+    claves, si el queryset usa values()). Lanza CursorInvalido si el cursor
+    no es válido.
+    """
+    orden = tuple(orden)
+    queryset = queryset.order_by(*orden)
+    if cursor:
+        queryset = queryset.filter(_filtro_despues_de(orden, decodificar_cursor(cursor, len(orden))))
+
+    filas = list(queryset[:page_size + 1])
+    if len(filas) <= page_size:
+        return filas, None
+
+    filas = filas[:page_size]
+    ultima = filas[-1]
+    valores = []
+    for campo in orden:
+        nombre = campo.lstrip('-')
+        valor = ultima.get(nombre) if isinstance(ultima, dict) else getattr(ultima, 'pk' if nombre == 'pk' else nombre)
+        valores.append(valor)
+    return filas, codificar_cursor(valores)
+
+
+def usa_cursor(request):
+    """True si el cliente pidió paginación por cursor (param `cursor`, vacío en la primera página)"""
+    return 'cursor' in request.query_params
+
+
+def pide_total(request):
+    """True si el cliente pidió el total aproximado (total=1)"""
+    return request.query_params.get('total', '').lower() in ('1', 'true', 'si')
+
+
+def parametros_cursor(request):
+    """Query params que identifican una página por cursor (para claves de cache)"""
+    return {
+        'cursor': request.query_params.get('cursor', ''),
+        'size': request.query_params.get('page_size', ''),
+        'total': int(pide_total(request)),
+    }
+
+
+def _filas_estimadas(alias, tabla):
+    """Filas de la tabla según las estadísticas del motor, o None si no hay"""
+    conexion = connections[alias]
+    if conexion.vendor == 'mysql':
+        sql = (
+            'SELECT TABLE_ROWS FROM information_schema.TABLES '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s'
+        )
+    elif conexion.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)'
+    else:
+        return None
+    with conexion.cursor() as cursor:
+        cursor.execute(sql, [tabla])
+        fila = cursor.fetchone()
+    if not fila or fila[0] is None or fila[0] < 0:
+        return None
+    return int(fila[0])
+
+
+def total_aproximado(queryset):
+    """
+    Total del listado sin recorrer la tabla: sin filtros, la estimación de las
+    estadísticas (MySQL information_schema.TABLES, PostgreSQL pg_class); con
+    filtros o sin estadísticas, COUNT exacto.
+    """
+    if not queryset.query.where:
+        estimado = _filas_estimadas(queryset.db, queryset.model._meta.db_table)
+        if estimado is not None:
+            return estimado
+    return queryset.count()
+
+
+def paginar_request(request, queryset, orden, defecto=TAMANO_PAGINA_DEFECTO, maximo=TAMANO_PAGINA_MAXIMO):
+    """
+    Página por cursor según los query params (cursor, page_size, total).
+    Retorna (filas, datos): `datos` es el cuerpo de la respuesta sin 'results'
+    (next_cursor, page_size y, si se pidió, total_aproximado). Lanza CursorInvalido.
+    """
+    page_size = tamano_pagina(request, defecto, maximo)
+    filas, siguiente = paginar_por_cursor(
+        queryset, orden, cursor=request.query_params.get('cursor'), page_size=page_size
+    )
+    datos = {'next_cursor': siguiente, 'page_size': page_size}
+    if pide_total(request):
+        datos['total_aproximado'] = total_aproximado(queryset)
+    return filas, datos
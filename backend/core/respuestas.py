@@ -0,0 +1,75 @@
+"""
+Cache de respuestas JSON ya renderizadas.
+
+Las vistas con cache guardan el cuerpo final en bytes (comprimido con gzip si
+supera CACHE_RESPUESTAS_GZIP_MIN_BYTES) en lugar de `serializer.data`. En un
+hit se responde directamente con esos bytes, sin pasar por el renderer de DRF.
+A clientes que no aceptan gzip se les descomprime al vuelo, que es mucho más
+barato que volver a renderizar.
+
+Las dos codificaciones son representaciones distintas: la comprimida lleva el
+ETag con el sufijo -gzip y toda respuesta declara Vary: Accept-Encoding, así
+un cache intermedio no entrega el cuerpo gzip a quien no lo acepta.
+"""
+import gzip
+import re
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+_acepta_gzip = re.compile(r'\bgzip\b')
+SUFIJO_ETAG_GZIP = '-gzip'
+
+
+def _umbral_gzip():
+    """Tamaño mínimo para comprimir (None desactiva la compresión)"""
+    return getattr(settings, 'CACHE_RESPUESTAS_GZIP_MIN_BYTES', 1024)
+
+
+def renderizar_respuesta(datos):
+    """Renderiza `datos` a JSON una sola vez; el resultado es lo que se guarda en cache"""
+    cuerpo = JSONRenderer().render(datos)
+    umbral = _umbral_gzip()
+    if umbral is not None and len(cuerpo) >= umbral:
+        return {'cuerpo': gzip.compress(cuerpo, compresslevel=6), 'gzip': True}
+    return {'cuerpo': cuerpo, 'gzip': False}
+
+
+def es_respuesta_renderizada(valor):
+    """True si `valor` viene de renderizar_respuesta (y no de un formato anterior del cache)"""
+    return isinstance(valor, dict) and 'cuerpo' in valor and 'gzip' in valor
+
+
+def etag_gzip(etag):
+    """ETag de la representación comprimida: '"x"' -> '"x-gzip"'"""
+    if etag.endswith('"'):
+        return etag[:-1] + SUFIJO_ETAG_GZIP + '"'
+    return etag + SUFIJO_ETAG_GZIP
+
+
+def etag_sin_codificacion(etag):
+    """ETag base de cualquiera de las dos representaciones (para If-None-Match)"""
+    return etag.replace(SUFIJO_ETAG_GZIP + '"', '"')
+
+
+def respuesta_renderizada(request, renderizada, status=200, headers=None):
+    """HttpResponse con el cuerpo pre-renderizado; DRF no vuelve a renderizarla"""
+    cuerpo = renderizada['cuerpo']
+    response = HttpResponse(content_type='application/json', status=status)
+    comprimida = False
+    if renderizada['gzip']:
+        if _acepta_gzip.search(request.headers.get('Accept-Encoding', '')):
+            response['Content-Encoding'] = 'gzip'
+            comprimida = True
+        else:
+            cuerpo = gzip.decompress(cuerpo)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response.content = cuerpo
+    response['Content-Length'] = str(len(cuerpo))
+    for nombre, valor in (headers or {}).items():
+        if comprimida and nombre.lower() == 'etag':
+            valor = etag_gzip(valor)
+        response[nombre] = valor
+    return response
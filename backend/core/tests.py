@@ -0,0 +1,110 @@
+from django.test import SimpleTestCase, override_settings
+
+
+class TestRespuestaRenderizada(SimpleTestCase):
+    """Tests del cache de respuestas JSON pre-renderizadas (core.respuestas)"""
+
+    @override_settings(CACHE_RESPUESTAS_GZIP_MIN_BYTES=10)
+    def test_cuerpo_comprimido_se_sirve_segun_accept_encoding(self):
+        """El mismo cuerpo cacheado sirve a clientes con y sin gzip, con ETag distinto"""
+        import gzip
+        import json
+        from django.test import RequestFactory
+        from core.respuestas import renderizar_respuesta, respuesta_renderizada
+
+        datos = [{'id': i, 'titulo': 'Capacitación'} for i in range(20)]
+        renderizada = renderizar_respuesta(datos)
+        self.assertTrue(renderizada['gzip'])
+
+        con_gzip = respuesta_renderizada(
+            RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, br'), renderizada, headers={'ETag': '"x"'}
+        )
+        self.assertEqual(con_gzip['Content-Encoding'], 'gzip')
+        self.assertEqual(con_gzip['ETag'], '"x-gzip"')
+        self.assertEqual(con_gzip['Vary'], 'Accept-Encoding')
+        self.assertEqual(json.loads(gzip.decompress(con_gzip.content)), datos)
+
+        sin_gzip = respuesta_renderizada(RequestFactory().get('/'), renderizada, headers={'ETag': '"x"'})
+        self.assertFalse(sin_gzip.has_header('Content-Encoding'))
+        self.assertEqual(sin_gzip['ETag'], '"x"')
+        self.assertEqual(sin_gzip['Vary'], 'Accept-Encoding')
+        self.assertEqual(json.loads(sin_gzip.content), datos)
+
+    def test_cuerpo_sin_comprimir_declara_vary(self):
+        """Aunque este cuerpo no se comprima, la URL puede variar por Accept-Encoding"""
+        from django.test import RequestFactory
+        from core.respuestas import renderizar_respuesta, respuesta_renderizada
+
+        respuesta = respuesta_renderizada(
+            RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'), renderizar_respuesta({}), headers={'ETag': '"y"'}
+        )
+        self.assertFalse(respuesta.has_header('Content-Encoding'))
+        self.assertEqual(respuesta['ETag'], '"y"')
+        self.assertEqual(respuesta['Vary'], 'Accept-Encoding')
+
+    def test_etag_base_de_ambas_representaciones(self):
+        from core.respuestas import etag_gzip, etag_sin_codificacion
+
+        self.assertEqual(etag_sin_codificacion(etag_gzip('"x"')), '"x"')
+        self.assertEqual(etag_sin_codificacion('"x"'), '"x"')
+        self.assertEqual(etag_gzip('W/"x"'), 'W/"x-gzip"')
+
+
+def _redis_fake():
+    """Alias django_redis sobre fakeredis (None si fakeredis no está instalado)"""
+    try:
+        import fakeredis
+    except ImportError:
+        return None
+    return {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://tests-fake:6379/2',
+        'OPTIONS': {'CONNECTION_POOL_KWARGS': {'connection_class': fakeredis.FakeConnection}},
+    }
+
+
+class TestLockRedis(SimpleTestCase):
+    """Liberación condicionada de locks en Redis (core.cache.liberar_lock_redis)"""
+
+    def setUp(self):
+        redis_fake = _redis_fake()
+        if redis_fake is None:
+            self.skipTest('fakeredis no instalado')
+        ajustes = override_settings(CACHES={
+            'default': {'BACKEND': 'core.cache.DosNivelesCache', 'OPTIONS': {'L2': 'compartido'}},
+            'compartido': redis_fake,
+        })
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        from core.cache import cliente_redis
+        self.cliente, alias = cliente_redis()
+        self.assertEqual(alias, 'compartido')
+        self.cliente.flushdb()
+
+    def test_solo_borra_el_lock_propio(self):
+        from core.cache import liberar_lock_redis
+
+        self.cliente.set('lock', b'otro')
+        liberar_lock_redis(self.cliente, 'lock', b'mio')
+        self.assertEqual(self.cliente.get('lock'), b'otro')
+
+        self.cliente.set('lock', b'mio')
+        liberar_lock_redis(self.cliente, 'lock', b'mio')
+        self.assertIsNone(self.cliente.get('lock'))
+
+    def test_lock_tomado_entre_get_y_delete_no_se_borra(self):
+        """Si otro proceso toma el lock después del GET, el MULTI se aborta"""
+        from unittest import mock
+        import redis
+        from core.cache import liberar_lock_redis
+
+        self.cliente.set('lock', b'mio')
+
+        def get_y_otro_toma_el_lock(pipe, clave):
+            self.cliente.set(clave, b'otro')
+            return b'mio'
+
+        with mock.patch.object(redis.client.Pipeline, 'get', autospec=True, side_effect=get_y_otro_toma_el_lock):
+            liberar_lock_redis(self.cliente, 'lock', b'mio')
+        self.assertEqual(self.cliente.get('lock'), b'otro')
@@ -0,0 +1,38 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from examenes.utils import (
+	NS_REPORTE, clave_listado, invalidar_namespaces, namespace_lote
+)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CacheListadosExamenesTests(SimpleTestCase):
+	"""Namespaces versionados de los listados paginados de exámenes"""
+
+	def setUp(self):
+		cache.clear()
+
+	def test_invalidar_lote_cambia_todas_sus_paginas(self):
+		claves = [
+			clave_listado(namespace_lote(5), 'trabajadores_correo', page=page, size=size, search='')
+			for page in (1, 2, 7) for size in (10, 25, 33)
+		]
+		otro_lote = clave_listado(namespace_lote(6), 'trabajadores_correo', page=1, size=25, search='')
+		reporte = clave_listado(NS_REPORTE, 'reporte_correos', page=1, size=25)
+
+		invalidar_namespaces(namespace_lote(5))
+
+		nuevas = [
+			clave_listado(namespace_lote(5), 'trabajadores_correo', page=page, size=size, search='')
+			for page in (1, 2, 7) for size in (10, 25, 33)
+		]
+		self.assertFalse(set(claves) & set(nuevas))
+		self.assertEqual(clave_listado(namespace_lote(6), 'trabajadores_correo', page=1, size=25, search=''), otro_lote)
+		self.assertEqual(clave_listado(NS_REPORTE, 'reporte_correos', page=1, size=25), reporte)
+
+	def test_parametros_distintos_generan_claves_distintas(self):
+		self.assertNotEqual(
+			clave_listado(namespace_lote(5), 'trabajadores_correo', page=1, size=25, search=''),
+			clave_listado(namespace_lote(5), 'trabajadores_correo', page=1, size=25, search='123')
+		)
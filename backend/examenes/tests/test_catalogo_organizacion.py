@@ -0,0 +1,53 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from analitica.models import Centroop, Epresa, Proyecto, Unidadnegocio
+from analitica.utils import (
+	buscar_en_catalogo, invalidar_catalogo_organizacion, normalizar_nombre,
+	obtener_catalogo_organizacion
+)
+
+
+class NormalizarNombreTests(SimpleTestCase):
+	"""Nombres comparables para los índices del catálogo de organización"""
+
+	def test_ignora_tildes_mayusculas_y_espacios(self):
+		self.assertEqual(normalizar_nombre('  Médico   OCUPACIONAL '), 'medico ocupacional')
+		self.assertEqual(normalizar_nombre('BOGOTÁ'), normalizar_nombre('bogota'))
+		self.assertEqual(normalizar_nombre(None), '')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CatalogoOrganizacionTests(TestCase):
+	"""Catálogo versionado de empresa/unidad/proyecto/centro/cargo/examen"""
+
+	def setUp(self):
+		cache.clear()
+		empresa = Epresa.objects.create(nitempresa='1', nombre_empresa='Catálogo', estadoempresa=1)
+		unidad = Unidadnegocio.objects.create(
+			nombreunidad='Catálogo', descripcionunidad='test', estadounidad=1, id_empresa=empresa
+		)
+		proyecto = Proyecto.objects.create(nombreproyecto='Catálogo', estadoproyecto=1, id_unidad=unidad)
+		self.centro = Centroop.objects.create(nombrecentrop='Centro Médico', estadocentrop=1, id_proyecto=proyecto)
+
+	def test_catalogo_cacheado_buscable_e_invalidable(self):
+		catalogo = obtener_catalogo_organizacion()
+		encontrado = buscar_en_catalogo(
+			catalogo, 'centros', f' {self.centro.nombrecentrop.lower()} ', self.centro.id_proyecto_id
+		)
+		self.assertEqual(encontrado.pk, self.centro.pk)
+		self.assertIsNone(buscar_en_catalogo(catalogo, 'centros', self.centro.nombrecentrop, -1))
+
+		with self.assertNumQueries(0):
+			self.assertIs(obtener_catalogo_organizacion(), catalogo)
+			# La jerarquía ya viene resuelta
+			self.assertEqual(encontrado.id_proyecto.pk, self.centro.id_proyecto_id)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			Centroop.objects.filter(pk=self.centro.pk).update(nombrecentrop='Centro Renombrado')
+			invalidar_catalogo_organizacion()
+		nuevo = obtener_catalogo_organizacion()
+		self.assertNotEqual(nuevo['version'], catalogo['version'])
+		self.assertEqual(
+			buscar_en_catalogo(nuevo, 'centros', 'centro renombrado', self.centro.id_proyecto_id).pk, self.centro.pk
+		)
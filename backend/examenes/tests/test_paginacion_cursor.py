@@ -0,0 +1,109 @@
+from django.db import connection
+from django.db.models import Count
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from analitica.models import Centroop, Epresa, Proyecto, Unidadnegocio
+from core.paginacion import CursorInvalido, paginar_request, parametros_cursor, usa_cursor
+from examenes.models import CorreoExamenEnviado, RegistroExamenes
+from examenes.views import DetalleCorreoEnviadoView, ListarTrabajadoresCorreoView
+from examenes.utils import NS_REPORTE, clave_listado
+
+
+def _request(**params):
+	return Request(APIRequestFactory().get('/', params))
+
+
+def _crear_lotes(lotes=3, trabajadores=3):
+	"""Lotes de correo nuevos, cada uno con `trabajadores` registros, y su cadena organizacional"""
+	from usuarios.models import Cargo, Colaboradores
+
+	empresa = Epresa.objects.create(nitempresa='1', nombre_empresa='Lotes', estadoempresa=1)
+	unidad = Unidadnegocio.objects.create(
+		nombreunidad='Lotes', descripcionunidad='test', estadounidad=1, id_empresa=empresa
+	)
+	proyecto = Proyecto.objects.create(nombreproyecto='Lotes', estadoproyecto=1, id_unidad=unidad)
+	centro = Centroop.objects.create(nombrecentrop='Lotes', estadocentrop=1, id_proyecto=proyecto)
+	cargo = Cargo.objects.create(nombrecargo='Lotes')
+	remitente = Colaboradores.objects.create(
+		cccolaborador='900100', nombrecolaborador='Test', apellidocolaborador='Lotes',
+		centroop=centro, cargocolaborador=cargo
+	)
+	correos = []
+	for i in range(lotes):
+		correo = CorreoExamenEnviado.objects.create(
+			enviado_por=remitente, asunto=f'Lote {i}', cuerpo_correo='test',
+			correos_destino='test@example.com', tipo_examen='INGRESO'
+		)
+		for j in range(trabajadores):
+			RegistroExamenes.objects.create(
+				correo_lote=correo, nombre_trabajador=f'Trabajador {j}', documento_trabajador=f'{i}{j}',
+				empresa=empresa, cargo=cargo, centro=centro, tipo_examen='INGRESO', examenes_asignados=''
+			)
+		correos.append(correo)
+	return correos
+
+
+class ParametrosCursorTests(SimpleTestCase):
+	"""Selección del modo de paginación y claves de cache por cursor"""
+
+	def test_modo_cursor_solo_con_param_cursor(self):
+		self.assertFalse(usa_cursor(_request(page=2, page_size=25)))
+		self.assertTrue(usa_cursor(_request(cursor='', page_size=25)))
+
+	def test_claves_distintas_por_cursor_y_total(self):
+		claves = {
+			clave_listado(NS_REPORTE, 'reporte_correos', **parametros_cursor(_request(**params)))
+			for params in ({'cursor': ''}, {'cursor': 'abc'}, {'cursor': '', 'total': 1}, {'cursor': '', 'page_size': 10})
+		}
+		self.assertEqual(len(claves), 4)
+		self.assertNotIn(clave_listado(NS_REPORTE, 'reporte_correos', page='1', size='25'), claves)
+
+
+class PaginarRequestTests(TestCase):
+	"""Recorrido por cursor del reporte de correos enviados"""
+
+	def test_paginas_encadenadas_siguen_el_orden_del_reporte(self):
+		_crear_lotes(lotes=3, trabajadores=1)
+		correos = CorreoExamenEnviado.objects.all()
+		esperado = list(correos.order_by('-fecha_envio', 'id').values_list('id', flat=True))
+		self.assertGreaterEqual(len(esperado), 3)
+
+		vistos, cursor = [], ''
+		while True:
+			filas, datos = paginar_request(
+				_request(cursor=cursor, page_size=1, total=1), correos, ('-fecha_envio', 'id')
+			)
+			vistos += [c.id for c in filas]
+			self.assertEqual(datos['page_size'], 1)
+			self.assertGreaterEqual(datos['total_aproximado'], 0)
+			cursor = datos['next_cursor']
+			if cursor is None:
+				break
+
+		self.assertEqual(vistos, esperado)
+
+	def test_cursor_invalido(self):
+		with self.assertRaises(CursorInvalido):
+			paginar_request(_request(cursor='zz'), CorreoExamenEnviado.objects.all(), ('-fecha_envio', 'id'))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TotalTrabajadoresCursorTests(TestCase):
+	"""total_trabajadores solo se cuenta en la primera página por cursor"""
+
+	def test_paginas_siguientes_sin_count(self):
+		correo = CorreoExamenEnviado.objects.annotate(
+			n=Count('trabajadores')
+		).get(pk=_crear_lotes(lotes=1)[0].pk)
+
+		for vista in (DetalleCorreoEnviadoView, ListarTrabajadoresCorreoView):
+			primera = vista().get(_request(cursor='', page_size=1), correo.id).data
+			self.assertEqual(primera['total_trabajadores'], correo.n)
+
+			with CaptureQueriesContext(connection) as consultas:
+				siguiente = vista().get(_request(cursor=primera['next_cursor'], page_size=1), correo.id).data
+			self.assertNotIn('total_trabajadores', siguiente)
+			self.assertFalse([q for q in consultas.captured_queries if 'COUNT(' in q['sql'].upper()])
@@ -0,0 +1,60 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+# ==================== CACHE DE LISTADOS PAGINADOS ====================
+# Los listados paginados de exámenes se guardan bajo un namespace versionado:
+# la clave de cada página incluye el token vigente del namespace. Invalidar es
+# renovar el token, sin importar cuántas páginas o tamaños de página existan.
+#
+# Namespaces:
+#   - NS_REPORTE: reporte general de correos (cambia al crear un lote)
+#   - NS_REGISTROS_TIPO: registros por tipo de examen (lotes nuevos y cambios de estado)
+#   - namespace_lote(id): detalle y trabajadores de un lote (cambios de estado)
+NAMESPACE_PREFIX = 'examenes_ns'
+NS_REPORTE = 'reporte'
+NS_REGISTROS_TIPO = 'registros_tipo'
+
+
+def namespace_lote(correo_id):
+    return f'lote:{correo_id}'
+
+
+def _clave_namespace(namespace):
+    return f'{NAMESPACE_PREFIX}:{namespace}'
+
+
+def ttl_listados_examenes():
+    return getattr(settings, 'CACHE_TTL_LISTADOS_EXAMENES', 60 * 60 * 6)
+
+
+def version_namespace(namespace):
+    """Token de versión vigente del namespace (se crea si no existe)"""
+    clave = _clave_namespace(namespace)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, uuid.uuid4().hex, None)
+        version = cache.get(clave)
+    return version
+
+
+def clave_listado(namespace, nombre, **params):
+    """
+    Clave de cache de un listado dentro de un namespace versionado.
+    `params` son los parámetros que cambian el resultado (página, tamaño, búsqueda).
+    """
+    partes = [namespace, version_namespace(namespace)]
+    partes.extend(f'{k}={params[k]}' for k in sorted(params))
+    # El nombre del listado encabeza la clave: es su familia en las métricas de cache
+    return f'{nombre}:' + hashlib.md5(
+        ':'.join(str(p) for p in partes).encode()
+    ).hexdigest()
+
+
+def invalidar_namespaces(*namespaces):
+    """Renueva el token de cada namespace: todas sus páginas cacheadas quedan obsoletas"""
+    if namespaces:
+        cache.set_many({_clave_namespace(ns): uuid.uuid4().hex for ns in namespaces}, None)
@@ -18,14 +18,25 @@ import csv
 import logging
 from django.db.models import F, Prefetch
 
+from core.paginacion import CursorInvalido, paginar_request, parametros_cursor, usa_cursor
+from core.respuestas import es_respuesta_renderizada, renderizar_respuesta, respuesta_renderizada
 from usuarios.models import Cargo
 from usuarios.permissions import IsUsuarioEspecial, IsSuperAdmin
-from analitica.models import Epresa, Unidadnegocio, Proyecto, Centroop
+from analitica.models import Epresa, Centroop
+from analitica.utils import buscar_en_catalogo, obtener_catalogo_organizacion
 
 from django.core.mail import send_mail, EmailMultiAlternatives
 from django.conf import settings
 
 from .models import ExamenesCargo, CorreoExamenEnviado, RegistroExamenes, Examen, ExamenTrabajador
+from .utils import (
+    NS_REGISTROS_TIPO,
+    NS_REPORTE,
+    clave_listado,
+    invalidar_namespaces,
+    namespace_lote,
+    ttl_listados_examenes,
+)
 
 # Tipos de examen válidos
 TIPOS_EXAMEN_VALIDOS = ['INGRESO', 'PERIODICO', 'RETIRO', 'ESPECIAL', 'POST_INCAPACIDAD']
@@ -52,9 +63,12 @@ class ReporteCorreosEnviadosView(APIView):
 
     def get(self, request):
         """Obtiene lista paginada de correos enviados (con cache)."""
+        if usa_cursor(request):
+            return self._get_por_cursor(request)
+
         page = request.query_params.get('page', '1')
         page_size = request.query_params.get('page_size', '25')
-        cache_key = f"reporte_correos_page={page}_size={page_size}"
+        cache_key = clave_listado(NS_REPORTE, 'reporte_correos', page=page, size=page_size)
 
         cached = cache.get(cache_key)
         if cached is not None:
@@ -68,14 +82,34 @@ class ReporteCorreosEnviadosView(APIView):
 
         if paginated_data:
             # Guardar en cache y marcar MISS
-            cache.set(cache_key, paginated_data.data, timeout=300)
+            cache.set(cache_key, paginated_data.data, timeout=ttl_listados_examenes())
             paginated_data['X-Cache'] = 'MISS'
             return paginated_data
 
         # Fallback sin paginación
         serializer = ReporteCorreoSerializer(correos, many=True)
         data = serializer.data
-        cache.set(cache_key, data, timeout=300)
+        cache.set(cache_key, data, timeout=ttl_listados_examenes())
+        return Response(data, status=status.HTTP_200_OK, headers={'X-Cache': 'MISS'})
+
+    def _get_por_cursor(self, request):
+        """Página por cursor sobre (-fecha_envio, id): sin OFFSET ni COUNT."""
+        cache_key = clave_listado(
+            NS_REPORTE, 'reporte_correos', **parametros_cursor(request)
+        )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return Response(cached, status=status.HTTP_200_OK, headers={'X-Cache': 'HIT'})
+
+        try:
+            correos, data = paginar_request(
+                request, self._get_correos_queryset(), ('-fecha_envio', 'id'), defecto=25, maximo=100
+            )
+        except CursorInvalido as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = {'results': ReporteCorreoSerializer(correos, many=True).data, **data}
+        cache.set(cache_key, data, timeout=ttl_listados_examenes())
         return Response(data, status=status.HTTP_200_OK, headers={'X-Cache': 'MISS'})
 
     def _get_correos_queryset(self):
@@ -110,6 +144,19 @@ class DetalleCorreoEnviadoView(APIView):
 
     def get(self, request, correo_id):
         """Retorna metadata del correo y el listado de trabajadores (RegistroExamenes) asociados, con paginación estándar (count, next, previous, results) y cache."""
+        # Cache por lote (namespace versionado) + paginación; sólo se guardan
+        # lotes existentes, así un HIT no necesita consultar el correo
+        if usa_cursor(request):
+            cache_key = clave_listado(namespace_lote(correo_id), 'detalle_correo', **parametros_cursor(request))
+        else:
+            page = request.query_params.get('page', '1')
+            page_size = request.query_params.get('page_size', '25')
+            cache_key = clave_listado(namespace_lote(correo_id), 'detalle_correo', page=page, size=page_size)
+
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return Response(cached, status=status.HTTP_200_OK, headers={'X-Cache': 'HIT'})
+
         correo = get_object_or_404(
             CorreoExamenEnviado.objects.select_related('enviado_por'),
             id=correo_id
@@ -120,14 +167,26 @@ class DetalleCorreoEnviadoView(APIView):
             correo_lote=correo
         ).select_related('empresa', 'cargo').order_by('-fecha_registro')
 
-        # Cache por correo_id + paginación
-        page = request.query_params.get('page', '1')
-        page_size = request.query_params.get('page_size', '25')
-        cache_key = f"detalle_correo={correo_id}_page={page}_size={page_size}"
+        from .serializers import ListarTrabajadoresCorreoSerializer
 
-        cached = cache.get(cache_key)
-        if cached is not None:
-            return Response(cached, status=status.HTTP_200_OK, headers={'X-Cache': 'HIT'})
+        if usa_cursor(request):
+            # Keyset sobre (-fecha_registro, id): cualquier página cuesta lo mismo
+            try:
+                pagina, data = paginar_request(
+                    request, trabajadores, ('-fecha_registro', 'id'), defecto=25, maximo=100
+                )
+            except CursorInvalido as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            data = {
+                'results': ListarTrabajadoresCorreoSerializer(pagina, many=True).data,
+                **data,
+                # El total solo en la primera página: las siguientes no repiten el COUNT
+                **self._metadata_correo(
+                    correo, None if request.query_params.get('cursor') else trabajadores.count()
+                ),
+            }
+            cache.set(cache_key, data, timeout=ttl_listados_examenes())
+            return Response(data, status=status.HTTP_200_OK, headers={'X-Cache': 'MISS'})
 
         # Paginar resultados
         paginator = PageNumberPagination()
@@ -136,23 +195,15 @@ class DetalleCorreoEnviadoView(APIView):
         paginator.max_page_size = 100
         paginated_trabajadores = paginator.paginate_queryset(trabajadores, request, view=self)
 
-        from .serializers import ListarTrabajadoresCorreoSerializer
-
         if paginated_trabajadores is not None:
             # Serializar página actual
             serializer = ListarTrabajadoresCorreoSerializer(paginated_trabajadores, many=True)
             # Respuesta estándar de DRF: count, next, previous, results
             paginated_response = paginator.get_paginated_response(serializer.data)
             # Agregar metadata del correo
-            paginated_response.data.update({
-                "correo_id": correo.id,
-                "uuid_correo": getattr(correo, 'uuid_correo', None),
-                "asunto": correo.asunto,
-                "fecha_envio": getattr(correo, 'fecha_envio', None),
-                "total_trabajadores": trabajadores.count()
-            })
+            paginated_response.data.update(self._metadata_correo(correo, paginator.page.paginator.count))
             paginated_response['X-Cache'] = 'MISS'
-            cache.set(cache_key, paginated_response.data, timeout=300)
+            cache.set(cache_key, paginated_response.data, timeout=ttl_listados_examenes())
             return paginated_response
 
         # Fallback sin paginación (poco probable): devolver estructura similar
@@ -162,14 +213,25 @@ class DetalleCorreoEnviadoView(APIView):
             "next": None,
             "previous": None,
             "results": serializer.data,
+            **self._metadata_correo(correo, len(serializer.data)),
+        }
+        cache.set(cache_key, data, timeout=ttl_listados_examenes())
+        return Response(data, status=status.HTTP_200_OK, headers={'X-Cache': 'MISS'})
+
+    def _metadata_correo(self, correo, total=None):
+        """
+        Datos del lote que acompañan cada página de trabajadores. `total` ya
+        calculado por la paginación; None lo omite (páginas de cursor siguientes).
+        """
+        data = {
             "correo_id": correo.id,
             "uuid_correo": getattr(correo, 'uuid_correo', None),
             "asunto": correo.asunto,
             "fecha_envio": getattr(correo, 'fecha_envio', None),
-            "total_trabajadores": trabajadores.count()
         }
-        cache.set(cache_key, data, timeout=300)
-        return Response(data, status=status.HTTP_200_OK, headers={'X-Cache': 'MISS'})
+        if total is not None:
+            data["total_trabajadores"] = total
+        return data
 
 
 class EnviarCorreoView(APIView):
@@ -268,6 +330,9 @@ class EnviarCorreoView(APIView):
             ciudad=data.get('ciudad')
         )
 
+        # Lote nuevo: reporte y registros por tipo cacheados quedan obsoletos
+        invalidar_namespaces(NS_REPORTE, NS_REGISTROS_TIPO)
+
         return resultado
 
     def _get_colaborador(self, request):
@@ -489,25 +554,26 @@ class CargoEmpresaConExamenesView(APIView):
         # Intentar obtener desde cache
         cached_data = self._get_from_cache()
         if cached_data:
-            return Response(cached_data, status=status.HTTP_200_OK,
-                            headers={'X-Cache': 'HIT'})
+            return respuesta_renderizada(request, cached_data, headers={'X-Cache': 'HIT'})
 
         # Generar datos frescos
         data = self._build_empresas_data()
 
-        # Guardar en cache
-        self._save_to_cache(data)
+        # Guardar en cache (JSON ya renderizado)
+        renderizada = self._save_to_cache(data)
 
-        return Response(data, status=status.HTTP_200_OK,
-                        headers={'X-Cache': 'MISS'})
+        return respuesta_renderizada(request, renderizada, headers={'X-Cache': 'MISS'})
 
     def _get_from_cache(self):
-        """Obtiene datos desde cache."""
-        return cache.get(self.CACHE_KEY)
+        """Obtiene el JSON pre-renderizado desde cache."""
+        cached = cache.get(self.CACHE_KEY)
+        return cached if es_respuesta_renderizada(cached) else None
 
     def _save_to_cache(self, data):
-        """Guarda datos en cache."""
-        cache.set(self.CACHE_KEY, data, self.CACHE_TIMEOUT)
+        """Renderiza una sola vez y guarda el cuerpo en cache."""
+        renderizada = renderizar_respuesta(data)
+        cache.set(self.CACHE_KEY, renderizada, self.CACHE_TIMEOUT)
+        return renderizada
 
     def _build_empresas_data(self):
         """Construye estructura de datos con empresas, cargos, exámenes y estructura geográfica."""
@@ -546,17 +612,14 @@ class CargoEmpresaConExamenesView(APIView):
         Construye jerarquía geográfica de empresas activas:
         Empresa → Unidades → Proyectos → Centros (solo nombre, sin porcentajes, con claves personalizadas)
         """
-        from analitica.models import Unidadnegocio, Proyecto
-
-        centros = Centroop.objects.filter(
-            estadocentrop=1
-        ).select_related(
-            'id_proyecto__id_unidad__id_empresa'
-        ).order_by('nombrecentrop')
+        # Los centros del catálogo ya vienen ordenados por nombre y con su jerarquía resuelta
+        centros = obtener_catalogo_organizacion()['centros'].values()
 
         empresas_dict = {}
 
         for centro in centros:
+            if centro.estadocentrop != 1:
+                continue
             proyecto = centro.id_proyecto
             if not proyecto or not proyecto.estadoproyecto:
                 continue
@@ -1135,49 +1198,15 @@ class EnviarCorreoMasivoView(APIView):
             # ===================================================================
             # FASE 1: VALIDACIÓN COMPLETA DEL CSV (NO SE ENVÍA NADA AÚN)
             # ===================================================================
-            # OPTIMIZACIÓN: Precargar todos los catálogos antes del loop
-            # Esto reduce de N queries por fila a solo 6 queries totales
-            
-            # Precargar empresas (nombre_lower -> objeto)
-            empresas_map = {
-                e.nombre_empresa.lower().strip(): e 
-                for e in Epresa.objects.all()
-            }
-            
-            # Precargar unidades con su empresa (nombre_lower, empresa_id) -> objeto
-            unidades_map = {
-                (u.nombreunidad.lower().strip(), u.id_empresa_id): u
-                for u in Unidadnegocio.objects.select_related('id_empresa').all()
-            }
-            
-            # Precargar proyectos con su unidad (nombre_lower, unidad_id) -> objeto
-            proyectos_map = {
-                (p.nombreproyecto.lower().strip(), p.id_unidad_id): p
-                for p in Proyecto.objects.select_related('id_unidad').all()
-            }
-            
-            # Precargar centros con su proyecto (nombre_lower, proyecto_id) -> objeto
-            centros_map = {
-                (c.nombrecentrop.lower().strip(), c.id_proyecto_id): c
-                for c in Centroop.objects.select_related('id_proyecto').all()
-            }
-            
-            # Precargar cargos (nombre_lower -> objeto)
-            cargos_map = {
-                c.nombrecargo.lower().strip(): c
-                for c in Cargo.objects.all()
-            }
-            
-            # Precargar exámenes activos (nombre_lower -> objeto)
-            examenes_map = {
-                e.nombre.lower().strip(): e
-                for e in Examen.objects.filter(activo=True)
-            }
-            
-            logger.info(f"Catálogos precargados: {len(empresas_map)} empresas, "
-                       f"{len(unidades_map)} unidades, {len(proyectos_map)} proyectos, "
-                       f"{len(centros_map)} centros, {len(cargos_map)} cargos, "
-                       f"{len(examenes_map)} exámenes")
+            # Catálogo compartido de organización (empresas, unidades, proyectos,
+            # centros, cargos y exámenes activos) con índices por nombre normalizado:
+            # ninguna query por fila y, con el catálogo vigente, ninguna por carga
+            catalogo = obtener_catalogo_organizacion()
+
+            logger.info(f"Catálogo de organización: {len(catalogo['empresas'])} empresas, "
+                       f"{len(catalogo['unidades'])} unidades, {len(catalogo['proyectos'])} proyectos, "
+                       f"{len(catalogo['centros'])} centros, {len(catalogo['cargos'])} cargos, "
+                       f"{len(catalogo['examenes'])} exámenes")
             
             # Validar y procesar cada trabajador (resolviendo jerarquía:
             # empresa -> unidad -> proyecto -> centro)
@@ -1238,47 +1267,47 @@ class EnviarCorreoMasivoView(APIView):
                             f"Línea {idx}: No hay exámenes válidos en el campo 'Examenes'")
                         continue
 
-                    # OPTIMIZADO: Buscar empresa usando mapa precargado (O(1) en lugar de query)
-                    empresa = empresas_map.get(empresa_name.lower())
+                    # OPTIMIZADO: Buscar empresa en el catálogo (O(1) en lugar de query)
+                    empresa = buscar_en_catalogo(catalogo, 'empresas', empresa_name)
                     if not empresa:
                         errores_validacion.append(
                             f"Línea {idx}: Empresa '{empresa_name}' no encontrada")
                         continue
 
-                    # OPTIMIZADO: Buscar unidad usando mapa precargado
-                    unidad = unidades_map.get((unidad_name.lower(), empresa.idempresa))
+                    # OPTIMIZADO: Buscar unidad en el catálogo
+                    unidad = buscar_en_catalogo(catalogo, 'unidades', unidad_name, empresa.idempresa)
                     if not unidad:
                         errores_validacion.append(
                             f"Línea {idx}: Unidad '{unidad_name}' no encontrada para empresa '{empresa.nombre_empresa}'")
                         continue
 
-                    # OPTIMIZADO: Buscar proyecto usando mapa precargado
-                    proyecto = proyectos_map.get((proyecto_name.lower(), unidad.idunidad))
+                    # OPTIMIZADO: Buscar proyecto en el catálogo
+                    proyecto = buscar_en_catalogo(catalogo, 'proyectos', proyecto_name, unidad.idunidad)
                     if not proyecto:
                         errores_validacion.append(
                             f"Línea {idx}: Proyecto '{proyecto_name}' no encontrado para unidad '{unidad.nombreunidad}'")
                         continue
 
-                    # OPTIMIZADO: Buscar centro usando mapa precargado
-                    centro = centros_map.get((centro_name.lower(), proyecto.idproyecto))
+                    # OPTIMIZADO: Buscar centro en el catálogo
+                    centro = buscar_en_catalogo(catalogo, 'centros', centro_name, proyecto.idproyecto)
                     if not centro:
                         errores_validacion.append(
                             f"Línea {idx}: Centro '{centro_name}' no encontrado para proyecto '{proyecto.nombreproyecto}'"
                         )
                         continue
 
-                    # OPTIMIZADO: Buscar cargo usando mapa precargado
-                    cargo = cargos_map.get(cargo_name.lower())
+                    # OPTIMIZADO: Buscar cargo en el catálogo
+                    cargo = buscar_en_catalogo(catalogo, 'cargos', cargo_name)
                     if not cargo:
                         errores_validacion.append(
                             f"Línea {idx}: Cargo '{cargo_name}' no encontrado")
                         continue
 
-                    # OPTIMIZADO: Validar exámenes usando mapa precargado
+                    # OPTIMIZADO: Validar exámenes en el catálogo
                     examenes_bd = []
                     examen_invalido = False
                     for examen_nombre in examenes_nombres:
-                        examen = examenes_map.get(examen_nombre.lower())
+                        examen = buscar_en_catalogo(catalogo, 'examenes', examen_nombre)
                         if not examen:
                             errores_validacion.append(
                                 f"Línea {idx}: Examen '{examen_nombre}' "
@@ -1518,6 +1547,7 @@ para los trabajadores en el excel adjunto.</p>
             except Exception as e:
                 correo_lote.error_envio = str(e)
                 correo_lote.save()
+                invalidar_namespaces(NS_REPORTE, NS_REGISTROS_TIPO)
                 return Response(
                     {
                         "error": f"Error al enviar correo: {str(e)}",
@@ -1527,6 +1557,9 @@ para los trabajadores en el excel adjunto.</p>
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
 
+            # Lote nuevo: reporte y registros por tipo cacheados quedan obsoletos
+            invalidar_namespaces(NS_REPORTE, NS_REGISTROS_TIPO)
+
             # Respuesta exitosa
             return Response(
                 {
@@ -1845,7 +1878,29 @@ class ListarTrabajadoresCorreoView(APIView):
 
         Parámetros query:
         - page: número de página (default 1)
+        - cursor: paginación por cursor (vacío para la primera página);
+          reemplaza a page, con total=1 agrega total_aproximado. total_trabajadores
+          solo viene en la primera página
         """
+        search = request.query_params.get('search', '').strip()
+
+        # Cache por lote (namespace versionado) + paginación + búsqueda
+        if usa_cursor(request):
+            paginacion = parametros_cursor(request)
+        else:
+            paginacion = {
+                'page': request.query_params.get('page', '1'),
+                'size': request.query_params.get('page_size', '25'),
+            }
+        cache_key = clave_listado(
+            namespace_lote(correo_id), 'trabajadores_correo',
+            search=search, **paginacion
+        )
+
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return Response(cached, status=status.HTTP_200_OK, headers={'X-Cache': 'HIT'})
+
         try:
             correo = CorreoExamenEnviado.objects.get(id=correo_id)
         except CorreoExamenEnviado.DoesNotExist:
@@ -1855,8 +1910,6 @@ class ListarTrabajadoresCorreoView(APIView):
             )
 
         # OPTIMIZADO: Prefetch de exámenes para evitar N+1 queries en serialización
-
-        search = request.query_params.get('search', '').strip()
         trabajadores_qs = RegistroExamenes.objects.filter(
             correo_lote=correo
         ).select_related('empresa', 'cargo').prefetch_related(
@@ -1875,14 +1928,24 @@ class ListarTrabajadoresCorreoView(APIView):
             )
         trabajadores = trabajadores_qs
 
-        # Cache por correo_id + paginación
-        page = request.query_params.get('page', '1')
-        page_size = request.query_params.get('page_size', '25')
-        cache_key = f"trabajadores_correo_v2={correo_id}_page={page}_size={page_size}"
-
-        cached = cache.get(cache_key)
-        if cached is not None:
-            return Response(cached, status=status.HTTP_200_OK, headers={'X-Cache': 'HIT'})
+        if usa_cursor(request):
+            # Keyset sobre (-fecha_registro, id): cualquier página cuesta lo mismo
+            try:
+                pagina, data = paginar_request(
+                    request, trabajadores, ('-fecha_registro', 'id'), defecto=25, maximo=100
+                )
+            except CursorInvalido as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            data = {
+                'results': [self._serializar_trabajador(t) for t in pagina],
+                **data,
+                # El total solo en la primera página: las siguientes no repiten el COUNT
+                **self._metadata_correo(
+                    correo, None if request.query_params.get('cursor') else trabajadores.count()
+                ),
+            }
+            cache.set(cache_key, data, timeout=ttl_listados_examenes())
+            return Response(data, status=status.HTTP_200_OK, headers={'X-Cache': 'MISS'})
 
         # Paginar resultados
         paginator = self.pagination_class()
@@ -1895,17 +1958,9 @@ class ListarTrabajadoresCorreoView(APIView):
             
             paginated_response = paginator.get_paginated_response(results)
             # Agregar metadata del correo
-            paginated_response.data.update({
-                "correo_id": correo.id,
-                "uuid_correo": getattr(correo, 'uuid_correo', None),
-                "asunto": correo.asunto,
-                "tipo_examen_lote": correo.tipo_examen,
-                "fecha_envio": getattr(correo, 'fecha_envio', None),
-                "total_trabajadores": trabajadores.count(),
-                "tipos_examen_disponibles": TIPOS_EXAMEN_VALIDOS
-            })
+            paginated_response.data.update(self._metadata_correo(correo, paginator.page.paginator.count))
             paginated_response['X-Cache'] = 'MISS'
-            cache.set(cache_key, paginated_response.data, timeout=300)
+            cache.set(cache_key, paginated_response.data, timeout=ttl_listados_examenes())
             return paginated_response
 
         # Fallback sin paginación (estructura equivalente)
@@ -1915,16 +1970,27 @@ class ListarTrabajadoresCorreoView(APIView):
             "next": None,
             "previous": None,
             "results": results,
+            **self._metadata_correo(correo, len(results)),
+        }
+        cache.set(cache_key, data, timeout=ttl_listados_examenes())
+        return Response(data, status=status.HTTP_200_OK, headers={'X-Cache': 'MISS'})
+
+    def _metadata_correo(self, correo, total=None):
+        """
+        Datos del lote que acompañan cada página de trabajadores. `total` ya
+        calculado por la paginación; None lo omite (páginas de cursor siguientes).
+        """
+        data = {
             "correo_id": correo.id,
             "uuid_correo": getattr(correo, 'uuid_correo', None),
             "asunto": correo.asunto,
             "tipo_examen_lote": correo.tipo_examen,
             "fecha_envio": getattr(correo, 'fecha_envio', None),
-            "total_trabajadores": trabajadores.count(),
             "tipos_examen_disponibles": TIPOS_EXAMEN_VALIDOS
         }
-        cache.set(cache_key, data, timeout=300)
-        return Response(data, status=status.HTTP_200_OK, headers={'X-Cache': 'MISS'})
+        if total is not None:
+            data["total_trabajadores"] = total
+        return data
 
 
 class ListarRegistrosPorTipoExamenView(APIView):
@@ -1949,7 +2015,7 @@ class ListarRegistrosPorTipoExamenView(APIView):
             )
 
         # Intentar obtener de cache
-        cache_key = f"registros_tipo_examen_{tipo_examen}"
+        cache_key = clave_listado(NS_REGISTROS_TIPO, 'registros_tipo_examen', tipo=tipo_examen)
         cached = cache.get(cache_key)
         if cached is not None:
             return Response(cached, status=status.HTTP_200_OK, headers={'X-Cache': 'HIT'})
@@ -2007,8 +2073,8 @@ class ListarRegistrosPorTipoExamenView(APIView):
             'registros': resultados
         }
         
-        # Guardar en cache (5 minutos)
-        cache.set(cache_key, response_data, timeout=300)
+        # Guardar en cache (se invalida por namespace al cambiar estados o crear lotes)
+        cache.set(cache_key, response_data, timeout=ttl_listados_examenes())
 
         return Response(response_data, status=status.HTTP_200_OK, headers={'X-Cache': 'MISS'})
 
@@ -2027,6 +2093,7 @@ class ActualizarEstadoExamenesMasivoView(APIView):
         actualizados = []
         no_encontrados = []
         cambios = []
+        lotes = set()
         for tid in trabajador_ids:
             try:
                 reg = RegistroExamenes.objects.get(id=tid)
@@ -2039,16 +2106,15 @@ class ActualizarEstadoExamenesMasivoView(APIView):
                 actualizados.append(tid)
                 cambios.append({'id': tid, 'de': estado_anterior, 'a': reg.estado_trabajador})
 
-                # Invalidar cache de listados del correo para reflejar el cambio
-                try:
-                    correo_id = reg.correo_lote.id
-                    for sz in (10, 25, 50, 100):
-                        cache.delete(f"trabajadores_correo_v2={correo_id}_page=1_size={sz}")
-                except Exception:
-                    pass
+                if reg.correo_lote_id:
+                    lotes.add(reg.correo_lote_id)
             except RegistroExamenes.DoesNotExist:
                 no_encontrados.append(tid)
 
+        # Invalidar todas las páginas (cualquier tamaño/búsqueda) de los lotes afectados
+        if actualizados:
+            invalidar_namespaces(NS_REGISTROS_TIPO, *[namespace_lote(correo_id) for correo_id in lotes])
+
         return Response({
             'actualizados': actualizados,
             'no_encontrados': no_encontrados,
@@ -17,12 +17,11 @@ django.setup()
 from usuarios.models import (
     Colaboradores,
     Usuarios,
-    Cargo,
     Niveles,
     Regional
 )
 
-from analitica.models import Centroop
+from analitica.utils import buscar_en_catalogo, normalizar_nombre, obtener_catalogo_organizacion
 
 
 # ========================
@@ -40,6 +39,14 @@ def get_valor(fila, *columnas):
     return None
 
 
+def a_entero(valor):
+    """Convierte '12' o '12.0' (celdas numéricas de Excel) a int; None si no es un número"""
+    try:
+        return int(float(valor))
+    except (TypeError, ValueError):
+        return None
+
+
 def separar_nombre_apellido(nombre_completo):
     """
     Reglas actualizadas:
@@ -121,6 +128,12 @@ def cargar_colaboradores_desde_excel():
     # FKs fijas
     regional = Regional.objects.get(idregional=1)
 
+    # Catálogos precargados: las filas se resuelven en memoria, sin queries por fila
+    catalogo = obtener_catalogo_organizacion()
+    niveles = {}
+    for nivel in Niveles.objects.order_by('idnivel'):
+        niveles.setdefault(normalizar_nombre(nivel.nombrenivel), nivel)
+
     exitosos = 0
     errores = 0
     log_errores = []
@@ -158,17 +171,17 @@ def cargar_colaboradores_desde_excel():
             usuario = cedula
 
 
-            # Buscar nivel por nombre exacto en columna JERARQUIA
+            # Buscar nivel por nombre (sin distinguir tildes ni mayúsculas) en columna JERARQUIA
             nombre_nivel = get_valor(fila, "jerarquia")
-            nivel = Niveles.objects.filter(nombrenivel__iexact=nombre_nivel).first()
+            nivel = niveles.get(normalizar_nombre(nombre_nivel))
             if not nivel:
                 log_errores.append(f"Fila {fila_num}: Nivel '{nombre_nivel}' no encontrado")
                 errores += 1
                 continue
 
-            # Buscar cargo por nombre exacto
+            # Buscar cargo por nombre en el catálogo de organización
             nombre_cargo = get_valor(fila, "desc_cargo")
-            cargo = Cargo.objects.filter(nombrecargo__iexact=nombre_cargo).first()
+            cargo = buscar_en_catalogo(catalogo, 'cargos', nombre_cargo)
             if not cargo:
                 log_errores.append(f"Fila {fila_num}: Cargo '{nombre_cargo}' no encontrado")
                 errores += 1
@@ -181,22 +194,21 @@ def cargar_colaboradores_desde_excel():
             nombre_centro_op = get_valor(fila, "desc_co")
 
             # Buscar la unidad por nombre y empresa
-            from analitica.models import Epresa, Unidadnegocio, Proyecto, Centroop
-            unidad = Unidadnegocio.objects.filter(nombreunidad__iexact=nombre_unidad, id_empresa__idempresa=empresa_id).first()
+            unidad = buscar_en_catalogo(catalogo, 'unidades', nombre_unidad, a_entero(empresa_id))
             if not unidad:
                 log_errores.append(f"Fila {fila_num}: Unidad '{nombre_unidad}' no encontrada para empresa {empresa_id}")
                 errores += 1
                 continue
 
             # Buscar el proyecto por nombre y unidad
-            proyecto = Proyecto.objects.filter(nombreproyecto__iexact=nombre_proyecto, id_unidad=unidad.idunidad).first()
+            proyecto = buscar_en_catalogo(catalogo, 'proyectos', nombre_proyecto, unidad.idunidad)
             if not proyecto:
                 log_errores.append(f"Fila {fila_num}: Proyecto '{nombre_proyecto}' no encontrado para unidad {nombre_unidad}")
                 errores += 1
                 continue
 
             # Buscar el centro de operación por nombre y proyecto
-            centro_op = Centroop.objects.filter(nombrecentrop__iexact=nombre_centro_op, id_proyecto=proyecto.idproyecto).first()
+            centro_op = buscar_en_catalogo(catalogo, 'centros', nombre_centro_op, proyecto.idproyecto)
             if not centro_op:
                 log_errores.append(f"Fila {fila_num}: Centro de operación '{nombre_centro_op}' no encontrado para proyecto {nombre_proyecto}")
                 errores += 1
@@ -1,9 +1,19 @@
 from rest_framework import viewsets, permissions
 from .models import Colaboradores
 from .serializers import usuarioSerialaizer
+from .utils import invalidar_usuario_autenticado
 
 
 class UsuariosViewSet(viewsets.ModelViewSet):
     queryset = Colaboradores.objects.all()
     serializer_class = usuarioSerialaizer
     permission_classes = [permissions.AllowAny]
+
+    def perform_update(self, serializer):
+        colaborador = serializer.save()
+        invalidar_usuario_autenticado(colaboradores_ids=[colaborador.pk])
+
+    def perform_destroy(self, instance):
+        # Los usuarios se buscan antes de borrar el colaborador
+        invalidar_usuario_autenticado(colaboradores_ids=[instance.pk])
+        instance.delete()
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from usuarios.models import Colaboradores, Cargo, Niveles, Regional
 from analitica.models import Unidadnegocio
 from capacitaciones.models import progresoCapacitaciones
+from core.campos import RepresentacionParcialMixin
 
 
 class ColaboradorSerializer(serializers.ModelSerializer):
@@ -69,7 +70,7 @@ class CapacitacionMiniFromProgresoSerializer(serializers.ModelSerializer):
         fields = ['id', 'titulo']
 
 
-class ColaboradorListadoSerializer(serializers.ModelSerializer):
+class ColaboradorListadoSerializer(RepresentacionParcialMixin, serializers.ModelSerializer):
     id_colaborador = serializers.IntegerField(source='idcolaborador', read_only=True)
     cc_colaborador = serializers.CharField(source='cccolaborador')
     nombre_colaborador = serializers.CharField(source='nombrecolaborador')
@@ -95,6 +96,13 @@ class ColaboradorListadoSerializer(serializers.ModelSerializer):
             'estado_colaborador',
             'capacitaciones_completadas',
         ]
+        campos_resumen = [
+            'id_colaborador',
+            'cc_colaborador',
+            'nombre_colaborador',
+            'apellido_colaborador',
+            'estado_colaborador',
+        ]
 
     def get_nombre_centroOP(self, obj):
         # Según requerimiento, devolver "eliminar"
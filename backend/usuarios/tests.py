@@ -20,7 +20,8 @@ Para ejecutar un test específico:
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.cache import cache
 from django.db.models import Count, Q
 from django.contrib.auth import get_user_model
 
@@ -307,3 +308,79 @@ class TestPerfilOptimizaciones(TestCase):
         self.assertEqual(colaborador.centroOP.id_proyecto.unidad.nombre_unidad, "Test")
         self.assertEqual(colaborador.centroOP.id_proyecto.unidad.empresa.nombre_empresa, "Test")
         self.assertEqual(colaborador.cargo_colaborador.nombrecargo, "Test")
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestUsuarioAutenticado(TestCase):
+    """Tests de la carga del usuario autenticado con su cadena organizacional"""
+
+    def setUp(self):
+        cache.clear()
+        empresa = Epresa.objects.create(nitempresa='1', nombre_empresa='Test', estadoempresa=1)
+        unidad = Unidadnegocio.objects.create(
+            nombreunidad='Test', descripcionunidad='d', estadounidad=1, id_empresa=empresa
+        )
+        proyecto = Proyecto.objects.create(nombreproyecto='Test', estadoproyecto=1, id_unidad=unidad)
+        centro = Centroop.objects.create(nombrecentrop='Test', estadocentrop=1, id_proyecto=proyecto)
+        self.colaborador = Colaboradores.objects.create(
+            cccolaborador='123', nombrecolaborador='Test', apellidocolaborador='User',
+            centroop=centro, cargocolaborador=Cargo.objects.create(nombrecargo='Test')
+        )
+        self.usuario = Usuarios.objects.create(
+            usuario='test', password='x', idcolaboradoru=self.colaborador, tipousuario=0
+        )
+
+    def test_una_query_y_cache_por_token(self):
+        """Usuario + cadena en una query; el mismo token no vuelve a consultar la BD"""
+        from usuarios.utils import invalidar_usuario_autenticado, obtener_usuario_autenticado
+
+        with self.assertNumQueries(1):
+            usuario = obtener_usuario_autenticado(self.usuario.id, 'jti-1')
+            empresa = usuario.idcolaboradoru.centroop.id_proyecto.id_unidad.id_empresa
+            self.assertEqual(empresa.nombre_empresa, 'Test')
+            self.assertEqual(usuario.idcolaboradoru.cargocolaborador.nombrecargo, 'Test')
+
+        with self.assertNumQueries(0):
+            otra = obtener_usuario_autenticado(self.usuario.id, 'jti-1')
+            self.assertEqual(otra.idcolaboradoru.centroop.nombrecentrop, 'Test')
+        # Cada request recibe su propia copia
+        self.assertIsNot(otra, obtener_usuario_autenticado(self.usuario.id, 'jti-1'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidar_usuario_autenticado(colaboradores_ids=[self.colaborador.idcolaborador])
+        with self.assertNumQueries(1):
+            obtener_usuario_autenticado(self.usuario.id, 'jti-1')
+
+    def test_edicion_colaborador_visible_en_siguiente_request(self):
+        """Editar el colaborador invalida el usuario cacheado de sus tokens"""
+        from usuarios.utils import invalidar_usuario_autenticado, obtener_usuario_autenticado
+
+        obtener_usuario_autenticado(self.usuario.id, 'jti-1')
+        with self.captureOnCommitCallbacks(execute=True):
+            Colaboradores.objects.filter(pk=self.colaborador.pk).update(nombrecolaborador='Editado')
+            invalidar_usuario_autenticado(colaboradores_ids=[self.colaborador.pk])
+            # Hasta confirmar la transacción se sigue sirviendo la entrada anterior
+            self.assertEqual(
+                obtener_usuario_autenticado(self.usuario.id, 'jti-1').idcolaboradoru.nombrecolaborador,
+                'Test',
+            )
+
+        usuario = obtener_usuario_autenticado(self.usuario.id, 'jti-1')
+        self.assertEqual(usuario.idcolaboradoru.nombrecolaborador, 'Editado')
+
+    def test_edicion_organizacion_visible_en_siguiente_request(self):
+        """Editar la cadena organizacional invalida el usuario cacheado de todos"""
+        from analitica.utils import invalidar_catalogo_organizacion
+        from usuarios.utils import obtener_usuario_autenticado
+
+        obtener_usuario_autenticado(self.usuario.id, 'jti-1')
+        centro = self.colaborador.centroop
+        with self.captureOnCommitCallbacks(execute=True):
+            Centroop.objects.filter(pk=centro.pk).update(nombrecentrop='Renombrado')
+            Epresa.objects.filter(pk=centro.id_proyecto.id_unidad.id_empresa_id).update(nombre_empresa='Nueva')
+            invalidar_catalogo_organizacion()
+
+        with self.assertNumQueries(1):
+            colaborador = obtener_usuario_autenticado(self.usuario.id, 'jti-1').idcolaboradoru
+        self.assertEqual(colaborador.centroop.nombrecentrop, 'Renombrado')
+        self.assertEqual(colaborador.centroop.id_proyecto.id_unidad.id_empresa.nombre_empresa, 'Nueva')
@@ -0,0 +1,146 @@
+import pickle
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Colaboradores, Usuarios
+
+
+# ==================== USUARIO AUTENTICADO ====================
+# JWTColaboradorAuthentication (auth/authentication.py) carga el usuario con su
+# colaborador y toda la cadena organizacional en una sola query, y la guarda en
+# cache por token durante AUTH_USUARIO_CACHE_TTL segundos. Así request.user,
+# request.user.idcolaboradoru y sus relaciones no vuelven a tocar la BD en el
+# resto del request (vistas y permisos).
+#
+# La entrada se guarda pickleada: cada request obtiene su propia copia y puede
+# modificarla sin afectar a otros requests del mismo proceso (el L1 del cache
+# comparte los valores por referencia).
+#
+# Cada entrada guarda la versión del usuario y la de la organización: editar el
+# usuario o su colaborador renueva la primera (invalidar_usuario_autenticado) y
+# editar empresas, unidades, proyectos o centros renueva la segunda para todos
+# (invalidar_usuarios_organizacion), así el siguiente request ya ve el cambio.
+USUARIO_AUTENTICADO_PREFIX = 'auth_usuario'
+USUARIO_AUTENTICADO_ORGANIZACION = f'{USUARIO_AUTENTICADO_PREFIX}:organizacion'
+RELACIONES_COLABORADOR = (
+    'centroop__id_proyecto__id_unidad__id_empresa',
+    'cargocolaborador',
+    'nivelcolaborador',
+    'regionalcolab',
+)
+
+
+def _clave_version_usuario(usuario_id):
+    return f'{USUARIO_AUTENTICADO_PREFIX}:{usuario_id}:version'
+
+
+def _clave_usuario(usuario_id, token_id):
+    return f'{USUARIO_AUTENTICADO_PREFIX}:{usuario_id}:{token_id}'
+
+
+def _ttl_usuario_autenticado():
+    return getattr(settings, 'AUTH_USUARIO_CACHE_TTL', 60)
+
+
+def cargar_usuario_con_colaborador(usuario_id, con_clave=False):
+    """Usuario + colaborador + centro→proyecto→unidad→empresa, cargo, nivel y regional (1 query)"""
+    usuarios = Usuarios.objects.select_related(
+        *(f'idcolaboradoru__{relacion}' for relacion in RELACIONES_COLABORADOR)
+    )
+    if not con_clave:
+        # El hash de la contraseña no viaja al cache
+        usuarios = usuarios.defer('password')
+    return usuarios.filter(pk=usuario_id).first()
+
+
+def obtener_usuario_autenticado(usuario_id, token_id=None, con_clave=False):
+    """
+    Usuario autenticado con su cadena organizacional precargada, o None si no existe.
+    Con `token_id` (jti del JWT) se reutiliza entre requests del mismo token
+    hasta AUTH_USUARIO_CACHE_TTL segundos o hasta invalidar_usuario_autenticado.
+    """
+    ttl = _ttl_usuario_autenticado()
+    if not token_id or not ttl:
+        return cargar_usuario_con_colaborador(usuario_id, con_clave)
+
+    clave = _clave_usuario(usuario_id, token_id)
+    clave_version = _clave_version_usuario(usuario_id)
+    valores = cache.get_many([clave, clave_version, USUARIO_AUTENTICADO_ORGANIZACION])
+    version = valores.get(clave_version)
+    organizacion = valores.get(USUARIO_AUTENTICADO_ORGANIZACION)
+    entrada = valores.get(clave)
+    if (
+        version is not None and organizacion is not None and isinstance(entrada, dict)
+        and entrada.get('version') == version and entrada.get('organizacion') == organizacion
+    ):
+        return pickle.loads(entrada['usuario'])
+
+    if version is None:
+        cache.add(clave_version, uuid.uuid4().hex, None)
+        version = cache.get(clave_version)
+    if organizacion is None:
+        cache.add(USUARIO_AUTENTICADO_ORGANIZACION, uuid.uuid4().hex, None)
+        organizacion = cache.get(USUARIO_AUTENTICADO_ORGANIZACION)
+
+    usuario = cargar_usuario_con_colaborador(usuario_id, con_clave)
+    if usuario is not None:
+        cache.set(clave, {
+            'version': version,
+            'organizacion': organizacion,
+            'usuario': pickle.dumps(usuario),
+        }, ttl)
+    return usuario
+
+
+def invalidar_usuario_autenticado(usuarios_ids=None, colaboradores_ids=None):
+    """
+    Descarta el usuario cacheado de todos los tokens de esos usuarios (o de los
+    usuarios de esos colaboradores) tras editar sus datos. Se publica al
+    confirmar la transacción en curso, para no volver a cachear la fila vieja.
+    """
+    ids = set(usuarios_ids or ())
+    if colaboradores_ids:
+        ids.update(Usuarios.objects.filter(
+            idcolaboradoru__in=list(colaboradores_ids)
+        ).values_list('id', flat=True))
+    if ids:
+        transaction.on_commit(lambda: cache.set_many(
+            {_clave_version_usuario(uid): uuid.uuid4().hex for uid in ids}, None
+        ))
+
+
+def invalidar_usuarios_organizacion():
+    """
+    Descarta los usuarios cacheados de todos los tokens tras editar la cadena
+    organizacional (empresa, unidad, proyecto o centro de operación).
+    """
+    transaction.on_commit(lambda: cache.set(USUARIO_AUTENTICADO_ORGANIZACION, uuid.uuid4().hex, None))
+
+
+def colaborador_actual(request):
+    """
+    Colaborador del usuario autenticado con su cadena organizacional, o None.
+    Con JWTColaboradorAuthentication ya viene precargado (sin queries); con otras
+    autenticaciones se carga una sola vez por request.
+    """
+    usuario = request.user
+    if not getattr(usuario, 'is_authenticated', False):
+        return None
+    colaborador = getattr(usuario, 'idcolaboradoru', None)
+    if not isinstance(colaborador, Colaboradores) or all(
+        getattr(Colaboradores, relacion.split('__')[0]).is_cached(colaborador)
+        for relacion in RELACIONES_COLABORADOR
+    ):
+        return colaborador
+
+    precargado = Colaboradores.objects.select_related(*RELACIONES_COLABORADOR).filter(
+        idcolaborador=colaborador.idcolaborador
+    ).first()
+    if precargado is not None:
+        # Memoizar en el usuario del request: los siguientes accesos no consultan la BD
+        usuario.idcolaboradoru = precargado
+        return precargado
+    return colaborador
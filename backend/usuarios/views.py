@@ -8,11 +8,14 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from usuarios.permissions import IsSuperAdmin, IsUsuarioEspecial
 from usuarios.models import Colaboradores, Usuarios, Cargo, Niveles, Regional
-from capacitaciones.models import Capacitaciones, progresoCapacitaciones, Modulos, Lecciones, progresolecciones
+from capacitaciones.models import Capacitaciones, progresoCapacitaciones, Modulos, Lecciones
 from capacitaciones.serializers import CapacitacionProgresoSerializer
+from capacitaciones.utils import capacitacion_con_progreso, contexto_progreso_colaborador, obtener_completados
+from usuarios.utils import colaborador_actual
+from core.campos import CamposInvalidos, campos_solicitados, pide_campo
+from core.paginacion import CursorInvalido, paginar_request, usa_cursor
 from usuarios.serializers import ColaboradorListadoSerializer, cargosSerializer, nivelesSerializer, regionalesSerializer
-from django.db.models import Count, Q, Prefetch, OuterRef, Subquery, IntegerField
-from django.db.models.functions import Coalesce
+from django.db.models import Count, Q
 
 
 class Perfil(APIView):
@@ -20,9 +23,10 @@ class Perfil(APIView):
     Vista de perfil del colaborador con sus capacitaciones.
     
     Optimización:
-    - Usa annotate() para calcular totales de lecciones en DB
+    - Lecciones completadas / total desde completado_capacitacion (una fila por inscripción)
     - Elimina queries N+1 en el loop de capacitaciones
-    - Precarga relaciones con select_related
+    - Precarga relaciones con select_related (el propio perfil reutiliza el
+      colaborador que ya cargó la autenticación)
     """
     permission_classes = [IsAuthenticated]
 
@@ -36,15 +40,8 @@ class Perfil(APIView):
                 'cargocolaborador'
             ).filter(idcolaborador=id).first()
         else:
-            colaborador = request.user.idcolaboradoru
-            if colaborador:
-                # Recargar con relaciones
-                colaborador = Colaboradores.objects.select_related(
-                    'centroop__id_proyecto__id_unidad__id_empresa',
-                    'nivelcolaborador',
-                    'regionalcolab',
-                    'cargocolaborador'
-                ).filter(idcolaborador=colaborador.idcolaborador).first()
+            # Ya precargado con sus relaciones por la autenticación
+            colaborador = colaborador_actual(request)
 
         if not colaborador:
             return Response(
@@ -52,34 +49,20 @@ class Perfil(APIView):
                 status=400
             )
 
-        # Subquery para contar lecciones completadas por capacitación
-        lecciones_completadas_subq = progresolecciones.objects.filter(
-            idcolaborador=colaborador,
-            idleccion__idmodulo__idcapacitacion=OuterRef('capacitacion_id'),
-            completada=1
-        ).values('idleccion__idmodulo__idcapacitacion').annotate(
-            count=Count('id_progreso')
-        ).values('count')
-
-        progresos = (
+        progresos = list(
             progresoCapacitaciones.objects
             .filter(colaborador=colaborador)
             .exclude(capacitacion__estado=3)
             .select_related('capacitacion')
-            .annotate(
-                total_lecciones=Count(
-                    'capacitacion__modulos__lecciones',
-                    distinct=True
-                ),
-                lecciones_completadas=Coalesce(
-                    Subquery(lecciones_completadas_subq, output_field=IntegerField()),
-                    0
-                )
-            )
         )
 
-        capacitaciones_totales = progresos.count()
-        capacitaciones_completadas = progresos.filter(completada=1).count()
+        # Lecciones completadas / total desde una fila compacta por inscripción
+        completados = obtener_completados(
+            colaborador.idcolaborador, [prog.capacitacion_id for prog in progresos]
+        )
+
+        capacitaciones_totales = len(progresos)
+        capacitaciones_completadas = sum(1 for prog in progresos if prog.completada == 1)
 
         # Construir datos de capacitaciones sin queries adicionales
         capacitaciones_data = [
@@ -88,8 +71,8 @@ class Perfil(APIView):
                 "nombre_capacitacion": prog.capacitacion.titulo,
                 "completada": bool(prog.completada),
                 "progreso": float(prog.progreso) if prog.progreso is not None else 0.0,
-                "lecciones_completadas": prog.lecciones_completadas,
-                "total_lecciones": prog.total_lecciones,
+                "lecciones_completadas": completados[prog.capacitacion_id][0],
+                "total_lecciones": completados[prog.capacitacion_id][1],
                 "fecha_completacion": prog.fecha_completada.isoformat() if getattr(prog, 'fecha_completada', None) else None
             }
             for prog in progresos
@@ -248,9 +231,23 @@ class RegisterTemporal(APIView):
             return JsonResponse({'error': str(e)}, status=500)
 
 class ListaUsuarios(APIView):
+    """
+    Listado de colaboradores con sus capacitaciones activas.
+
+    - ?page=&page_size=: paginación por número de página (count exacto).
+    - ?cursor=&page_size=: paginación por cursor (`next_cursor` de la página
+      anterior, vacío para la primera); con total=1 agrega total_aproximado.
+    - ?view=summary / ?fields=: representación parcial; sin cargo no hay JOIN
+      y sin los conteos de capacitaciones no se agregan.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
+        try:
+            campos = campos_solicitados(request, ColaboradorListadoSerializer)
+        except CamposInvalidos as e:
+            return Response({'error': str(e)}, status=400)
+
         try:
             page = int(request.GET.get('page', 1))
             page_size = int(request.GET.get('page_size', 10))
@@ -261,46 +258,26 @@ class ListaUsuarios(APIView):
 
             search = request.GET.get('search', '').strip()
 
-            base_qs = (
-                Colaboradores.objects
-                .select_related('cargocolaborador')
-                .annotate(
-                    total_capacitaciones=Count(
-                        'progresocapacitaciones',
-                        filter=Q(progresocapacitaciones__capacitacion__estado__in=[0, 1]),
-                        distinct=True
-                    ),
-                    completadas=Count(
-                        'progresocapacitaciones',
-                        filter=Q(
-                            progresocapacitaciones__capacitacion__estado__in=[0, 1],
-                            progresocapacitaciones__completada=1
-                        ),
-                        distinct=True
-                    ),
-                )
-                .prefetch_related(
-                    Prefetch(
-                        'progresocapacitaciones_set',
-                        queryset=(
-                            progresoCapacitaciones.objects
-                            .filter(capacitacion__estado__in=[0, 1])
-                            .select_related('capacitacion')
-                        ),
-                        to_attr='progresos_activos'
-                    ),
-                    Prefetch(
-                        'progresocapacitaciones_set',
-                        queryset=(
-                            progresoCapacitaciones.objects
-                            .filter(capacitacion__estado__in=[0, 1], completada=1)
-                            .select_related('capacitacion')
-                        ),
-                        to_attr='progresos_activos_completados'
+            # Solo el JOIN y los conteos que piden los campos; el serializer no
+            # usa las inscripciones en sí, así que no se prefetchean
+            base_qs = Colaboradores.objects.order_by('idcolaborador')
+            if pide_campo(campos, 'nombrecargo'):
+                base_qs = base_qs.select_related('cargocolaborador')
+            if pide_campo(campos, 'capacitaciones_totales'):
+                base_qs = base_qs.annotate(total_capacitaciones=Count(
+                    'progresocapacitaciones',
+                    filter=Q(progresocapacitaciones__capacitacion__estado__in=[0, 1]),
+                    distinct=True
+                ))
+            if pide_campo(campos, 'capacitaciones_completadas'):
+                base_qs = base_qs.annotate(completadas=Count(
+                    'progresocapacitaciones',
+                    filter=Q(
+                        progresocapacitaciones__capacitacion__estado__in=[0, 1],
+                        progresocapacitaciones__completada=1
                     ),
-                )
-                .order_by('idcolaborador')
-            )
+                    distinct=True
+                ))
 
             if search:
                 base_qs = base_qs.filter(
@@ -309,12 +286,20 @@ class ListaUsuarios(APIView):
                     Q(cccolaborador__icontains=search)
                 )
 
+            if usa_cursor(request):
+                # Keyset sobre idcolaborador: cualquier página cuesta lo mismo y sin COUNT
+                try:
+                    items, datos = paginar_request(request, base_qs, ('idcolaborador',), defecto=10, maximo=100)
+                except CursorInvalido as e:
+                    return Response({'error': str(e)}, status=400)
+                return Response({'results': ColaboradorListadoSerializer(items, many=True, campos=campos).data, **datos})
+
             total = base_qs.count()
             start = (page - 1) * page_size
             end = start + page_size
             items = list(base_qs[start:end])
 
-            results = ColaboradorListadoSerializer(items, many=True).data
+            results = ColaboradorListadoSerializer(items, many=True, campos=campos).data
 
             response = {
                 'count': total,
@@ -339,14 +324,15 @@ class PerfilCapacitacionView(APIView):
         if not colaborador:
             return Response({"error": "Colaborador no encontrado"}, status=404)
 
-        capacitacion = Capacitaciones.objects.filter(pk=capacitacion_id).first()
-        if not capacitacion:
+        try:
+            capacitacion = capacitacion_con_progreso(capacitacion_id, colaborador)
+        except Capacitaciones.DoesNotExist:
             return Response({"error": "Capacitación no encontrada"}, status=404)
 
         # Serializar detalle completo de la capacitación con progreso y estructura
         serializer = CapacitacionProgresoSerializer(
             capacitacion,
-            context={"colaborador": colaborador}
+            context=contexto_progreso_colaborador(colaborador, [capacitacion.id])
         )
         return Response(serializer.data)
     